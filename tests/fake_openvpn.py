@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the openvpn binary in tests. Reads its behaviour from "fake-*" lines of the --config file:
+
+    fake-delay SECONDS    log "Initialization Sequence Completed" after this long (default 0.1)
+    fake-fail SECONDS     log a fatal error and exit with 1 after this long instead
+    fake-states           log the usual handshake lines (TLS, peer, push, tun) before connecting
+    fake-spam LINES       write this many long lines first (to fill unread pipes)
+    fake-ignore-term      ignore SIGTERM, so only SIGKILL stops it
+    fake-pidfile PATH     append the process id to PATH
+    fake-renegotiate      once connected, log a TLS renegotiation (handshake lines, no restart)
+
+SIGUSR1 restarts in place, as OpenVPN does. With --management PATH unix it serves a minimal
+management interface (state, bytecount, signal SIGUSR1, hold release) on that Unix socket.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+RENEGOTIATION_LINES = ("TLS: soft reset sec=3600/3600 bytes=0/-1 pkts=0/0", "VERIFY OK: depth=0, CN=server",
+                       "Control Channel: TLSv1.3, cipher TLSv1.3 TLS_AES_256_GCM_SHA384",
+                       "Peer Connection Initiated with [AF_INET]10.0.0.1:1194")
+HANDSHAKE_LINES = ("UDP link remote: [AF_INET]10.0.0.1:1194", "TLS: Initial packet from [AF_INET]10.0.0.1:1194",
+                   "VERIFY OK: depth=0, CN=server", "Peer Connection Initiated with [AF_INET]10.0.0.1:1194",
+                   "PUSH: Received control message: 'PUSH_REPLY,ifconfig 10.8.0.2 255.255.255.0'",
+                   "TUN/TAP device tun0 opened")
+
+connected = threading.Event()
+output_lock = threading.Lock()
+management_clients = []
+
+
+def log(line):
+    with output_lock:
+        print(line, flush=True)
+
+
+def announce(state):
+    for send in list(management_clients):
+        try:
+            send(f">STATE:{int(time.time())},{state},SUCCESS,10.8.0.2,10.0.0.1,,,")
+        except OSError:
+            management_clients.remove(send)
+
+
+def restart():
+    connected.clear()
+    log("SIGUSR1[soft,connection-reset] received, process restarting")
+    announce('RECONNECTING')
+    time.sleep(0.3)
+    connected.set()
+    log("Initialization Sequence Completed")
+    announce('CONNECTED')
+
+
+def serve_management(listener):
+    while True:
+        connection, _ = listener.accept()
+        threading.Thread(target=management_session, args=(connection,), daemon=True).start()
+
+
+def management_session(connection):
+    stream = connection.makefile('rw', newline='')
+    lock = threading.Lock()
+
+    def send(line):
+        with lock:
+            stream.write(line + '\r\n')
+            stream.flush()
+
+    counters = [0, 0]
+
+    def bytecount(interval):
+        while True:
+            counters[0] += 1000 * interval
+            counters[1] += 500 * interval
+            send(f">BYTECOUNT:{counters[0]},{counters[1]}")
+            time.sleep(interval)
+
+    send(">INFO:OpenVPN Management Interface Version 5 -- type 'help' for more info")
+    try:
+        for line in stream:
+            command = line.strip()
+            if command == 'state on':
+                send("SUCCESS: real-time state notification set to ON")
+                management_clients.append(send)
+                announce('CONNECTED' if connected.is_set() else 'WAIT')
+            elif command.startswith('bytecount'):
+                send("SUCCESS: bytecount interval changed")
+                threading.Thread(target=bytecount, args=(int(command.split()[1]),), daemon=True).start()
+            elif command == 'signal SIGUSR1':
+                send("SUCCESS: signal SIGUSR1 thrown")
+                threading.Thread(target=restart, daemon=True).start()
+            elif command == 'hold release':
+                send("SUCCESS: hold release succeeded")
+            else:
+                send("ERROR: unknown command")
+    except OSError:
+        pass
+
+
+def main(args):
+    if '--config' not in args: # --version, --mktun, ...
+        sys.exit(1)
+    options = {}
+    with open(args[args.index('--config') + 1]) as f:
+        for line in f:
+            parts = line.split()
+            if parts and parts[0].startswith('fake-'):
+                options[parts[0]] = parts[1] if len(parts) > 1 else ''
+    if 'fake-pidfile' in options:
+        with open(options['fake-pidfile'], 'a') as f:
+            f.write(f"{os.getpid()}\n")
+    if 'fake-ignore-term' in options:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=restart, daemon=True).start())
+
+    if '--management' in args:
+        i = args.index('--management')
+        if args[i + 2] != 'unix':
+            log("Options error: only --management PATH unix is supported")
+            sys.exit(1)
+        listener = socket.socket(socket.AF_UNIX)
+        listener.bind(args[i + 1])
+        listener.listen()
+        threading.Thread(target=serve_management, args=(listener,), daemon=True).start()
+
+    log("OpenVPN 2.6.0 (fake) x86_64-pc-linux-gnu")
+    for _ in range(int(options.get('fake-spam') or 0)):
+        log("x" * 200)
+    if 'fake-fail' in options:
+        time.sleep(float(options['fake-fail'] or 0.1))
+        log("Exiting due to fatal error")
+        sys.exit(1)
+    if 'fake-states' in options:
+        for line in HANDSHAKE_LINES:
+            log(line)
+            time.sleep(0.02)
+    time.sleep(float(options.get('fake-delay') or 0.1))
+    connected.set()
+    log("Initialization Sequence Completed")
+    announce('CONNECTED')
+    if 'fake-renegotiate' in options:
+        time.sleep(0.1)
+        for line in RENEGOTIATION_LINES:
+            log(line)
+        log("fake renegotiation done")
+    while True:
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,119 @@
+import base64
+import gzip
+import http.server
+import os
+import threading
+
+# Fake openvpn binary (see its docstring for the fake-* config directives it understands).
+FAKE_OPENVPN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_openvpn.py')
+
+HEADER = ("#HostName,IP,Score,Ping,Speed,CountryLong,CountryShort,NumVpnSessions,Uptime,"
+          "TotalUsers,TotalTraffic,LogType,Operator,Message,OpenVPN_ConfigData_Base64")
+
+
+def ovpn_text(ip, port=1194, proto='udp'):
+    return f"client\ndev tun\nproto {proto}\nremote {ip} {port}\ncipher AES-128-CBC\n"
+
+
+def server_row(i, country=('Japan', 'JP'), score=None, ping=10, speed=None, config=None):
+    """
+    One VPNGate list row for a server named vpn<i> at 10.0.0.<i>; config is the ovpn text
+    (or, as bytes, the already encoded column).
+    """
+    ip = f"10.0.0.{i}"
+    config = ovpn_text(ip) if config is None else config
+    encoded = config.decode('ascii') if isinstance(config, bytes) else base64.b64encode(config.encode()).decode()
+    score = 1000 - i if score is None else score
+    speed = 10 ** 7 - i if speed is None else speed
+    return (f"vpn{i},{ip},{score},{ping},{speed},{country[0]},{country[1]},5,1000,10,10,2weeks,"
+            f"Operator {i},,{encoded}")
+
+
+def server_list(rows):
+    """
+    A VPNGate-format list with the given rows (strings from server_row(), or server numbers).
+    """
+    lines = ["*vpn_servers", HEADER] + [row if isinstance(row, str) else server_row(row) for row in rows] + ["*"]
+    return "\r\n".join(lines) + "\r\n"
+
+
+class ListServer:
+    def __init__(self, body='', etag=None):
+        """
+        Local HTTP stand-in for the VPNGate API on 127.0.0.1. Serves body with an ETag (answering
+        a matching If-None-Match with 304). Set statuses to a list of status codes to answer the next
+        requests with (e.g. [503, 503]), and delay to sleep that many seconds before answering.
+        Bodies are gzipped for clients that accept it. Every request's headers are kept in requests,
+        and the client address of each in clients.
+        """
+        self.body = body
+        self.etag = etag
+        self.statuses = []
+        self.delay = 0
+        self.requests = []
+        self.clients = []
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stand_in.requests.append(dict(self.headers))
+                stand_in.clients.append(self.client_address)
+                if stand_in.delay:
+                    threading.Event().wait(stand_in.delay)
+                status = stand_in.statuses.pop(0) if stand_in.statuses else 200
+                if status == 200 and stand_in.etag and self.headers.get('If-None-Match') == stand_in.etag:
+                    status = 304
+                body = stand_in.body.encode('utf-8') if status == 200 else b''
+                gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+                if gzipped:
+                    body = gzip.compress(body)
+                self.send_response(status)
+                if gzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                if stand_in.etag:
+                    self.send_header('ETag', stand_in.etag)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._server.handle_error = lambda request, client_address: None # Clients that timed out and left
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/api/iphone/"
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def write_config(directory, name, *directives):
+    """
+    Writes a config for the fake openvpn (e.g. "fake-delay 0.5") and returns its path.
+    """
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write("client\ndev tun\n" + "".join(line + "\n" for line in directives))
+    return path
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def read_pids(path):
+    try:
+        with open(path) as f:
+            return [int(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,44 @@
+import contextlib
+import io
+import json
+import unittest
+
+from vpn_project.bench import SAMPLE_FIXTURE, main
+from vpn_project.server_record import CONFIG_FIELD, dedupe_servers
+from vpn_project.vpngate_scraper import VPNGateScraper, parse_executor
+
+from .support import server_list, server_row
+
+
+class SampleFixtureTest(unittest.TestCase):
+    def test_sample_parses_like_a_recorded_list(self):
+        with open(SAMPLE_FIXTURE, encoding='utf-8', newline='') as f:
+            servers = VPNGateScraper().parse_server_data(f.read())
+        self.assertEqual(len(servers), 31)
+        self.assertEqual(len(dedupe_servers(servers)), 30) # One IP is listed twice
+        self.assertTrue(all(server.ovpn_config and '<ca>' in server.ovpn_config for server in servers))
+
+    def test_offline_suite_runs_on_the_sample_by_default(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['--repeat', '1'])
+        report = json.loads(output.getvalue()[output.getvalue().index('{'):])
+        self.assertEqual(report['meta']['fixture'], SAMPLE_FIXTURE)
+        self.assertEqual(report['rank']['servers'], 31)
+
+
+class ParallelParseTest(unittest.TestCase):
+    def test_workers_build_the_same_records_as_the_serial_parse(self):
+        rows = [server_row(i) for i in range(1, 200)]
+        rows[5] = server_row(6, config=b'"quoted""config"') # Not verbatim in its line, so sent back whole
+        data = server_list(rows)
+        expected = dedupe_servers(VPNGateScraper().parse_server_data(data))
+        with parse_executor(2) as pool:
+            servers = VPNGateScraper().parse_server_data_parallel(data, 2, 1 << 12, pool)
+        self.assertEqual([(s['HostName'], s[CONFIG_FIELD]) for s in servers],
+                         [(s['HostName'], s[CONFIG_FIELD]) for s in expected])
+        self.assertEqual(servers[5][CONFIG_FIELD], 'quoted"config')
+
+
+if __name__ == '__main__':
+    unittest.main()
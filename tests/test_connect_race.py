@@ -0,0 +1,134 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from vpn_project.async_openvpn_manager import AsyncOpenVPNManager
+from vpn_project.openvpn_log import STATE_CONNECTED
+from vpn_project.openvpn_manager import OpenVPNManager
+
+from .support import FAKE_OPENVPN, pid_alive, read_pids, write_config
+
+
+class ConnectRaceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pidfile = os.path.join(self.tmp.name, 'pids')
+        self.timings = []
+        self.manager = OpenVPNManager(FAKE_OPENVPN, use_sudo=False,
+                                      on_timing=lambda stage, seconds, details: self.timings.append(stage))
+        self.addCleanup(self.cleanup)
+
+    def cleanup(self):
+        if self.manager.process:
+            self.manager.disconnect()
+
+    def config(self, name, *directives):
+        return write_config(self.tmp.name, name, f"fake-pidfile {self.pidfile}", *directives)
+
+    def assert_all_stopped(self, except_pid=None):
+        for pid in read_pids(self.pidfile):
+            if pid != except_pid:
+                self.assertFalse(pid_alive(pid), f"race attempt {pid} is still running")
+
+    def test_fastest_healthy_server_wins_and_losers_are_killed(self):
+        dead = self.config('dead.ovpn', "fake-fail 0.1")
+        slow = self.config('slow.ovpn', "fake-delay 5")
+        fast = self.config('fast.ovpn', "fake-delay 0.1")
+        started = time.monotonic()
+        winner = self.manager.connect_race([dead, slow, fast], stagger=0.3, timeout=10)
+        self.assertEqual(winner, fast)
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(self.manager.state, STATE_CONNECTED)
+        self.assertEqual(len(read_pids(self.pidfile)), 3)
+        self.assert_all_stopped(except_pid=self.manager.process.pid)
+        self.assertIn('connect', self.timings)
+        self.assertIn('connect_failed', self.timings)
+
+    def test_exited_attempt_starts_the_next_one_at_once(self):
+        dead = self.config('dead.ovpn', "fake-fail 0.05")
+        good = self.config('good.ovpn', "fake-delay 0.05")
+        started = time.monotonic()
+        self.assertEqual(self.manager.connect_race([dead, good], stagger=5, timeout=10), good)
+        self.assertLess(time.monotonic() - started, 3) # Did not wait for the stagger
+
+    def test_no_winner_returns_none_and_stops_everything(self):
+        first = self.config('a.ovpn', "fake-fail 0.05")
+        second = self.config('b.ovpn', "fake-delay 30")
+        self.assertIsNone(self.manager.connect_race([first, second, '/nonexistent.ovpn'], stagger=0.1, timeout=1))
+        self.assertIsNone(self.manager.process)
+        self.assert_all_stopped()
+
+    def test_race_refuses_while_connected(self):
+        self.manager.connect(self.config('one.ovpn'))
+        self.assertTrue(self.manager.wait_until_connected(5))
+        self.assertIsNone(self.manager.connect_race([self.config('two.ovpn')]))
+        self.assertEqual(len(read_pids(self.pidfile)), 1)
+
+
+
+class _BlockingStartManager(AsyncOpenVPNManager):
+    # Blocks the event loop after starting the last attempt, so it and the attempt before it
+    # both connect meanwhile and are seen in the same asyncio.wait() batch.
+    async def _start(self, ovpn_file_path):
+        attempt = await super()._start(ovpn_file_path)
+        if ovpn_file_path.endswith('last.ovpn'):
+            time.sleep(0.6)
+        return attempt
+
+
+class AsyncConnectRaceTest(ConnectRaceTest):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close) # Runs after cleanup(), which still needs the loop
+        super().setUp()
+        self.async_manager = AsyncOpenVPNManager(FAKE_OPENVPN, use_sudo=False)
+
+    def cleanup(self):
+        if self.async_manager.tunnel:
+            self.loop.run_until_complete(self.async_manager.disconnect())
+
+    def race(self, manager, paths, **kwargs):
+        return self.loop.run_until_complete(manager.connect_race(paths, **kwargs))
+
+    def test_fastest_healthy_server_wins_and_losers_are_killed(self):
+        dead = self.config('dead.ovpn', "fake-fail 0.1")
+        slow = self.config('slow.ovpn', "fake-delay 5")
+        fast = self.config('fast.ovpn', "fake-delay 0.1")
+        self.assertEqual(self.race(self.async_manager, [dead, slow, fast], stagger=0.3, timeout=10), fast)
+        self.assertEqual(self.async_manager.state, STATE_CONNECTED)
+        self.assertEqual(len(read_pids(self.pidfile)), 3)
+        self.assert_all_stopped(except_pid=self.async_manager.process.pid)
+
+    def test_attempts_connecting_together_leave_one_tunnel(self):
+        self.async_manager = _BlockingStartManager(FAKE_OPENVPN, use_sudo=False)
+        paths = [self.config('first.ovpn', "fake-delay 0.3"), self.config('last.ovpn', "fake-delay 0.05")]
+        self.assertIn(self.race(self.async_manager, paths, stagger=0, timeout=10), paths)
+        self.assertEqual(len(read_pids(self.pidfile)), 2)
+        self.assert_all_stopped(except_pid=self.async_manager.process.pid)
+
+    def test_exited_attempt_starts_the_next_one_at_once(self):
+        dead = self.config('dead.ovpn', "fake-fail 0.05")
+        good = self.config('good.ovpn', "fake-delay 0.05")
+        started = time.monotonic()
+        self.assertEqual(self.race(self.async_manager, [dead, good], stagger=5, timeout=10), good)
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_no_winner_returns_none_and_stops_everything(self):
+        first = self.config('a.ovpn', "fake-fail 0.05")
+        second = self.config('b.ovpn', "fake-delay 30")
+        self.assertIsNone(self.race(self.async_manager, [first, second], stagger=0.1, timeout=1))
+        self.assertIsNone(self.async_manager.tunnel)
+        self.assert_all_stopped()
+
+    def test_race_refuses_while_connected(self):
+        self.assertTrue(self.loop.run_until_complete(self.async_manager.connect(self.config('one.ovpn'))))
+        self.assertTrue(self.loop.run_until_complete(self.async_manager.wait_until_connected(5)))
+        self.assertIsNone(self.race(self.async_manager, [self.config('two.ovpn')]))
+        self.assertEqual(len(read_pids(self.pidfile)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import queue
+import signal
+import tempfile
+import unittest
+
+from vpn_project.failover_supervisor import FailoverSupervisor
+from vpn_project.openvpn_manager import OpenVPNManager
+from vpn_project.ovpn_config import ConfigStore
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import FAKE_OPENVPN, ovpn_text, server_list, server_row
+
+
+def parse(servers):
+    """
+    servers maps a server number to its fake-* directives.
+    """
+    rows = [server_row(i, config=ovpn_text(f"10.0.0.{i}") + "".join(d + "\n" for d in directives))
+            for i, directives in servers.items()]
+    return VPNGateScraper().parse_server_data(server_list(rows))
+
+
+class FailoverSupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.events = queue.Queue()
+        self.catalog = ServerCatalog(parse({1: ["fake-fail 0.05"], 2: [], 3: [], 4: []}))
+        self.manager = OpenVPNManager(FAKE_OPENVPN, use_sudo=False)
+        self.supervisor = FailoverSupervisor(self.manager, self.catalog, race_width=1, health_interval=0.1,
+                                             connect_timeout=5, backoff_initial=0.1, failure_threshold=1,
+                                             config_store=ConfigStore(self.tmp.name),
+                                             on_event=lambda name, details: self.events.put((name, details)))
+        self.addCleanup(self.supervisor.stop)
+
+    def next_event(self, wanted, timeout=10):
+        while True:
+            name, details = self.events.get(timeout=timeout)
+            if name == wanted:
+                self.details = details
+                return details.get('server')
+
+    def test_skips_a_dead_server_and_fails_over_when_the_tunnel_dies(self):
+        self.supervisor.start()
+        self.assertEqual(self.next_event('failed')['HostName'], 'vpn1')
+        self.assertEqual(self.next_event('connected')['HostName'], 'vpn2')
+        self.assertGreater(self.details['time_to_connected'], 0)
+        self.assertTrue(self.manager.connected)
+
+        os.killpg(os.getpgid(self.manager.process.pid), signal.SIGKILL)
+        self.assertEqual(self.next_event('unhealthy')['HostName'], 'vpn2')
+        # vpn1's breaker is open and vpn2 just failed, so the next standby server is used.
+        self.assertEqual(self.next_event('connected')['HostName'], 'vpn3')
+        self.assertIsNotNone(self.supervisor.last_recovery_seconds)
+
+    def test_switches_servers_when_the_current_one_is_delisted(self):
+        self.supervisor.start()
+        self.assertEqual(self.next_event('connected')['HostName'], 'vpn2')
+        self.catalog.update(parse({1: ["fake-fail 0.05"], 3: [], 4: []}))
+        self.assertEqual(self.next_event('vanished')['HostName'], 'vpn2')
+        self.assertEqual(self.next_event('connected')['HostName'], 'vpn3')
+        self.assertEqual([s['HostName'] for s in self.supervisor.standby], ['vpn1', 'vpn3', 'vpn4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+
+from vpn_project.latency_probe import parse_remotes, probe_tcp, probe_udp, rank_by_latency
+from vpn_project.vpn_client import select_server_by_latency
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import ovpn_text, server_list, server_row
+
+
+class UDPResponder:
+    def __init__(self, delay=0.0, reply=True):
+        """
+        Local stand-in for an OpenVPN UDP server: answers each datagram after delay seconds (or never).
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.delay = delay
+        self.reply = reply
+        self.received = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            self.received.append(data)
+            if self.reply:
+                time.sleep(self.delay)
+                self.sock.sendto(b'\x40' + data[1:9], addr)
+
+    def close(self):
+        self.sock.close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LatencyProbeTest(unittest.TestCase):
+    def responder(self, **kwargs):
+        responder = UDPResponder(**kwargs)
+        self.addCleanup(responder.close)
+        return responder
+
+    def test_parse_remotes(self):
+        config = "client\nremote a.example 443 tcp\n;remote b.example 1\nremote c.example\nproto tcp-client\n"
+        self.assertEqual(parse_remotes(config), [('a.example', 443, 'tcp'), ('c.example', 1194, 'tcp')])
+        self.assertEqual(parse_remotes(None), [])
+
+    def test_tcp_probe(self):
+        with socket.socket() as listener:
+            listener.bind(('127.0.0.1', 0))
+            listener.listen()
+            rtt = asyncio.run(probe_tcp('127.0.0.1', listener.getsockname()[1], 1.0))
+        self.assertIsNotNone(rtt)
+        self.assertIsNone(asyncio.run(probe_tcp('127.0.0.1', unused_port(), 1.0)))
+
+    def test_udp_probe_sends_a_hard_reset_and_times_the_reply(self):
+        responder = self.responder()
+        self.assertIsNotNone(asyncio.run(probe_udp('127.0.0.1', responder.port, 1.0)))
+        self.assertEqual(responder.received[0][0] >> 3, 7) # P_CONTROL_HARD_RESET_CLIENT_V2
+        silent = self.responder(reply=False)
+        self.assertIsNone(asyncio.run(probe_udp('127.0.0.1', silent.port, 0.2)))
+
+    def test_rank_by_latency_orders_by_measured_rtt(self):
+        slow, fast, silent = self.responder(delay=0.2), self.responder(), self.responder(reply=False)
+        servers = [{'HostName': name, 'ovpn_config': ovpn_text('127.0.0.1', r.port)}
+                   for name, r in (('slow', slow), ('silent', silent), ('fast', fast))]
+        ranked = rank_by_latency(servers, timeout=0.5, deadline=2.0)
+        self.assertEqual([s['HostName'] for s, _ in ranked], ['fast', 'slow', 'silent'])
+        self.assertIsNone(ranked[2][1])
+        self.assertEqual([s['HostName'] for s, _ in rank_by_latency(servers, timeout=0.5, drop_unreachable=True)],
+                         ['fast', 'slow'])
+
+    def test_deadline_bounds_the_whole_probe(self):
+        silent = self.responder(reply=False)
+        servers = [{'ovpn_config': ovpn_text('127.0.0.1', silent.port)} for _ in range(20)]
+        started = time.monotonic()
+        ranked = rank_by_latency(servers, concurrency=4, timeout=1.0, deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual([rtt for _, rtt in ranked], [None] * 20)
+
+    def test_select_server_by_latency_prefers_the_closest_of_the_top_candidates(self):
+        slow, fast = self.responder(delay=0.2), self.responder()
+        rows = [server_row(1, config=ovpn_text('127.0.0.1', slow.port)),
+                server_row(2, config=ovpn_text('127.0.0.1', fast.port))]
+        servers = VPNGateScraper().parse_server_data(server_list(rows))
+        server, rtt = select_server_by_latency(servers, candidates=2)
+        self.assertEqual(server['HostName'], 'vpn2')
+        self.assertIsNotNone(rtt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from vpn_project.metrics import Counter, Histogram, Metrics, report_timing
+
+
+class TunnelDouble:
+    state = 'CONNECTED'
+
+    def traffic_stats(self):
+        return {'bytes_in': 2048, 'bytes_out': 512, 'rate_in': 100.5, 'rate_out': 0.0}
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('op_seconds', "Op time.", ['kind'], buckets=(1.0, 0.1))
+        for value in (0.05, 0.5, 0.5, 7.0):
+            histogram.observe(value, kind='a')
+        self.assertEqual(histogram.render(), [
+            '# HELP op_seconds Op time.',
+            '# TYPE op_seconds histogram',
+            'op_seconds_bucket{kind="a",le="0.1"} 1',
+            'op_seconds_bucket{kind="a",le="1.0"} 3',
+            'op_seconds_bucket{kind="a",le="+Inf"} 4',
+            'op_seconds_sum{kind="a"} 8.05',
+            'op_seconds_count{kind="a"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('errors_total', "Errors.", ['reason'])
+        counter.inc(reason='bad "quote"\\path\nnext')
+        self.assertEqual(counter.render()[-1], 'errors_total{reason="bad \\"quote\\"\\\\path\\nnext"} 1')
+
+    def test_timing_hook_maps_stages_to_metrics(self):
+        metrics = Metrics()
+        report_timing(metrics.timing_hook, 'fetch', 0.2, result='not_modified')
+        report_timing(metrics.timing_hook, 'parse', 0.01, rows=7, no_config=2, duplicate=1)
+        report_timing(metrics.timing_hook, 'select', 0.001)
+        report_timing(metrics.timing_hook, 'connect', 3.0)
+        report_timing(metrics.timing_hook, 'connect_failed', 10.0)
+        report_timing(metrics.timing_hook, 'reconnect', 1.0)
+        report_timing(metrics.timing_hook, 'unknown_stage', 1.0)
+        lines = metrics.render().splitlines()
+        for line in ('vpn_fetch_duration_seconds_count{result="not_modified"} 1',
+                     'vpn_parse_duration_seconds_count 1',
+                     'vpn_rows_parsed_total 7',
+                     'vpn_rows_skipped_total{reason="duplicate"} 1',
+                     'vpn_rows_skipped_total{reason="no_config"} 2',
+                     'vpn_select_duration_seconds_count 1',
+                     'vpn_time_to_connected_seconds_sum 3.0',
+                     'vpn_time_to_connected_seconds_count 1',
+                     'vpn_connect_attempts_total{result="connected"} 1',
+                     'vpn_connect_attempts_total{result="failed"} 1',
+                     'vpn_reconnects_total 1'):
+            self.assertIn(line, lines)
+        self.assertFalse([line for line in lines if line.startswith('vpn_rows_skipped_total{reason="error"}')])
+
+    def test_serves_metrics_over_http(self):
+        metrics = Metrics()
+        metrics.track_manager(TunnelDouble(), name='main')
+        metrics.timing_hook('select', 0.001, {})
+        server = metrics.serve(port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        with urllib.request.urlopen(base + '/metrics', timeout=5) as response:
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            lines = response.read().decode('utf-8').splitlines()
+        self.assertIn('vpn_select_duration_seconds_count 1', lines)
+        self.assertIn('vpn_tunnel_state{tunnel="main",state="CONNECTED"} 1', lines)
+        self.assertIn('vpn_tunnel_bytes{tunnel="main",direction="in"} 2048', lines)
+        self.assertIn('vpn_tunnel_rate_bytes_per_second{tunnel="main",direction="in"} 100.5', lines)
+
+        with self.assertRaises(urllib.error.HTTPError) as caught:
+            urllib.request.urlopen(base + '/other', timeout=5)
+        caught.exception.close()
+        self.assertEqual(caught.exception.code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import tempfile
+import time
+import unittest
+
+from vpn_project.openvpn_log import (STATE_ASSIGN_IP, STATE_AUTH, STATE_CONNECTED, STATE_CONNECTING, STATE_EXITED,
+                                     STATE_RECONNECTING, next_state, state_for_line)
+from vpn_project.async_openvpn_manager import AsyncOpenVPNManager
+from vpn_project.openvpn_manager import OpenVPNManager
+
+from .support import FAKE_OPENVPN, write_config
+
+
+class StateForLineTest(unittest.TestCase):
+    def test_markers(self):
+        self.assertEqual(state_for_line("2024 UDP link remote: [AF_INET]1.2.3.4:1194"), STATE_CONNECTING)
+        self.assertEqual(state_for_line("VERIFY OK: depth=1"), STATE_AUTH)
+        self.assertEqual(state_for_line("TUN/TAP device tun0 opened"), STATE_ASSIGN_IP)
+        self.assertEqual(state_for_line("Initialization Sequence Completed"), STATE_CONNECTED)
+        self.assertEqual(state_for_line("SIGUSR1[soft,ping-restart] received, process restarting"), STATE_RECONNECTING)
+        self.assertIsNone(state_for_line("OpenVPN 2.6.0 x86_64"))
+
+    def test_transitions(self):
+        self.assertEqual(next_state(STATE_CONNECTING, STATE_AUTH), STATE_AUTH)
+        self.assertIsNone(next_state(STATE_CONNECTED, STATE_AUTH)) # Renegotiation
+        self.assertIsNone(next_state(STATE_CONNECTED, STATE_ASSIGN_IP))
+        self.assertEqual(next_state(STATE_CONNECTED, STATE_RECONNECTING), STATE_RECONNECTING)
+        self.assertIsNone(next_state(STATE_RECONNECTING, STATE_CONNECTING))
+        self.assertEqual(next_state(STATE_RECONNECTING, STATE_AUTH), STATE_AUTH)
+        self.assertIsNone(next_state(STATE_EXITED, STATE_CONNECTED))
+
+
+class LogPumpTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manager = OpenVPNManager(FAKE_OPENVPN, use_sudo=False)
+        self.addCleanup(lambda: self.manager.process and self.manager.disconnect())
+
+    def connect(self, *directives):
+        self.manager.connect(write_config(self.tmp.name, 'test.ovpn', *directives))
+        self.assertIsNotNone(self.manager.process)
+
+    def test_handshake_moves_through_the_states_in_order(self):
+        states = []
+        self.connect("fake-states")
+        self.manager.log_pump.on_state = states.append
+        self.assertTrue(self.manager.wait_until_connected(5))
+        self.assertEqual(states[-1], STATE_CONNECTED)
+        order = [STATE_CONNECTING, STATE_AUTH, STATE_ASSIGN_IP, STATE_CONNECTED]
+        self.assertEqual([s for s in order if s in states], [s for s in states if s in order])
+
+    def wait_for_line(self, line, timeout=5):
+        deadline = time.monotonic() + timeout
+        while line not in self.manager.log_tail(50):
+            if time.monotonic() > deadline:
+                self.fail(f"{line!r} was not logged")
+            time.sleep(0.05)
+
+    def test_renegotiation_keeps_the_tunnel_connected(self):
+        states = []
+        self.connect("fake-delay 0.05", "fake-renegotiate")
+        self.manager.log_pump.on_state = states.append
+        self.assertTrue(self.manager.wait_until_connected(5))
+        self.wait_for_line("fake renegotiation done")
+        self.assertTrue(self.manager.connected)
+        self.assertEqual(states[states.index(STATE_CONNECTED):], [STATE_CONNECTED])
+
+    def test_chatty_output_never_stalls_openvpn(self):
+        self.connect("fake-spam 5000") # About 1 MB, far more than a pipe buffer
+        self.assertTrue(self.manager.wait_until_connected(10))
+        self.assertEqual(self.manager.log_tail(1), ["Initialization Sequence Completed"])
+        self.assertLessEqual(len(self.manager.log_pump.lines), 500)
+
+    def test_exit_before_connecting(self):
+        self.connect("fake-fail 0.05")
+        self.assertFalse(self.manager.wait_until_connected(5))
+        self.assertEqual(self.manager.state, STATE_EXITED)
+        self.assertIn("Exiting due to fatal error", self.manager.log_tail())
+
+    def test_soft_restart_is_reported_as_reconnecting(self):
+        self.connect()
+        self.assertTrue(self.manager.wait_until_connected(5))
+        self.assertTrue(self.manager.soft_reconnect()) # No management: restarts the process
+        self.assertTrue(self.manager.wait_until_connected(5))
+
+    def test_disconnect_stops_the_process(self):
+        self.connect("fake-delay 0.05")
+        self.assertTrue(self.manager.wait_until_connected(5))
+        process = self.manager.process
+        self.manager.disconnect()
+        self.assertIsNotNone(process.poll())
+        self.assertIsNone(self.manager.state)
+
+
+class AsyncLogPumpTest(unittest.TestCase):
+    def test_renegotiation_keeps_the_tunnel_connected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = write_config(tmp, 'test.ovpn', "fake-delay 0.05", "fake-renegotiate")
+
+            async def main():
+                manager = AsyncOpenVPNManager(FAKE_OPENVPN, use_sudo=False)
+                self.assertTrue(await manager.connect(config))
+                try:
+                    self.assertTrue(await manager.wait_until_connected(5))
+                    for _ in range(100):
+                        if "fake renegotiation done" in manager.tunnel.tail(50):
+                            break
+                        await asyncio.sleep(0.05)
+                    self.assertIn("Peer Connection Initiated with [AF_INET]10.0.0.1:1194", manager.tunnel.tail(50))
+                    self.assertTrue(manager.connected)
+                finally:
+                    await manager.disconnect()
+
+            asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import stat
+import tempfile
+import time
+import unittest
+
+from vpn_project.async_openvpn_manager import AsyncOpenVPNManager
+from vpn_project.openvpn_log import STATE_RECONNECTING
+from vpn_project.openvpn_management import ManagementClient, ManagementError, private_socket_path, remove_socket_path
+from vpn_project.openvpn_manager import OpenVPNManager, openvpn_command
+
+from .support import FAKE_OPENVPN, write_config
+
+
+class FakeManagementServer:
+    def __init__(self, path):
+        """
+        Scripted management interface on a Unix socket: answers the commands it knows, sends
+        notifications on demand (notify()) and records every command received.
+        """
+        self.path = path
+        self.commands = []
+        self._writers = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, self.path)
+
+    async def _serve(self, reader, writer):
+        self._writers.append(writer)
+        writer.write(b">INFO:OpenVPN Management Interface Version 5\r\n")
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                break
+            command = raw.decode().strip()
+            self.commands.append(command)
+            if command == 'drop':
+                writer.close()
+                break
+            if command in ('state on', 'bytecount 1', 'signal SIGUSR1', 'hold release'):
+                writer.write(f"SUCCESS: {command} done\r\n".encode())
+            else:
+                writer.write(b"ERROR: unknown command\r\n")
+            await writer.drain()
+
+    async def notify(self, line):
+        for writer in self._writers:
+            writer.write((line + "\r\n").encode())
+            await writer.drain()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+class ManagementClientTest(unittest.TestCase):
+    def setUp(self):
+        self.path = private_socket_path()
+        self.addCleanup(remove_socket_path, self.path)
+
+    def run_with_server(self, scenario):
+        async def main():
+            server = FakeManagementServer(self.path)
+            await server.start()
+            client = ManagementClient(self.path, on_state=lambda name, fields: states.append(name))
+            try:
+                await client.connect(timeout=2)
+                return await scenario(server, client)
+            finally:
+                await client.close()
+                await server.close()
+        states = []
+        return asyncio.run(main()), states
+
+    def test_socket_directory_is_private(self):
+        mode = stat.S_IMODE(os.stat(os.path.dirname(self.path)).st_mode)
+        self.assertEqual(mode, 0o700)
+        remove_socket_path(self.path)
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+
+    def test_command_line_uses_the_unix_socket(self):
+        command = openvpn_command('openvpn', 'x.ovpn', self.path, use_sudo=False)
+        self.assertEqual(command[-3:], ['--management', self.path, 'unix'])
+
+    def test_commands_and_notifications(self):
+        async def scenario(server, client):
+            await client.subscribe()
+            await server.notify(">STATE:1700000000,CONNECTED,SUCCESS,10.8.0.2,10.0.0.1,,,")
+            await server.notify(">BYTECOUNT:1000,500")
+            await asyncio.sleep(0.1)
+            await server.notify(">BYTECOUNT:3000,1500")
+            await asyncio.sleep(0.1)
+            self.assertEqual(await client.soft_restart(), 'signal SIGUSR1 done')
+            self.assertEqual(await client.hold_release(), 'hold release done')
+            with self.assertRaises(ManagementError):
+                await client.command('status 3')
+            return server.commands, client
+
+        (commands, client), states = self.run_with_server(scenario)
+        self.assertEqual(commands, ['state on', 'bytecount 1', 'signal SIGUSR1', 'hold release', 'status 3'])
+        self.assertEqual(states, ['CONNECTED'])
+        self.assertEqual((client.bytes_in, client.bytes_out), (3000, 1500))
+        self.assertGreater(client.rate_in, client.rate_out)
+        self.assertGreater(client.rate_out, 0)
+
+    def test_dropped_connection_fails_the_pending_command(self):
+        async def scenario(server, client):
+            with self.assertRaises(ConnectionError):
+                await client.command('drop', timeout=2)
+        self.run_with_server(scenario)
+
+
+class ManagerWithManagementTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config = write_config(self.tmp.name, 'test.ovpn', "fake-delay 0.05")
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_soft_reconnect_and_traffic_over_the_socket(self):
+        manager = OpenVPNManager(FAKE_OPENVPN, use_sudo=False, use_management=True)
+        manager.connect(self.config)
+        self.addCleanup(lambda: manager.process and manager.disconnect())
+        self.assertTrue(manager.wait_until_connected(5))
+        path = manager.management_path
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+        self.assertTrue(self.wait_for(lambda: manager.management and manager.traffic_stats()['bytes_in'] > 0))
+
+        pid = manager.process.pid
+        self.assertTrue(manager.soft_reconnect())
+        self.assertEqual(manager.state, STATE_RECONNECTING)
+        self.assertTrue(manager.wait_until_connected(5))
+        self.assertEqual(manager.process.pid, pid) # Restarted in place, not respawned
+
+        manager.disconnect()
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+    def test_async_manager_attaches_over_the_socket(self):
+        async def main():
+            manager = AsyncOpenVPNManager(FAKE_OPENVPN, use_sudo=False, use_management=True)
+            self.assertTrue(await manager.connect(self.config))
+            try:
+                self.assertTrue(await manager.wait_until_connected(5))
+                for _ in range(100):
+                    if manager.traffic_stats():
+                        break
+                    await asyncio.sleep(0.05)
+                self.assertEqual(manager.traffic_stats()['state'], 'CONNECTED')
+                self.assertTrue(await manager.soft_reconnect())
+                self.assertTrue(await manager.wait_until_connected(5))
+                path = manager.tunnel.management_path
+            finally:
+                await manager.disconnect()
+            return path
+
+        path = asyncio.run(main())
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from vpn_project import openvpn_spawner
+from vpn_project.openvpn_manager import OpenVPNManager
+from vpn_project.openvpn_spawner import OpenVPNSpawner, SpawnerError, check_config, config_options, start_spawner
+from vpn_project.ovpn_config import ConfigStore
+
+from .support import FAKE_OPENVPN, ovpn_text, write_config
+
+
+class SpawnerTest(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs the helper as the current user (no sudo), with the fake openvpn.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = ConfigStore(os.path.join(self.tmp.name, 'configs'))
+        self.client = start_spawner(os.path.join(self.tmp.name, 'spawner.sock'), FAKE_OPENVPN, use_sudo=False,
+                                    timeout=20, config_dir=self.store.store_dir)
+        self.addCleanup(self.client.shutdown)
+        self.config = self.store.put(ovpn_text('10.0.0.1') + "fake-delay 0.05\n")
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_manager_connects_through_the_helper_on_its_management_socket(self):
+        manager = OpenVPNManager(FAKE_OPENVPN, use_sudo=False, use_management=True, spawner=self.client,
+                                 extra_args=["--dev", "tun3", "--dev-type", "tun", "--route-nopull"])
+        manager.connect(self.config)
+        self.addCleanup(lambda: manager.process and manager.disconnect())
+        self.assertTrue(manager.wait_until_connected(5))
+        path = manager.management_path
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+        self.assertTrue(self.wait_for(lambda: manager.management and manager.traffic_stats()['bytes_in'] > 0))
+
+        pid = manager.process.pid
+        self.assertTrue(manager.soft_reconnect())
+        self.assertTrue(manager.wait_until_connected(5))
+        self.assertEqual(manager.process.pid, pid)
+
+        manager.disconnect()
+        self.assertTrue(self.wait_for(lambda: not os.path.exists(os.path.dirname(path))))
+        self.assertEqual(self.client.status()['instances'], [])
+
+    def test_refuses_options_and_configs_that_could_run_code(self):
+        outside = write_config(self.tmp.name, 'outside.ovpn', "fake-delay 0.05")
+        linked = os.path.join(self.store.store_dir, 'linked.ovpn')
+        os.symlink(outside, linked)
+        refused = [
+            (self.config, ["--script-security", "2", "--up", "/tmp/x"], None),
+            (self.config, ["--dev", "tun3", "--config", outside], None),
+            (self.config, [], "-n"),
+            (outside, [], None),
+            (linked, [], None),
+            (self.store.put(ovpn_text('10.0.0.2') + "script-security 2\nup /tmp/x\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.3') + "plugin /tmp/x.so\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.4') + "--script-security 2\n--up /tmp/x.sh\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.5') + '"script-security" 2\n"up" /tmp/x.sh\n'), [], None),
+            (self.store.put(ovpn_text('10.0.0.6') + "auth-user-pass /etc/shadow\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.7') + "askpass /root/.ssh/id_rsa\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.8') + "<connection>\nremote 10.0.0.8 1194\n"
+                            "http-proxy proxy 8080 /etc/shadow\n</connection>\n"), [], None),
+            (self.store.put(ovpn_text('10.0.0.9') + "#" + "x" * 300 + "up /tmp/x.sh\n"), [], None),
+        ]
+        for config, extra_args, netns in refused:
+            with self.subTest(config=config, extra_args=extra_args, netns=netns):
+                with self.assertRaises(SpawnerError):
+                    self.client.spawn(config, extra_args=extra_args, netns=netns)
+        self.assertEqual(self.client.status()['instances'], [])
+
+    def test_usual_configs_pass_the_check(self):
+        check_config(ovpn_text('10.0.0.1') + "#auth-user-pass\nauth-user-pass [inline]\nhttp-proxy proxy 8080 auto\n"
+                     "<auth-user-pass>\nuser\npass\n</auth-user-pass>\n<ca>\nup /tmp/x.sh\n</ca>\n")
+        options = list(config_options('--remote "10.0.0.1" 1194 # comment\n<connection>\nproto tcp\n</connection>\n'))
+        self.assertEqual(options, [['remote', '10.0.0.1', '1194'], ['proto', 'tcp']])
+
+    def test_peer_without_credentials_is_refused(self):
+        spawner = OpenVPNSpawner(os.path.join(self.tmp.name, 'other.sock'), FAKE_OPENVPN, owner_uid=12345,
+                                 config_dir=self.store.store_dir)
+        with mock.patch.object(openvpn_spawner, '_peer_uid', return_value=None):
+            self.assertFalse(spawner._allowed(None))
+        with mock.patch.object(openvpn_spawner, '_peer_uid', return_value=12345):
+            self.assertTrue(spawner._allowed(None))
+        with mock.patch.object(openvpn_spawner, '_peer_uid', return_value=54321):
+            self.assertFalse(spawner._allowed(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from vpn_project import ovpn_config
+from vpn_project.ovpn_config import ConfigOverrides, ConfigStore, OvpnConfig
+
+from .support import ovpn_text
+
+TEXT = """# VPNGate config
+client
+proto tcp
+remote 10.0.0.1 443
+remote 10.0.0.1 1194 udp
+cipher AES-128-CBC
+
+<ca>
+-----BEGIN CERTIFICATE-----
+remote 10.9.9.9 1
+-----END CERTIFICATE-----
+</ca>
+<key>
+secret
+</KEY>
+"""
+
+
+class OvpnConfigTest(unittest.TestCase):
+    def test_round_trips_with_inline_blocks(self):
+        config = OvpnConfig(TEXT)
+        self.assertEqual(config.to_text(), TEXT)
+        self.assertEqual(config.get('proto'), ['tcp'])
+        self.assertEqual(config.remotes(), [('10.0.0.1', '443', None), ('10.0.0.1', '1194', 'udp')])
+        self.assertEqual(config.proto(), 'tcp')
+        unterminated = "client\n<ca>\nabc\n"
+        self.assertEqual(OvpnConfig(unterminated).to_text(), unterminated)
+
+    def test_prefer_udp_keeps_only_the_udp_remotes(self):
+        config = ConfigOverrides(prefer_udp=True).apply(OvpnConfig(TEXT))
+        self.assertEqual(config.remotes(), [('10.0.0.1', '1194', 'udp')])
+        self.assertEqual(config.get('proto'), ['udp'])
+        self.assertTrue(config.to_text().endswith(TEXT[TEXT.index('<ca>'):]))
+
+        tcp_only = ovpn_text('10.0.0.2', proto='tcp')
+        self.assertEqual(ConfigOverrides(prefer_udp=True).apply(OvpnConfig(tcp_only)).to_text(), tcp_only)
+
+    def test_cipher_options_go_before_the_inline_blocks(self):
+        config = ConfigOverrides(ciphers=('AES-256-GCM', 'AES-128-GCM')).apply(OvpnConfig(TEXT))
+        self.assertEqual(config.get('data-ciphers'), ['AES-256-GCM:AES-128-GCM:AES-128-CBC'])
+        self.assertEqual(config.get('data-ciphers-fallback'), ['AES-128-CBC'])
+        self.assertEqual(config.get('ignore-unknown-option'), ['data-ciphers', 'data-ciphers-fallback'])
+        lines = config.to_text().splitlines()
+        ignore, ciphers, fallback, ca = (lines.index(line) for line in (
+            'ignore-unknown-option data-ciphers data-ciphers-fallback',
+            'data-ciphers AES-256-GCM:AES-128-GCM:AES-128-CBC', 'data-ciphers-fallback AES-128-CBC', '<ca>'))
+        # OpenVPN must see ignore-unknown-option before the options it covers.
+        self.assertLess(ignore, ciphers)
+        self.assertLess(ciphers, fallback)
+        self.assertLess(fallback, ca)
+
+        # Applying twice neither duplicates the options nor the server's cipher.
+        again = ConfigOverrides(ciphers=('AES-256-GCM', 'AES-128-GCM')).apply(config)
+        self.assertEqual(again.get_all('ignore-unknown-option'), [['data-ciphers', 'data-ciphers-fallback']])
+        self.assertEqual(again.get_all('data-ciphers'), [['AES-256-GCM:AES-128-GCM:AES-128-CBC']])
+
+
+class ConfigStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.overrides = ConfigOverrides(prefer_udp=True)
+        self.server = {'ovpn_config': TEXT}
+
+    def test_index_is_reused_across_instances(self):
+        path = ConfigStore(self.tmp.name, self.overrides).path_for_server(self.server)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), ConfigOverrides(prefer_udp=True).apply(OvpnConfig(TEXT)).to_text())
+        with mock.patch.object(ovpn_config, 'OvpnConfig', side_effect=AssertionError("config rewritten")):
+            self.assertEqual(ConfigStore(self.tmp.name, self.overrides).path_for_server(self.server), path)
+        # Other overrides are another index entry.
+        self.assertNotEqual(ConfigStore(self.tmp.name).path_for_server(self.server), path)
+        self.assertIsNone(ConfigStore(self.tmp.name).path_for_server({}))
+
+    def test_prune_deletes_unused_configs_and_their_index_entries(self):
+        store = ConfigStore(self.tmp.name, self.overrides)
+        old = store.path_for_server(self.server)
+        recent = store.put(ovpn_text('10.0.0.2'))
+        an_hour_ago = os.path.getmtime(old) - 3600
+        os.utime(old, (an_hour_ago, an_hour_ago))
+
+        self.assertEqual(store.prune(max_age=60), 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, 'index')), [])
+        self.assertEqual(store.path_for_server(self.server), old)
+        self.assertTrue(os.path.exists(old))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import time
+import unittest
+
+from vpn_project.async_scraper import AsyncVPNGateScraper
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import ListServer, server_list
+
+DEAD_URL = "http://127.0.0.1:9/api/iphone/" # Discard port: connections are refused
+
+
+class ScraperFetchTest(unittest.TestCase):
+    def setUp(self):
+        self.primary = self.stand_in(server_list([1, 2]))
+        self.mirror = self.stand_in(server_list([3]))
+
+    def stand_in(self, body):
+        server = ListServer(body)
+        self.addCleanup(server.close)
+        return server
+
+    def scraper(self, url, **kwargs):
+        kwargs.setdefault('backoff_initial', 0.01)
+        scraper = VPNGateScraper(url, **kwargs)
+        self.addCleanup(scraper.close)
+        return scraper
+
+    def test_retries_5xx_and_429_with_backoff(self):
+        self.primary.statuses = [503, 429]
+        data = self.scraper(self.primary.url, retries=2).fetch_server_data()
+        self.assertIn('vpn1', data)
+        self.assertEqual(len(self.primary.requests), 3)
+
+    def test_gives_up_after_the_retries(self):
+        self.primary.statuses = [500, 500, 500]
+        self.assertIsNone(self.scraper(self.primary.url, retries=1).fetch_server_data())
+        self.assertEqual(len(self.primary.requests), 2)
+
+    def test_client_errors_are_not_retried(self):
+        self.primary.statuses = [404]
+        self.assertIsNone(self.scraper(self.primary.url, retries=3).fetch_server_data())
+        self.assertEqual(len(self.primary.requests), 1)
+
+    def test_dead_primary_falls_over_to_the_mirror(self):
+        scraper = self.scraper(DEAD_URL, mirrors=[self.mirror.url], retries=0, mirror_delay=5)
+        self.assertIn('vpn3', scraper.fetch_server_data())
+
+    def test_slow_primary_races_the_mirror(self):
+        self.primary.delay = 2.0
+        scraper = self.scraper(self.primary.url, mirrors=[self.mirror.url], mirror_delay=0.1, timeout=5)
+        started = time.monotonic()
+        self.assertIn('vpn3', scraper.fetch_server_data())
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_timeout_bounds_a_hanging_server(self):
+        self.primary.delay = 2.0
+        started = time.monotonic()
+        self.assertIsNone(self.scraper(self.primary.url, retries=0, timeout=0.2).fetch_server_data())
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_gzip_and_keep_alive(self):
+        scraper = self.scraper(self.primary.url)
+        first = scraper.fetch_server_data()
+        second = scraper.fetch_server_data()
+        self.assertEqual(first, second)
+        self.assertIn('gzip', self.primary.requests[0]['Accept-Encoding'])
+        self.assertEqual(len(set(self.primary.clients)), 1) # Both requests on one pooled connection
+
+    def test_streaming_parse_from_the_stand_in(self):
+        names = [server['HostName'] for server in self.scraper(self.primary.url).iter_servers()]
+        self.assertEqual(names, ['vpn1', 'vpn2'])
+
+
+class AsyncScraperFetchTest(ScraperFetchTest):
+    def scraper(self, url, **kwargs):
+        kwargs.setdefault('backoff_initial', 0.01)
+        adapter = _AsyncAdapter(AsyncVPNGateScraper(url, **kwargs))
+        self.addCleanup(adapter.close)
+        return adapter
+
+    def test_streaming_parse_from_the_stand_in(self):
+        pass # The async scraper has no streaming parse
+
+
+class _AsyncAdapter:
+    # Runs the async scraper's coroutines to completion on a loop of its own.
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.loop = asyncio.new_event_loop()
+
+    def fetch_server_data(self):
+        return self.loop.run_until_complete(self.scraper.fetch_server_data())
+
+    def close(self):
+        self.loop.run_until_complete(self.scraper.close())
+        self.loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.server_history import HistoryStore
+from vpn_project.server_record import server_key
+from vpn_project.vpn_client import _pick_probed
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import server_list
+
+
+class HistoryScorerTest(unittest.TestCase):
+    def setUp(self):
+        self.history = HistoryStore(':memory:')
+        self.addCleanup(self.history.close)
+        self.catalog = ServerCatalog(VPNGateScraper().parse_server_data(server_list([1, 2, 3])))
+
+    def top(self):
+        return [s['HostName'] for s in self.catalog.top_servers(3, scorer=self.history.scorer())]
+
+    def test_repeated_queries_share_one_cache_entry(self):
+        self.assertIs(self.history.scorer(), self.history.scorer())
+        for _ in range(50):
+            self.top()
+        self.assertEqual(len(self.catalog.ranking()._keys), 1)
+
+    def test_recorded_outcomes_change_the_cached_ranking(self):
+        self.assertEqual(self.top(), ['vpn1', 'vpn2', 'vpn3'])
+        best = self.catalog.top_servers(1)[0]
+        for _ in range(5):
+            self.history.record(best, success=False)
+        self.assertEqual(self.top(), ['vpn2', 'vpn3', 'vpn1'])
+        self.history.prune(float('inf'))
+        self.assertEqual(self.top(), ['vpn1', 'vpn2', 'vpn3'])
+
+    def test_probes_measure_rtt_without_counting_as_attempts(self):
+        servers = self.catalog.top_servers(3)
+        self.assertEqual(_pick_probed(servers, [(s, None) for s in servers], self.history), (servers[0], None))
+        self.assertEqual(self.history.summaries([server_key(s) for s in servers]), {})
+
+        self.assertIs(_pick_probed(servers, [(servers[2], 0.02), (servers[0], None), (servers[1], None)],
+                                   self.history)[0], servers[2])
+        self.history.record(servers[2], success=True, time_to_connected=1.5, rtt=0.04)
+        summaries = self.history.summaries([server_key(s) for s in servers])
+        self.assertEqual(list(summaries), [server_key(servers[2])])
+        summary = summaries[server_key(servers[2])]
+        self.assertAlmostEqual(summary['rtt'], 0.03, places=3)
+        self.assertAlmostEqual(summary['time_to_connected'], 1.5, places=3)
+        self.assertAlmostEqual(summary['attempts'], 1.0, places=3)
+        self.assertEqual(summary['reliability'], 1.0)
+        self.assertEqual(self.top(), ['vpn1', 'vpn2', 'vpn3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
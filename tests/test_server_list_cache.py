@@ -0,0 +1,143 @@
+import os
+import tempfile
+import time
+import unittest
+
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.server_list_cache import ServerListCache
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import ListServer, server_list
+
+
+class ServerListCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = ListServer(server_list([1, 2, 3]), etag='"v1"')
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp.cleanup()
+
+    def scraper(self, ttl=600, stale_while_revalidate=False, **kwargs):
+        cache = ServerListCache(self.tmp.name, ttl=ttl, stale_while_revalidate=stale_while_revalidate)
+        scraper = VPNGateScraper(self.server.url, cache=cache, backoff_initial=0.01, **kwargs)
+        self.addCleanup(scraper.close)
+        return scraper
+
+    def expire(self, scraper):
+        path = scraper.cache._path(scraper.vpngate_url)
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+
+    def test_fresh_copy_is_served_without_a_request(self):
+        scraper = self.scraper()
+        first = scraper.fetch_server_data()
+        second = scraper.fetch_server_data()
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_copy_is_revalidated_with_etag(self):
+        scraper = self.scraper()
+        data = scraper.fetch_server_data()
+        self.expire(scraper)
+
+        self.assertEqual(scraper.fetch_server_data(), data)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1].get('If-None-Match'), '"v1"')
+        # The 304 marks the copy as validated again.
+        self.assertTrue(scraper.cache.is_fresh(scraper.cache.load(scraper.vpngate_url)))
+
+    def test_changed_list_replaces_the_cached_copy(self):
+        scraper = self.scraper()
+        scraper.fetch_server_data()
+        self.expire(scraper)
+        self.server.body, self.server.etag = server_list([4, 5]), '"v2"'
+
+        data = scraper.fetch_server_data()
+        self.assertIn('vpn4', data)
+        cached = scraper.cache.load(scraper.vpngate_url)
+        self.assertEqual((cached.data, cached.etag), (data, '"v2"'))
+        self.assertEqual([name for name in os.listdir(self.tmp.name) if name.endswith('.tmp')], [])
+
+    def test_stale_while_revalidate_answers_at_once_and_refreshes_in_background(self):
+        scraper = self.scraper(stale_while_revalidate=True)
+        old = scraper.fetch_server_data()
+        self.expire(scraper)
+        self.server.body, self.server.etag = server_list([7]), '"v2"'
+        self.server.delay = 0.3
+
+        started = time.monotonic()
+        self.assertEqual(scraper.fetch_server_data(), old)
+        self.assertLess(time.monotonic() - started, 0.3)
+        scraper._refresh_thread.join(5)
+        self.assertIn('vpn7', scraper.cache.load(scraper.vpngate_url).data)
+
+    def test_failed_or_timed_out_refresh_falls_back_to_the_cached_copy(self):
+        scraper = self.scraper(retries=0, timeout=0.2)
+        data = scraper.fetch_server_data()
+        self.expire(scraper)
+        self.server.statuses = [500]
+        self.assertEqual(scraper.fetch_server_data(), data)
+
+        self.server.delay = 1.0 # Longer than the scraper's timeout
+        self.assertEqual(scraper.fetch_server_data(), data)
+
+    def test_no_cache_and_no_server_returns_none(self):
+        scraper = VPNGateScraper("http://127.0.0.1:9/", retries=0, timeout=0.5)
+        self.addCleanup(scraper.close)
+        self.assertIsNone(scraper.fetch_server_data())
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ServerListCache(self.tmp.name, stale_while_revalidate=True)
+        self.url = 'http://127.0.0.1/api/iphone/'
+
+    def store(self, numbers):
+        data = server_list(numbers)
+        self.cache.store(self.url, data)
+        return data, VPNGateScraper().parse_server_data(data)
+
+    def load(self):
+        snapshot = self.cache.load_snapshot(self.url)
+        if snapshot:
+            self.addCleanup(snapshot.close)
+        return snapshot
+
+    def test_snapshot_of_a_replaced_list_is_not_loaded(self):
+        old, old_servers = self.store([1, 2])
+        self.store([3]) # A background refresh stores the new list first...
+        self.cache.store_snapshot(self.url, old_servers, old) # ...then the stale parse is snapshotted
+        self.assertIsNone(self.load())
+
+        new, new_servers = self.store([3])
+        self.cache.store_snapshot(self.url, new_servers, new)
+        self.cache.touch(self.url)
+        self.assertEqual([s['HostName'] for s in self.load().records()], ['vpn3'])
+
+    def test_streamed_list_records_its_digest(self):
+        data, servers = self.store([1, 2])
+        with self.cache.writer(self.url) as f:
+            for line in data.splitlines(keepends=True):
+                f.write(line)
+        self.assertEqual(self.cache.load(self.url).data, data)
+        self.cache.store_snapshot(self.url, servers, data)
+        self.assertIsNotNone(self.load())
+
+    def test_catalog_update_releases_the_snapshot(self):
+        data, servers = self.store([1, 2])
+        self.cache.store_snapshot(self.url, servers, data)
+        snapshot = self.cache.load_snapshot(self.url)
+        catalog = ServerCatalog.from_snapshot(snapshot)
+        self.assertEqual(len(catalog.countries()), 1)
+        catalog.update(servers[:1])
+        self.assertTrue(snapshot._map.closed)
+        self.assertEqual([s['HostName'] for s in catalog], ['vpn1'])
+        self.assertEqual(len(catalog.countries()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import base64
+import unittest
+
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.server_ranking import weighted_scorer
+from vpn_project.vpn_client import select_server_from_list
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import server_list, server_row
+
+NOT_BASE64 = b'%%%%'
+NOT_UTF8 = base64.b64encode(b'\xff\xfe client')
+
+
+def parse(rows):
+    return VPNGateScraper().parse_server_data(server_list(rows))
+
+
+class UndecodableConfigTest(unittest.TestCase):
+    def setUp(self):
+        # vpn1 and vpn2 rank best, but their configs do not decode.
+        self.servers = parse([server_row(1, config=NOT_BASE64), server_row(2, config=NOT_UTF8), 3, 4])
+
+    def test_parse_keeps_configs_encoded(self):
+        self.assertEqual([s['HostName'] for s in self.servers], ['vpn1', 'vpn2', 'vpn3', 'vpn4'])
+
+    def test_catalog_top_servers_skip_undecodable_configs(self):
+        catalog = ServerCatalog(self.servers)
+        self.assertEqual([s['HostName'] for s in catalog.top_servers(2)], ['vpn3', 'vpn4'])
+        self.assertEqual([s['HostName'] for s in catalog.top_servers(5, 'jp')], ['vpn3', 'vpn4'])
+        by_country = catalog.top_servers_by_country(1)
+        self.assertEqual([s['HostName'] for s in by_country['jp']], ['vpn3'])
+
+    def test_select_server_from_list_falls_back_to_the_next_candidate(self):
+        self.assertEqual(select_server_from_list(self.servers)['HostName'], 'vpn3')
+
+    def test_nothing_selectable_returns_none(self):
+        servers = parse([server_row(1, config=NOT_BASE64)])
+        self.assertIsNone(select_server_from_list(servers))
+        self.assertEqual(ServerCatalog(servers).top_servers(1), [])
+
+    def test_fixed_config_is_selectable_again_after_update(self):
+        catalog = ServerCatalog(self.servers)
+        self.assertEqual(catalog.top_servers(1)[0]['HostName'], 'vpn3')
+        catalog.update(parse([1, server_row(2, config=NOT_UTF8), 3, 4]))
+        self.assertEqual(catalog.top_servers(1)[0]['HostName'], 'vpn1')
+
+
+class WeightedScorerTest(unittest.TestCase):
+    def test_equal_weights_share_one_cache_entry(self):
+        self.assertIs(weighted_scorer(1, 1, 0.5), weighted_scorer())
+        self.assertIsNot(weighted_scorer(ping=2), weighted_scorer())
+        catalog = ServerCatalog(parse([1, 2, 3]))
+        for _ in range(50):
+            top = catalog.top_servers(2, scorer=weighted_scorer(speed=1, ping=0))
+        self.assertEqual([s['HostName'] for s in top], ['vpn1', 'vpn2'])
+        self.assertEqual(len(catalog.ranking()._keys), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
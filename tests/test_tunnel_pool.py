@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+
+from vpn_project.ovpn_config import ConfigStore
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.tunnel_pool import TunnelPool
+from vpn_project.vpngate_scraper import VPNGateScraper
+
+from .support import FAKE_OPENVPN, ovpn_text, server_list, server_row
+
+
+def parse(numbers, *directives):
+    rows = [server_row(i, config=ovpn_text(f"10.0.0.{i}") + "".join(d + "\n" for d in directives))
+            for i in numbers]
+    return VPNGateScraper().parse_server_data(server_list(rows))
+
+
+class TunnelPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.catalog = ServerCatalog(parse([1, 2, 3], "fake-delay 0.05"))
+        self.pool = TunnelPool(self.catalog, {'jp': 2}, openvpn_path=FAKE_OPENVPN, use_sudo=False,
+                               use_management=False, maintain_interval=60, connect_timeout=5,
+                               config_store=ConfigStore(self.tmp.name))
+        self.addCleanup(self.pool.stop)
+
+    def test_fill_meets_the_quota_on_separate_devices(self):
+        self.pool.start()
+        status = self.pool.status()['JP']
+        self.assertEqual(sorted(dev for dev, _, _ in status), ['tun10', 'tun11'])
+        self.assertEqual(sorted(key for _, key, _ in status), ['10.0.0.1', '10.0.0.2'])
+        self.assertIsNotNone(self.pool.acquire('jp'))
+        self.assertIsNone(self.pool.acquire('us'))
+
+    def test_evicting_a_tunnel_twice_frees_its_device_once(self):
+        self.pool.start()
+        tunnel = next(t for t in self.pool._tunnels['JP'] if t.server['HostName'] == 'vpn1')
+        process = tunnel.manager.process
+        self.catalog.update(parse([2, 3], "fake-delay 0.05")) # vpn1 is no longer listed
+        self.assertIsNotNone(process.poll())
+        self.pool.release(tunnel, failed=True)
+        self.assertEqual(self.pool._free_dev_indexes, [tunnel.dev_index])
+        self.assertEqual(self.pool._breaker(tunnel.server).failures, 0)
+
+        self.pool.fill()
+        devs = [dev for dev, _, _ in self.pool.status()['JP']]
+        self.assertEqual(sorted(devs), ['tun10', 'tun11'])
+        self.assertEqual(self.pool._free_dev_indexes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,310 @@
+import asyncio
+import collections
+import os
+import signal
+import time
+
+from .openvpn_log import STATE_CONNECTED, STATE_CONNECTING, STATE_EXITED, STATE_RECONNECTING, next_state, state_for_line
+from .openvpn_management import MANAGEMENT_STATES, ManagementClient, private_socket_path, remove_socket_path
+from .openvpn_manager import openvpn_command
+
+LINE_LIMIT = 1 << 20 # OpenVPN can log very long lines (e.g. pushed options); asyncio's default is 64 KiB
+
+
+class AsyncOpenVPNProcess:
+    def __init__(self, process, config_path, management_path=None, max_lines=500):
+        """
+        One OpenVPN process started with asyncio. Its stdout and stderr are drained by tasks on
+        the event loop (no threads); the last max_lines lines are kept and the connection state is
+        tracked the same way as OpenVPNLogPump. With a management socket path, management >STATE:
+        events drive the state as well; the socket and its directory are removed by terminate().
+        """
+        self.process = process
+        self.config_path = config_path
+        self.management_path = management_path
+        self.management = None # ManagementClient, once attached
+        self.lines = collections.deque(maxlen=max_lines)
+        self.state = STATE_CONNECTING
+        self.state_changed_at = time.monotonic()
+        self._changed = asyncio.Event() # Set (and replaced) on every state change
+        readers = [asyncio.ensure_future(self._read(stream))
+                   for stream in (process.stdout, process.stderr) if stream is not None]
+        self._tasks = readers + [asyncio.ensure_future(self._wait_for_exit(readers))]
+        if management_path:
+            self._tasks.append(asyncio.ensure_future(self._attach_management()))
+
+    @classmethod
+    async def start(cls, command, config_path, management_path=None):
+        """
+        Starts command in its own process group and returns the AsyncOpenVPNProcess.
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE,
+                                                           start_new_session=True, limit=LINE_LIMIT)
+        except BaseException:
+            remove_socket_path(management_path)
+            raise
+        return cls(process, config_path, management_path)
+
+    async def _read(self, stream):
+        try:
+            async for raw in stream:
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                self.lines.append(line)
+                state = state_for_line(line)
+                if state is not None:
+                    self.set_state(state)
+        except (OSError, ValueError):
+            pass # Stream closed underneath us, or an over-long line
+
+    async def _wait_for_exit(self, readers):
+        await asyncio.gather(*readers, return_exceptions=True)
+        await self.process.wait()
+        self.set_state(STATE_EXITED)
+        if self.management:
+            await self.management.close()
+
+    async def _attach_management(self):
+        def on_state(name, fields):
+            state = MANAGEMENT_STATES.get(name)
+            if state:
+                self.set_state(state)
+
+        client = ManagementClient(self.management_path, on_state=on_state)
+        try:
+            await client.connect()
+            await client.subscribe()
+        except Exception as e:
+            print(f"Could not attach to the OpenVPN management interface at {self.management_path}: {e}")
+            await client.close()
+            return
+        if self.state == STATE_EXITED:
+            await client.close()
+            return
+        self.management = client
+
+    def set_state(self, state):
+        """
+        Moves to state as next_state() allows, like OpenVPNLogPump.set_state.
+        """
+        state = next_state(self.state, state)
+        if state is None:
+            return
+        self.state = state
+        self.state_changed_at = time.monotonic()
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_state(self, states, timeout=None):
+        """
+        Waits until the state is one of states (or EXITED), or timeout seconds pass.
+        Returns the state at that moment.
+        """
+        states = set(states) | {STATE_EXITED}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.state not in states:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self.state
+
+    def tail(self, n=20):
+        return list(self.lines)[-n:]
+
+    async def terminate(self, timeout=10):
+        """
+        Stops the process group: SIGTERM, then SIGKILL if it has not exited after timeout seconds.
+        """
+        try:
+            if self.process.returncode is None:
+                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(self.process.wait(), timeout)
+                except asyncio.TimeoutError:
+                    print(f"OpenVPN (PID: {self.process.pid}) did not exit after SIGTERM. Forcing SIGKILL...")
+                    os.killpg(os.getpgid(self.process.pid), signal.SIGKILL)
+                    await asyncio.wait_for(self.process.wait(), 5)
+        except ProcessLookupError:
+            pass # Already exited
+        finally:
+            if self.management:
+                await self.management.close()
+                self.management = None
+            for task in self._tasks:
+                task.cancel()
+            remove_socket_path(self.management_path)
+
+
+class AsyncOpenVPNManager:
+    def __init__(self, openvpn_path="openvpn", use_sudo=True, use_management=False, extra_args=None, netns=None):
+        """
+        asyncio counterpart of OpenVPNManager (same arguments). OpenVPN is started with
+        asyncio.create_subprocess_exec and watched by tasks on the running event loop, so one
+        loop can drive many managers without a thread per tunnel.
+        """
+        self.openvpn_path = openvpn_path
+        self.use_sudo = use_sudo
+        self.use_management = use_management
+        self.extra_args = list(extra_args or [])
+        self.netns = netns
+        self.tunnel = None # AsyncOpenVPNProcess of the current connection
+
+    @property
+    def process(self):
+        return self.tunnel.process if self.tunnel else None
+
+    @property
+    def config_path(self):
+        return self.tunnel.config_path if self.tunnel else None
+
+    @property
+    def state(self):
+        return self.tunnel.state if self.tunnel else None
+
+    @property
+    def connected(self):
+        return self.state == STATE_CONNECTED
+
+    def log_tail(self, n=20):
+        return self.tunnel.tail(n) if self.tunnel else []
+
+    def traffic_stats(self):
+        """
+        Returns byte counters and throughput from the management interface, or None if not attached.
+        """
+        client = self.tunnel.management if self.tunnel else None
+        if client is None:
+            return None
+        return {'bytes_in': client.bytes_in, 'bytes_out': client.bytes_out,
+                'rate_in': client.rate_in, 'rate_out': client.rate_out, 'state': client.last_state}
+
+    async def _start(self, ovpn_file_path):
+        management_path = private_socket_path() if self.use_management else None
+        command = openvpn_command(self.openvpn_path, ovpn_file_path, management_path, self.extra_args,
+                                  self.netns, self.use_sudo)
+        return await AsyncOpenVPNProcess.start(command, ovpn_file_path, management_path)
+
+    async def connect(self, ovpn_file_path):
+        """
+        Starts OpenVPN with the given .ovpn file. Returns True once the process has started;
+        await wait_until_connected() for the tunnel itself.
+        """
+        if self.tunnel:
+            print("Already connected. Please disconnect first.")
+            return False
+        if not os.path.exists(ovpn_file_path):
+            print(f"Error: OVPN configuration file not found at {ovpn_file_path}")
+            return False
+        try:
+            self.tunnel = await self._start(ovpn_file_path)
+        except FileNotFoundError:
+            print("Error: 'openvpn' command not found. Please ensure OpenVPN is installed and in your PATH.")
+            return False
+        except Exception as e:
+            print(f"An error occurred while trying to start OpenVPN: {e}")
+            return False
+        print(f"OpenVPN process started (PID: {self.tunnel.process.pid}) with {ovpn_file_path}.")
+        return True
+
+    async def wait_until_connected(self, timeout=None):
+        """
+        Waits until the tunnel is up, OpenVPN exits, or timeout seconds pass. Returns True if connected.
+        """
+        if not self.tunnel:
+            return False
+        return await self.tunnel.wait_for_state([STATE_CONNECTED], timeout) == STATE_CONNECTED
+
+    async def connect_race(self, ovpn_file_paths, stagger=3.0, timeout=60):
+        """
+        Same as OpenVPNManager.connect_race: starts the configs in order, one every `stagger`
+        seconds (or at once when an attempt exits); the first to connect is kept, the rest are killed.
+        Returns the winning config path, or None.
+        """
+        if self.tunnel:
+            print("Already connected. Please disconnect first.")
+            return None
+        pending = [path for path in ovpn_file_paths if os.path.exists(path)]
+        if not pending:
+            return None
+
+        attempts = [] # Every AsyncOpenVPNProcess started; all but the winner are stopped at the end
+        waiting = {} # wait task -> AsyncOpenVPNProcess, for attempts that have neither connected nor exited
+        winner = None
+        deadline = time.monotonic() + timeout
+        try:
+            while winner is None and time.monotonic() < deadline and (pending or waiting):
+                if pending:
+                    path = pending.pop(0)
+                    try:
+                        attempt = await self._start(path)
+                    except (OSError, ValueError) as e:
+                        print(f"Could not start OpenVPN for {path}: {e}")
+                        continue
+                    print(f"Race attempt: started OpenVPN (PID: {attempt.process.pid}) with {path}")
+                    attempts.append(attempt)
+                    waiting[asyncio.ensure_future(attempt.wait_for_state([STATE_CONNECTED]))] = attempt
+                if not waiting:
+                    continue
+                wait_for = max(0.0, (min(deadline, time.monotonic() + stagger) if pending else deadline)
+                               - time.monotonic())
+                done, _ = await asyncio.wait(waiting, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt = waiting.pop(task)
+                    if task.result() != STATE_CONNECTED:
+                        print(f"Race attempt with {attempt.config_path} exited before connecting.")
+                    elif winner is None:
+                        winner = attempt
+                    # Other attempts that connected in the same batch are stopped below with the losers.
+        finally:
+            for task in waiting:
+                task.cancel()
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.terminate(timeout=5)
+
+        if winner is None:
+            print("No OpenVPN attempt connected.")
+            return None
+        self.tunnel = winner
+        print(f"Connected via {winner.config_path} (PID: {winner.process.pid}).")
+        return winner.config_path
+
+    async def soft_reconnect(self):
+        """
+        Reconnects via the management interface (SIGUSR1) if attached, else restarts OpenVPN.
+        Returns True if a reconnect was started.
+        """
+        if not self.tunnel:
+            print("Not connected to any OpenVPN server.")
+            return False
+        if self.tunnel.management:
+            try:
+                await self.tunnel.management.soft_restart()
+                self.tunnel.set_state(STATE_RECONNECTING)
+                return True
+            except Exception as e:
+                print(f"Management soft reconnect failed ({e}); restarting OpenVPN instead.")
+        config_path = self.config_path
+        await self.disconnect()
+        return await self.connect(config_path)
+
+    async def disconnect(self):
+        """
+        Stops the OpenVPN process group (SIGTERM, then SIGKILL).
+        """
+        if not self.tunnel:
+            print("Not connected to any OpenVPN server or process not found.")
+            return
+        tunnel, self.tunnel = self.tunnel, None
+        print(f"Attempting to disconnect from OpenVPN (PID: {tunnel.process.pid})...")
+        try:
+            await tunnel.terminate()
+            print("OpenVPN process group terminated.")
+        except Exception as e:
+            print(f"An error occurred while trying to disconnect: {e}")
+            print(f"You might need to manually kill the OpenVPN process group (e.g., sudo kill -TERM -- -{tunnel.process.pid}).")
@@ -0,0 +1,321 @@
+import asyncio
+import random
+import ssl
+import time
+import urllib.parse
+import zlib
+
+from .server_catalog import ServerCatalog
+from .vpngate_scraper import RETRY_STATUSES, VPNGateScraper
+
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    """Raised when a server list URL answers with an HTTP error status."""
+
+
+class _Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status_code = status
+        self.headers = headers # Lower-cased header names
+        self.body = body
+
+    @property
+    def text(self):
+        charset = 'utf-8'
+        for part in self.headers.get('content-type', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                charset = value.strip('"')
+        return self.body.decode(charset, errors='replace')
+
+
+def _decode_body(body, encoding):
+    encoding = encoding.lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS) # Raw deflate, as some servers send it
+    return body
+
+
+class AsyncVPNGateScraper:
+    def __init__(self, vpngate_url="http://www.vpngate.net/api/iphone/", cache=None, mirrors=None,
+                 timeout=10, retries=2, backoff_initial=0.5, backoff_max=4.0, mirror_delay=2.0):
+        """
+        asyncio counterpart of VPNGateScraper (same arguments and cache/mirror/retry behaviour).
+        HTTP runs on the event loop over asyncio streams (HTTP/1.1 with keep-alive, gzip,
+        chunked bodies and redirects), so fetching never needs an executor thread.
+        Parsing is shared with VPNGateScraper.
+        """
+        self.vpngate_url = vpngate_url
+        self.mirrors = list(mirrors or [])
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.mirror_delay = mirror_delay
+        self._parser = VPNGateScraper(vpngate_url)
+        self.headers = dict(self._parser.headers)
+        self._idle = {} # (scheme, host, port) -> (reader, writer) kept alive for the next request
+        self._refresh_task = None
+        self._catalog = None
+
+    @property
+    def urls(self):
+        return [self.vpngate_url] + [url for url in self.mirrors if url != self.vpngate_url]
+
+    async def close(self):
+        """
+        Closes idle keep-alive connections.
+        """
+        idle, self._idle = self._idle, {}
+        for _, writer in idle.values():
+            writer.close()
+        self._parser.close()
+
+    async def _open(self, parts):
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        key = (parts.scheme, parts.hostname, port)
+        connection = self._idle.pop(key, None)
+        if connection and not connection[0].at_eof():
+            return key, connection, True
+        if connection:
+            connection[1].close()
+        reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                       ssl=ssl.create_default_context() if secure else None)
+        return key, (reader, writer), False
+
+    async def _exchange(self, url, headers):
+        """
+        Performs one GET on a (possibly reused) connection. Returns a _Response with a decoded body.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Unsupported URL: {url}")
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        host = parts.netloc.rpartition('@')[2]
+        request = [f"GET {target} HTTP/1.1", f"Host: {host}", "Connection: keep-alive"]
+        request += [f"{name}: {value}" for name, value in headers.items()]
+        payload = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1')
+
+        key, (reader, writer), reused = await self._open(parts)
+        try:
+            writer.write(payload)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line and reused:
+                # The server closed the idle connection; retry once on a fresh one.
+                writer.close()
+                key, (reader, writer), _ = await self._open(parts)
+                writer.write(payload)
+                await writer.drain()
+                status_line = await reader.readline()
+            version, status, _ = (status_line.decode('latin-1').split(' ', 2) + [''])[:3]
+            if not version.startswith('HTTP/') or not status.isdigit():
+                raise ConnectionError(f"Malformed HTTP status line from {url}: {status_line[:80]!r}")
+            status = int(status)
+
+            response_headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+
+            reusable = response_headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+            if status in (204, 304) or 100 <= status < 200:
+                body = b''
+            elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                    if size == 0:
+                        while (await reader.readline()).strip(): # Trailers
+                            pass
+                        break
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readline() # CRLF after each chunk
+                body = b''.join(chunks)
+            elif 'content-length' in response_headers:
+                body = await reader.readexactly(int(response_headers['content-length']))
+            else:
+                body = await reader.read() # Delimited by the server closing the connection
+                reusable = False
+        except BaseException:
+            writer.close()
+            raise
+
+        if reusable:
+            self._idle[key] = (reader, writer)
+        else:
+            writer.close()
+        body = _decode_body(body, response_headers.get('content-encoding', ''))
+        return _Response(url, status, response_headers, body)
+
+    async def _request(self, url, headers):
+        """
+        GETs one URL (following redirects), retrying connection errors and 429/5xx replies with
+        jittered backoff. Returns the response (2xx or 304); raises FetchError, OSError or
+        asyncio.TimeoutError otherwise.
+        """
+        delay = self.backoff_initial
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                location = url
+                for _ in range(MAX_REDIRECTS + 1):
+                    response = await asyncio.wait_for(self._exchange(location, headers), self.timeout)
+                    if response.status_code not in (301, 302, 303, 307, 308) or 'location' not in response.headers:
+                        break
+                    location = urllib.parse.urljoin(location, response.headers['location'])
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, zlib.error):
+                if last_attempt:
+                    raise
+            else:
+                status = response.status_code
+                if status not in RETRY_STATUSES or last_attempt:
+                    if status != 304 and not 200 <= status < 300:
+                        raise FetchError(f"{status} error for url: {response.url}")
+                    return response
+            await asyncio.sleep(min(self.backoff_max, delay) * random.uniform(0.5, 1.0))
+            delay *= 2
+
+    async def _get(self, headers):
+        """
+        Requests the list from the configured URLs, starting the next mirror whenever the current
+        ones fail or have not answered within mirror_delay seconds. Returns the first good response.
+        """
+        remaining = self.urls
+        pending = {}
+        last_error = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    url = remaining.pop(0)
+                    pending[asyncio.ensure_future(self._request(url, headers))] = url
+                done, _ = await asyncio.wait(pending, timeout=self.mirror_delay if remaining else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        return task.result()
+                    except (FetchError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                            ValueError, zlib.error) as e:
+                        print(f"Error fetching server data from {url}: {e}")
+                        last_error = e
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch_server_data(self):
+        """
+        Returns the raw server list text, or None if fetching fails. Uses the cache exactly like
+        VPNGateScraper.fetch_server_data (stale copies are refreshed in a background task).
+        """
+        if not self.cache:
+            return await self._download()
+
+        cached = self.cache.load(self.vpngate_url)
+        if self.cache.is_fresh(cached):
+            return cached.data
+
+        if cached and self.cache.stale_while_revalidate:
+            self.refresh_in_background(cached)
+            return cached.data
+
+        data = await self._download(cached)
+        if data is None and cached:
+            print("Using cached server list after failed refresh.")
+            return cached.data
+        return data
+
+    def refresh_in_background(self, cached=None):
+        """
+        Starts revalidating the cached list in a task on the running loop (at most one at a time).
+        Returns the task, or None if no cache is configured.
+        """
+        if not self.cache:
+            return None
+        if self._refresh_task and not self._refresh_task.done():
+            return self._refresh_task
+        self._refresh_task = asyncio.ensure_future(self._download(cached))
+        return self._refresh_task
+
+    async def _download(self, cached=None):
+        headers = dict(self.headers)
+        if cached:
+            headers.update(cached.validator_headers())
+        try:
+            response = await self._get(headers)
+        except (FetchError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, zlib.error) as e:
+            print(f"Error fetching server data: {e}")
+            return None
+        if cached and response.status_code == 304: # Not Modified: our copy is still current
+            self.cache.touch(self.vpngate_url)
+            return cached.data
+
+        data = response.text
+        if self.cache and data:
+            self.cache.store(self.vpngate_url, data, etag=response.headers.get('etag'),
+                             last_modified=response.headers.get('last-modified'))
+        return data
+
+    def parse_server_data(self, csv_data):
+        return self._parser.parse_server_data(csv_data)
+
+    async def get_catalog(self, refresh=False):
+        """
+        Returns the ServerCatalog from a single fetch and parse, kept until refresh=True
+        (which updates the same catalog in place, like VPNGateScraper.get_catalog).
+        A failed fetch returns an empty catalog that is not kept.
+        """
+        if self._catalog is not None and not refresh:
+            return self._catalog
+
+        csv_data = await self.fetch_server_data()
+        servers = self.parse_server_data(csv_data) if csv_data else []
+        if not servers:
+            return ServerCatalog([])
+
+        if self._catalog is None:
+            self._catalog = ServerCatalog(servers)
+        else:
+            self._catalog.update(servers)
+        return self._catalog
+
+    async def get_servers(self, filter_country_short=None):
+        """
+        Returns the servers, optionally filtered by short country code.
+        """
+        return (await self.get_catalog()).servers_for_country(filter_country_short)
+
+    async def get_available_countries(self):
+        """
+        Returns a sorted list of unique (CountryLong, CountryShort) tuples.
+        """
+        return (await self.get_catalog()).countries()
+
+
+if __name__ == '__main__':
+    async def demo():
+        scraper = AsyncVPNGateScraper()
+        try:
+            start = time.monotonic()
+            countries = await scraper.get_available_countries()
+            print(f"Fetched {len(countries)} countries in {time.monotonic() - start:.2f}s.")
+            jp_servers = await scraper.get_servers("JP")
+            print(f"Found {len(jp_servers)} servers in Japan.")
+        finally:
+            await scraper.close()
+
+    asyncio.run(demo())
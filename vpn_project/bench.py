@@ -0,0 +1,458 @@
+import argparse
+import base64
+import gzip
+import http.server
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+from .catalog_snapshot import write_snapshot
+from .openvpn_manager import OpenVPNManager
+from .openvpn_spawner import SpawnerClient
+from .ovpn_config import ConfigStore
+from .server_catalog import ServerCatalog, rank_key
+from .server_ranking import RankingEngine
+from .server_record import dedupe_servers
+from .vpn_client import select_server_from_list
+from .vpngate_scraper import VPNGateScraper, parse_executor, usable_cpu_count
+
+VPNGATE_HEADER = ("#HostName,IP,Score,Ping,Speed,CountryLong,CountryShort,NumVpnSessions,Uptime,"
+                  "TotalUsers,TotalTraffic,LogType,Operator,Message,OpenVPN_ConfigData_Base64")
+# Small server list in the format --record writes (CRLF rows, duplicate IPs, real-size configs),
+# used by default so the offline suite runs on realistic rows without network access.
+SAMPLE_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'vpngate_sample.csv')
+SCALING_SERVERS = 20000 # Rows in the synthetic list the scaling suite uses by default
+FIXTURE_COUNTRIES = [("Japan", "JP"), ("United States", "US"), ("Korea Republic of", "KR"),
+                     ("Thailand", "TH"), ("Viet Nam", "VN"), ("Russian Federation", "RU")]
+
+
+def synthetic_server_list(num_servers, seed=0, config_padding=3000):
+    """
+    Returns a VPNGate-format server list with num_servers rows of plausible random data.
+    config_padding pads each ovpn config to roughly the size of a real one (certificates included).
+    """
+    rng = random.Random(seed)
+    lines = ["*vpn_servers", VPNGATE_HEADER]
+    for i in range(num_servers):
+        country_long, country_short = FIXTURE_COUNTRIES[i % len(FIXTURE_COUNTRIES)]
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        proto = "udp" if i % 2 else "tcp"
+        config = (f"client\ndev tun\nproto {proto}\nremote {ip} {1194 + i % 3}\n"
+                  f"cipher AES-128-CBC\n<ca>\n{'A' * config_padding}\n</ca>\n")
+        config_b64 = base64.b64encode(config.encode('utf-8')).decode('ascii')
+        lines.append(f"public-vpn-{i},{ip},{rng.randint(1, 10**6)},{rng.randint(0, 300)},{rng.randint(0, 10**8)},"
+                     f"{country_long},{country_short},{rng.randint(0, 200)},{rng.randint(0, 10**9)},"
+                     f"{rng.randint(1, 10**6)},{rng.randint(1, 10**12)},2weeks,Operator {i},,{config_b64}")
+    lines.append("*")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _parse_once(csv_data, decode_all):
+    servers = VPNGateScraper().parse_server_data(csv_data)
+    if decode_all: # What parsing cost before configs were decoded lazily
+        for server in servers:
+            server.get('ovpn_config')
+    return servers
+
+
+def _measure_parse(fixture_path, decode_all, result_queue):
+    # Runs in a fresh process so ru_maxrss reflects only this measurement.
+    with open(fixture_path, encoding='utf-8', newline='') as f:
+        csv_data = f.read()
+
+    start = time.perf_counter()
+    servers = _parse_once(csv_data, decode_all)
+    elapsed = time.perf_counter() - start
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del servers
+
+    # Second pass under tracemalloc: peak bytes allocated by the parse itself,
+    # and bytes still held by the parsed server list afterwards.
+    tracemalloc.start()
+    servers = _parse_once(csv_data, decode_all)
+    retained, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result_queue.put({'servers': len(servers), 'seconds': elapsed, 'peak_rss_kb': peak_rss_kb,
+                      'peak_alloc_bytes': peak_alloc, 'retained_bytes': retained})
+
+
+def bench_parse(csv_data):
+    """
+    Compares parse time and peak memory with every config decoded (eager) against lazy decoding.
+    Each mode runs in its own process.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_path = os.path.join(tmp_dir, 'servers.csv')
+        with open(fixture_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(csv_data)
+        for mode, decode_all in (('eager_decode', True), ('lazy_decode', False)):
+            queue = ctx.Queue()
+            process = ctx.Process(target=_measure_parse, args=(fixture_path, decode_all, queue))
+            process.start()
+            results[mode] = queue.get()
+            process.join()
+    return results
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# Run in a fresh interpreter: from process start to the best server of one country,
+# either through a snapshot or by reading and parsing the list text.
+_CANDIDATE_FROM_SNAPSHOT = """
+from vpn_project.catalog_snapshot import CatalogSnapshot
+from vpn_project.server_catalog import ServerCatalog
+print(ServerCatalog.from_snapshot(CatalogSnapshot({path!r})).top_servers(1, {country!r})[0]['HostName'])
+"""
+_CANDIDATE_FROM_TEXT = """
+from vpn_project.server_catalog import ServerCatalog
+from vpn_project.vpngate_scraper import VPNGateScraper
+with open({path!r}, encoding='utf-8', newline='') as f:
+    servers = VPNGateScraper().parse_server_data(f.read())
+print(ServerCatalog(servers).top_servers(1, {country!r})[0]['HostName'])
+"""
+
+
+def bench_snapshot(csv_data, repeat=3, country='JP'):
+    """
+    Times writing a binary catalog snapshot, and the wall time of a new Python process that
+    prints the top server of a country from the snapshot versus from the list text.
+    """
+    servers = VPNGateScraper().parse_server_data(csv_data)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_path = os.path.join(tmp_dir, 'servers.csv')
+        snapshot_path = os.path.join(tmp_dir, 'servers.snapshot')
+        with open(text_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(csv_data)
+        _, write_seconds = _timed(write_snapshot, snapshot_path, servers)
+        results = {'servers': len(servers), 'write_seconds': write_seconds,
+                   'snapshot_bytes': os.path.getsize(snapshot_path)}
+        for name, code, path in (('process_to_candidate_snapshot', _CANDIDATE_FROM_SNAPSHOT, snapshot_path),
+                                 ('process_to_candidate_parse', _CANDIDATE_FROM_TEXT, text_path)):
+            command = [sys.executable, '-c', code.format(path=path, country=country)]
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(command, check=True, cwd=package_root, capture_output=True)
+                samples.append(time.perf_counter() - start)
+            results[name + '_seconds'] = summarize(samples)
+    return results
+
+
+def bench_rank(csv_data, k=10):
+    """
+    Times building the ranking columns, a top-k query over the whole list, and a batched
+    per-country top-k pass, against fully sorting the list with rank_key.
+    """
+    servers = VPNGateScraper().parse_server_data(csv_data)
+    engine, build_seconds = _timed(RankingEngine, servers)
+    _, top_k_seconds = _timed(engine.top_k, k)
+    _, by_country_seconds = _timed(engine.top_k_by_country, k)
+    _, full_sort_seconds = _timed(lambda: sorted((s for s in servers if rank_key(s) is not None), key=rank_key))
+    return {'servers': len(servers), 'k': k, 'build_columns_seconds': build_seconds,
+            'top_k_seconds': top_k_seconds, 'top_k_by_country_seconds': by_country_seconds,
+            'full_sort_seconds': full_sort_seconds}
+
+
+def summarize(samples):
+    """
+    Returns min/median/p90/max/mean of a list of timings (None entries are failures).
+    """
+    ok = sorted(v for v in samples if v is not None)
+    if not ok:
+        return {'count': 0, 'failures': len(samples)}
+    return {'count': len(ok), 'failures': len(samples) - len(ok), 'min': ok[0],
+            'median': statistics.median(ok), 'p90': ok[min(len(ok) - 1, int(len(ok) * 0.9))],
+            'max': ok[-1], 'mean': statistics.mean(ok)}
+
+
+def bench_select(csv_data, repeat=5):
+    """
+    Times building the catalog, listing countries, and select_server_from_list on every country.
+    """
+    servers = VPNGateScraper().parse_server_data(csv_data)
+    catalog, catalog_seconds = _timed(ServerCatalog, servers)
+    countries, countries_seconds = _timed(catalog.countries)
+    per_country = [catalog.servers_for_country(code) for _, code in countries]
+    samples = []
+    for _ in range(repeat):
+        _, seconds = _timed(lambda: [select_server_from_list(group) for group in per_country])
+        samples.append(seconds)
+    return {'servers': len(servers), 'countries': len(countries), 'build_catalog_seconds': catalog_seconds,
+            'countries_seconds': countries_seconds, 'select_all_countries_seconds': summarize(samples)}
+
+
+def bench_parse_scaling(csv_data, repeat=3, max_workers=None):
+    """
+    Times parse_server_data_parallel with 1, 2, 4, ... worker processes up to max_workers
+    (default: the usable CPU count) against the serial parse, on warm worker pools, and checks that
+    every run returns the same records as the serial path.
+    Besides the wall-clock speedup, each entry reports the CPU time spent in this process
+    (splitting the input, reading results, building records): that part does not parallelize,
+    so serial time over it bounds the speedup however many CPUs there are.
+    """
+    scraper = VPNGateScraper()
+    expected = [(s.get('HostName'), s.get('IP')) for s in dedupe_servers(scraper.parse_server_data(csv_data))]
+    serial = [_timed(scraper.parse_server_data, csv_data)[1] for _ in range(repeat)]
+    max_workers = max_workers or usable_cpu_count()
+    counts = sorted({min(1 << i, max_workers) for i in range(max_workers.bit_length() + 1)})
+    results = {'cpu_count': os.cpu_count(), 'usable_cpus': usable_cpu_count(), 'serial_seconds': summarize(serial),
+               'workers': {}}
+    for workers in counts:
+        with parse_executor(workers) as pool:
+            list(pool.map(abs, range(workers))) # Start the workers outside the timed runs
+            samples, parent_cpu, same = [], [], True
+            for _ in range(repeat):
+                cpu_started = time.process_time()
+                servers, seconds = _timed(scraper.parse_server_data_parallel, csv_data, workers, 1 << 16, pool)
+                parent_cpu.append(time.process_time() - cpu_started)
+                samples.append(seconds)
+                same = same and [(s.get('HostName'), s.get('IP')) for s in servers] == expected
+        timing = summarize(samples)
+        results['workers'][workers] = {'seconds': timing, 'matches_serial': same,
+                                       'speedup': statistics.median(serial) / timing['median'],
+                                       'parent_cpu_seconds': summarize(parent_cpu),
+                                       'speedup_bound': statistics.median(serial) / statistics.median(parent_cpu)}
+    if results['usable_cpus'] < 2:
+        results['note'] = "Only one usable CPU: workers share it with this process, so no wall-clock speedup is possible."
+    return results
+
+
+class _FixtureHandler(http.server.BaseHTTPRequestHandler):
+    body = b''
+    gzipped_body = b''
+
+    def do_GET(self):
+        body = self.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''): # Like the real API behind a compressing proxy
+            body = self.gzipped_body
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The streaming benchmark hangs up after the first record
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_fixture(csv_data):
+    # Local stand-in for the VPNGate API, so fetch timings need no network.
+    body = csv_data.encode('utf-8')
+    handler = type('FixtureHandler', (_FixtureHandler,), {'body': body, 'gzipped_body': gzip.compress(body)})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/iphone/"
+
+
+def bench_fetch(csv_data, url=None, repeat=3):
+    """
+    Times fetching the list (full download) and time-to-first-record when streaming.
+    Without url, a local HTTP server serves csv_data.
+    """
+    server = None
+    if url is None:
+        server, url = _serve_fixture(csv_data)
+    try:
+        scraper = VPNGateScraper(url)
+        fetch_samples, first_record_samples = [], []
+        for _ in range(repeat):
+            data, seconds = _timed(scraper.fetch_server_data)
+            fetch_samples.append(seconds if data else None)
+            start = time.perf_counter()
+            stream = scraper.iter_servers()
+            first = next(stream, None)
+            first_record_samples.append(time.perf_counter() - start if first is not None else None)
+            stream.close()
+        return {'url': url, 'fetch_seconds': summarize(fetch_samples),
+                'stream_first_record_seconds': summarize(first_record_samples)}
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+
+def bench_connect(ovpn_path, openvpn_path="openvpn", use_sudo=True, timeout=60, repeat=1, spawner=None):
+    """
+    Times OpenVPN from process start to "Initialization Sequence Completed".
+    With spawner (a SpawnerClient), OpenVPN is started through the helper instead of sudo, on a
+    copy of the config in the default ConfigStore (the only directory the helper starts configs from).
+    """
+    if spawner:
+        with open(ovpn_path, encoding='utf-8') as f:
+            ovpn_path = ConfigStore().put(f.read())
+    samples = []
+    for _ in range(repeat):
+        manager = OpenVPNManager(openvpn_path, use_sudo, spawner=spawner)
+        start = time.perf_counter()
+        manager.connect(ovpn_path)
+        connected = manager.wait_until_connected(timeout)
+        samples.append(time.perf_counter() - start if connected else None)
+        if manager.process:
+            manager.disconnect()
+    return {'config': ovpn_path, 'time_to_connected_seconds': summarize(samples)}
+
+
+def bench_tunnel(endpoint, throughput_url=None, samples=20, timeout=5.0):
+    """
+    Measures TCP connect RTT to endpoint ("host:port") and, if throughput_url is given,
+    download throughput from it. Run while the tunnel is up to measure through it.
+    """
+    host, _, port = endpoint.rpartition(':')
+    rtts = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        try:
+            with socket.create_connection((host, int(port)), timeout=timeout):
+                rtts.append(time.perf_counter() - start)
+        except OSError:
+            rtts.append(None)
+    report = {'endpoint': endpoint, 'rtt_seconds': summarize(rtts)}
+    if throughput_url:
+        start = time.perf_counter()
+        received = 0
+        try:
+            with urllib.request.urlopen(throughput_url, timeout=timeout) as response:
+                for chunk in iter(lambda: response.read(65536), b''):
+                    received += len(chunk)
+            elapsed = time.perf_counter() - start
+            report['throughput'] = {'url': throughput_url, 'bytes': received, 'seconds': elapsed,
+                                    'bytes_per_second': received / elapsed if elapsed > 0 else None}
+        except OSError as e:
+            report['throughput'] = {'url': throughput_url, 'error': str(e)}
+    return report
+
+
+class _EndpointHandler(http.server.BaseHTTPRequestHandler):
+    # GET /<n> streams n bytes (default 10 MB) for throughput measurements.
+    def do_GET(self):
+        try:
+            size = int(self.path.strip('/') or 10 * 1024 * 1024)
+        except ValueError:
+            size = 10 * 1024 * 1024
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        chunk = b'\0' * 65536
+        try:
+            while size > 0:
+                self.wfile.write(chunk[:size])
+                size -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the VPNGate client. Prints a JSON report.")
+    parser.add_argument('--suite', action='append', choices=['offline', 'scaling', 'fetch', 'connect', 'tunnel'],
+                        help="Benchmark groups to run (repeatable). Default: offline (parse, rank, select).")
+    parser.add_argument('--servers', type=int,
+                        help="Use a synthetic server list with this many rows instead of the bundled fixture.")
+    parser.add_argument('--fixture', help="Path to a recorded VPNGate server list (default: the bundled sample).")
+    parser.add_argument('--record', metavar='PATH', help="Download the live list from --url to PATH as a fixture and exit.")
+    parser.add_argument('--url', help="Server list URL for the fetch suite (default: a local server with the fixture).")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions for timed sections.")
+    parser.add_argument('--max-workers', type=int, help="Largest worker count for the scaling suite (default: CPU count).")
+    parser.add_argument('--config', help="ovpn file for the connect suite.")
+    parser.add_argument('--openvpn', default='openvpn', help="OpenVPN executable for the connect suite.")
+    parser.add_argument('--no-sudo', action='store_true', help="Run OpenVPN without sudo in the connect suite.")
+    parser.add_argument('--spawner', metavar='SOCKET', help="Start OpenVPN through the spawner helper on SOCKET in the connect suite.")
+    parser.add_argument('--endpoint', help="host:port for the tunnel suite's RTT measurement.")
+    parser.add_argument('--throughput-url', help="URL downloaded by the tunnel suite to measure throughput.")
+    parser.add_argument('--serve-endpoint', type=int, metavar='PORT',
+                        help="Run a local endpoint for the tunnel suite (GET /<bytes>) on PORT and block.")
+    parser.add_argument('--serve-host', default='127.0.0.1',
+                        help="Address for --serve-endpoint (default 127.0.0.1; give the tunnel address to reach it through a VPN).")
+    parser.add_argument('--output', help="Also write the JSON report to this file.")
+    args = parser.parse_args(argv)
+
+    if args.serve_endpoint:
+        server = http.server.ThreadingHTTPServer((args.serve_host, args.serve_endpoint), _EndpointHandler)
+        print(f"Serving benchmark endpoint on {args.serve_host}:{args.serve_endpoint} (GET /<bytes>). Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.record:
+        data = VPNGateScraper(args.url or VPNGateScraper().vpngate_url).fetch_server_data()
+        if not data:
+            raise SystemExit("Could not fetch the server list to record.")
+        with open(args.record, 'w', encoding='utf-8', newline='') as f:
+            f.write(data)
+        print(f"Recorded {len(data)} characters to {args.record}")
+        return
+
+    if args.servers and not args.fixture:
+        source = f"synthetic:{args.servers}"
+        csv_data = synthetic_server_list(args.servers)
+    else:
+        source = args.fixture or SAMPLE_FIXTURE
+        with open(source, encoding='utf-8', newline='') as f:
+            csv_data = f.read()
+
+    suites = args.suite or ['offline']
+    report = {'meta': {'timestamp': time.time(), 'python': platform.python_version(), 'platform': platform.platform(),
+                       'fixture': source, 'input_bytes': len(csv_data)}}
+    if 'offline' in suites:
+        report['parse'] = bench_parse(csv_data)
+        report['snapshot'] = bench_snapshot(csv_data, args.repeat)
+        report['rank'] = bench_rank(csv_data)
+        report['select'] = bench_select(csv_data, args.repeat)
+    if 'scaling' in suites:
+        # The bundled sample is far too small to spread across processes; scale a large synthetic list instead.
+        if args.fixture or args.servers:
+            scaling_data, report['meta']['scaling_fixture'] = csv_data, source
+        else:
+            scaling_data = synthetic_server_list(SCALING_SERVERS)
+            report['meta']['scaling_fixture'] = f"synthetic:{SCALING_SERVERS}"
+        report['parse_scaling'] = bench_parse_scaling(scaling_data, args.repeat, args.max_workers)
+    if 'fetch' in suites:
+        report['fetch'] = bench_fetch(csv_data, args.url, args.repeat)
+    if 'connect' in suites:
+        if not args.config:
+            parser.error("the connect suite needs --config")
+        spawner = SpawnerClient(args.spawner) if args.spawner else None
+        report['connect'] = bench_connect(args.config, args.openvpn, not args.no_sudo, repeat=args.repeat,
+                                          spawner=spawner)
+    if 'tunnel' in suites:
+        if not args.endpoint:
+            parser.error("the tunnel suite needs --endpoint")
+        report['tunnel'] = bench_tunnel(args.endpoint, args.throughput_url)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from .server_ranking import ServerColumns
+from .server_record import CONFIG_FIELD, ServerRecord, field_index
+
+# File layout (little-endian), every section 8-byte aligned:
+#   header           magic, version, row/field/string counts, the digest of the source list, then the
+#                    offset of each section below
+#   field names      n_fields string ids
+#   numeric columns  speed, ping, score, sessions, uptime: n_rows float64 each (NaN where missing)
+#   cells            per field, n_rows string ids (column-major; NO_STRING for a missing value)
+#   string index     n_strings + 1 uint64 offsets into the string data (each distinct string once)
+#   string data      UTF-8
+#   blob index       n_rows + 1 uint64 offsets into the blob data
+#   blob data        each row's still-encoded ovpn config
+MAGIC = b'VPNSNAP\0'
+VERSION = 2
+HEADER = struct.Struct('<8sIIII20s4x7Q')
+NO_SOURCE = b'\0' * 20
+NO_STRING = 0xFFFFFFFF
+NUMERIC_COLUMNS = ('speed', 'ping', 'score', 'num_vpn_sessions', 'uptime')
+NAN = float('nan')
+
+
+def _padded(data):
+    return data + b'\0' * (-len(data) % 8)
+
+
+def write_snapshot(path, servers, source=None):
+    """
+    Writes servers (ServerRecords or server dictionaries) to path as a binary snapshot, atomically.
+    Columns are those of the first server plus any further ones that later servers have.
+    source is the SHA-1 hex digest of the list the servers were parsed from (see snapshot_source()).
+    """
+    records = [s if isinstance(s, ServerRecord) else ServerRecord.from_dict(s) for s in servers]
+    names = []
+    seen_indexes = set()
+    for record in records:
+        if id(record._fields) not in seen_indexes: # Records of one parse share one field index
+            seen_indexes.add(id(record._fields))
+            names += [name for name in record._fields if name not in names]
+    fields = field_index(names)
+    config_column = fields.get(CONFIG_FIELD)
+
+    strings = {}
+    def string_id(value):
+        if value is None:
+            return NO_STRING
+        i = strings.get(value)
+        if i is None:
+            i = strings[value] = len(strings)
+        return i
+
+    cells = [array('I') for _ in names]
+    numeric = [array('d') for _ in NUMERIC_COLUMNS]
+    blob_offsets = array('Q', [0])
+    blobs = []
+    same_layout = {} # id(field index) -> whether its columns are exactly `names`, in order
+    for record in records:
+        layout = same_layout.get(id(record._fields))
+        if layout is None:
+            layout = same_layout[id(record._fields)] = list(record._fields) == names
+        values = record._values if layout else [record.get(name) if name in record._fields else None
+                                                for name in names]
+        for i, value in enumerate(values):
+            if i == config_column:
+                blob = (value or '').encode('utf-8', errors='surrogatepass')
+                blobs.append(blob)
+                blob_offsets.append(blob_offsets[-1] + len(blob))
+                cells[i].append(NO_STRING if value is None else 0)
+            else:
+                cells[i].append(string_id(value))
+        if config_column is None:
+            blob_offsets.append(blob_offsets[-1])
+        for column, name in zip(numeric, NUMERIC_COLUMNS):
+            value = getattr(record, name)
+            column.append(NAN if value is None else value)
+
+    name_ids = array('I', (string_id(name) for name in names))
+    encoded = [value.encode('utf-8', errors='surrogatepass') for value in strings]
+    string_offsets = array('Q', [0])
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+    if sys.byteorder != 'little':
+        for column in [name_ids, string_offsets, blob_offsets] + cells + numeric:
+            column.byteswap()
+
+    sections = [_padded(name_ids.tobytes()), b''.join(column.tobytes() for column in numeric),
+                _padded(b''.join(column.tobytes() for column in cells)), string_offsets.tobytes(),
+                _padded(b''.join(encoded)), blob_offsets.tobytes(), b''.join(blobs)]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(records), len(names), len(strings),
+                                bytes.fromhex(source) if source else NO_SOURCE, *offsets))
+            for section in sections:
+                f.write(section)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def snapshot_source(path):
+    """
+    Returns the source digest stored in the snapshot at path (reading only its header),
+    or None if the file is missing, not a snapshot of this version, or has no source.
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic, version, _, _, _, source = HEADER.unpack(f.read(HEADER.size))[:6]
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION or source == NO_SOURCE:
+        return None
+    return source.hex()
+
+
+class SnapshotRecords:
+    """
+    The rows of a CatalogSnapshot as a read-only sequence of ServerRecords. A record is built
+    from the mapped file on first access and then kept, so every access returns the same object.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._records = [None] * len(snapshot)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        record = self._records[i]
+        if record is None:
+            record = self._records[i] = self._snapshot.record(i)
+        return record
+
+    def __iter__(self):
+        for i in range(len(self._records)):
+            yield self[i]
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        """
+        Opens a snapshot written by write_snapshot() with mmap. Only the header is read here:
+        numeric columns, strings and configs are read from the mapping when they are used,
+        so ranking needs no records and a record costs one row's strings.
+        Raises ValueError if the file is not a readable snapshot.
+        """
+        self.path = path
+        self.fetched_at = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if sys.byteorder != 'little':
+                raise ValueError("snapshots are only read on little-endian hosts")
+            if len(self._map) < HEADER.size:
+                raise ValueError("file is too short")
+            (magic, version, self._rows, self._field_count, string_count, source, fields_at, numeric_at,
+             cells_at, string_index_at, strings_at, blob_index_at, blobs_at) = HEADER.unpack_from(self._map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a server list snapshot of this version")
+            if blob_index_at + 8 * (self._rows + 1) > len(self._map):
+                raise ValueError("file is truncated")
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+        view = memoryview(self._map)
+        self._view = view
+        self.source = None if source == NO_SOURCE else source.hex() # See write_snapshot()
+        self._numeric_at = numeric_at
+        self._cells = [view[cells_at + 4 * self._rows * i:cells_at + 4 * self._rows * (i + 1)].cast('I')
+                       for i in range(self._field_count)]
+        self._string_index = view[string_index_at:string_index_at + 8 * (string_count + 1)].cast('Q')
+        self._strings_at = strings_at
+        self._string_cache = {}
+        self._blob_index = view[blob_index_at:blob_index_at + 8 * (self._rows + 1)].cast('Q')
+        self._blobs_at = blobs_at
+        names = view[fields_at:fields_at + 4 * self._field_count].cast('I')
+        self.fields = field_index([self._string(i) for i in names]) # Shared by every record
+        self._config_column = self.fields.get(CONFIG_FIELD)
+        self._records = None
+
+    def __len__(self):
+        return self._rows
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def close(self):
+        """
+        Releases the mapping. Records already built stay usable; unread ones cannot be read any more.
+        """
+        for view in self._cells + [self._string_index, self._blob_index, self._view]:
+            view.release()
+        self._map.close()
+
+    def _string(self, i):
+        if i == NO_STRING:
+            return None
+        value = self._string_cache.get(i)
+        if value is None:
+            start, end = self._string_index[i], self._string_index[i + 1]
+            value = self._string_cache[i] = str(self._view[self._strings_at + start:self._strings_at + end],
+                                                'utf-8', 'surrogatepass')
+        return value
+
+    def column(self, name):
+        """
+        Returns a column as a list of strings (None where missing), e.g. column('CountryShort').
+        """
+        i = self.fields[name]
+        if i == self._config_column:
+            return [self._config(row) for row in range(self._rows)]
+        return [self._string(string_id) for string_id in self._cells[i]]
+
+    def numeric(self, name):
+        """
+        Returns one of NUMERIC_COLUMNS as an array('d'), NaN where missing.
+        """
+        start = self._numeric_at + 8 * self._rows * NUMERIC_COLUMNS.index(name)
+        values = array('d')
+        values.frombytes(self._view[start:start + 8 * self._rows])
+        return values
+
+    def _config(self, row):
+        if self._cells[self._config_column][row] == NO_STRING:
+            return None
+        start, end = self._blob_index[row], self._blob_index[row + 1]
+        return str(self._view[self._blobs_at + start:self._blobs_at + end], 'utf-8', 'surrogatepass')
+
+    def record(self, row):
+        """
+        Builds a new ServerRecord for one row.
+        """
+        values = [self._config(row) if i == self._config_column else self._string(cells[row])
+                  for i, cells in enumerate(self._cells)]
+        return ServerRecord(self.fields, values)
+
+    def records(self):
+        """
+        Returns the SnapshotRecords sequence of this snapshot (one per snapshot).
+        """
+        if self._records is None:
+            self._records = SnapshotRecords(self)
+        return self._records
+
+    def columns(self):
+        """
+        Returns ServerColumns for ranking, read straight from the numeric section.
+        """
+        country = self._cells[self.fields['CountryShort']] if 'CountryShort' in self.fields else [NO_STRING] * self._rows
+        lowered = {}
+        for string_id in set(country):
+            lowered[string_id] = (self._string(string_id) or '').lower()
+        speed, ping, score, sessions, uptime = (self.numeric(name) for name in NUMERIC_COLUMNS)
+        return ServerColumns.from_arrays(self.records(), speed, ping, score, sessions, uptime,
+                                         [lowered[string_id] for string_id in country])
+
+    def rows_for_country(self, country_short):
+        """
+        Returns the row numbers of the servers of a short country code (case-insensitive).
+        """
+        if 'CountryShort' not in self.fields:
+            return []
+        wanted = country_short.lower()
+        cells = self._cells[self.fields['CountryShort']]
+        ids = {string_id for string_id in set(cells) if (self._string(string_id) or '').lower() == wanted}
+        return [row for row, string_id in enumerate(cells) if string_id in ids]
+
+    def countries(self):
+        """
+        Returns a sorted list of unique (CountryLong, CountryShort) tuples, like ServerCatalog.countries().
+        """
+        if 'CountryLong' not in self.fields or 'CountryShort' not in self.fields:
+            return []
+        pairs = set(zip(self._cells[self.fields['CountryLong']], self._cells[self.fields['CountryShort']]))
+        countries = {(self._string(long_id), self._string(short_id)) for long_id, short_id in pairs}
+        return sorted(((l, s) for l, s in countries if l and s), key=lambda x: x[0])
@@ -0,0 +1,258 @@
+import random
+import socket
+import threading
+import time
+
+from .openvpn_log import STATE_EXITED
+from .ovpn_config import ConfigStore
+from .server_record import server_key
+
+
+def tcp_health_check(host="1.1.1.1", port=443, timeout=3.0):
+    """
+    Returns a health check that opens a TCP connection to host:port. Once the tunnel is up and
+    routes through it, this probes connectivity through the tunnel.
+    """
+    def check():
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+    return check
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=2, reset_timeout=300.0):
+        """
+        Per-server breaker: opens after failure_threshold consecutive failures, and lets one
+        trial attempt through (half-open) once reset_timeout seconds have passed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self, now=None):
+        if self.opened_at is None:
+            return True
+        now = time.monotonic() if now is None else now
+        return now - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self, now=None):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic() if now is None else now
+
+
+class FailoverSupervisor:
+    def __init__(self, manager, catalog, country_short=None, standby_size=5, race_width=2,
+                 health_check=None, health_interval=10.0, health_failures=2, connect_timeout=30.0,
+                 backoff_initial=1.0, backoff_max=60.0, failure_threshold=2, breaker_reset=300.0,
+                 config_dir=None, on_event=None, config_store=None, scorer=None):
+        """
+        Keeps a tunnel up on an OpenVPNManager. It watches the OpenVPN process and a periodic
+        health check, and on failure switches to the next server of a warm, pre-ranked standby
+        list (from catalog, a ServerCatalog), racing race_width candidates at a time.
+        Each candidate is bounded by connect_timeout; servers that keep failing are skipped by
+        their circuit breaker, and a pass with no success backs off exponentially (with jitter)
+        between backoff_initial and backoff_max seconds.
+        on_event(name, details) is called for 'connected', 'failed', 'unhealthy', 'vanished' and 'backoff'.
+        While running it follows catalog updates: the standby list is re-ranked, and if the current
+        server leaves the list ('vanished') the tunnel is switched to another server.
+        Server configs come from config_store (a ConfigStore; by default the shared one, or one at config_dir).
+        scorer is an optional server_ranking scorer for the standby list (e.g. HistoryStore.scorer()).
+        """
+        self.manager = manager
+        self.catalog = catalog
+        self.country_short = country_short
+        self.standby_size = standby_size
+        self.race_width = max(1, race_width)
+        self.health_check = health_check
+        self.health_interval = health_interval
+        self.health_failures = health_failures
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.breaker_reset = breaker_reset
+        self.on_event = on_event
+        self.scorer = scorer
+        self.config_store = config_store or ConfigStore(config_dir)
+        self.breakers = {}
+        self.standby = []
+        self.current_server = None
+        self.last_recovery_seconds = None # Time from detecting a failure to being connected again
+        self._stop = threading.Event()
+        self._vanished = threading.Event() # Set when the current server is removed from the catalog
+        self._thread = None
+        self.refresh_standby()
+
+    def _emit(self, name, **details):
+        if self.on_event:
+            self.on_event(name, details)
+
+    def _breaker(self, server):
+        key = server_key(server)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(self.failure_threshold, self.breaker_reset)
+        return breaker
+
+    def refresh_standby(self, catalog=None):
+        """
+        Re-ranks the standby list from the catalog (optionally a newer one).
+        """
+        if catalog is not None and catalog is not self.catalog:
+            if self._thread:
+                self.catalog.unsubscribe(self._on_catalog_event)
+                catalog.subscribe(self._on_catalog_event)
+            self.catalog = catalog
+        self.standby = self.catalog.top_servers(self.standby_size, self.country_short, scorer=self.scorer)
+
+    def _on_catalog_event(self, name, details):
+        if name == 'updated' and any(details.values()):
+            self.refresh_standby()
+        elif name == 'removed' and self.current_server is not None \
+                and server_key(details['server']) == server_key(self.current_server):
+            self._vanished.set()
+
+    def _candidates(self):
+        now = time.monotonic()
+        current = server_key(self.current_server) if self.current_server else None
+        return [s for s in self.standby if server_key(s) != current and self._breaker(s).allow(now)]
+
+    def _connect_any(self):
+        """
+        Tries the standby candidates in rank order, race_width at a time.
+        Returns True once one of them is connected.
+        """
+        candidates = self._candidates()
+        if not candidates and self.current_server is not None:
+            candidates = [self.current_server] # Nothing else left: retry the last server
+        for start in range(0, len(candidates), self.race_width):
+            if self._stop.is_set():
+                return False
+            batch = []
+            paths = {}
+            for server in candidates[start:start + self.race_width]:
+                path = self.config_store.path_for_server(server)
+                if path:
+                    batch.append(path)
+                    paths[path] = server
+                else:
+                    self._breaker(server).record_failure()
+            if not batch:
+                continue
+            race_started = time.monotonic()
+            winner = self.manager.connect_race(batch, stagger=self.connect_timeout / (len(batch) + 1),
+                                               timeout=self.connect_timeout)
+            for path, server in paths.items():
+                if path == winner:
+                    self._breaker(server).record_success()
+                else:
+                    self._breaker(server).record_failure()
+                    self._emit('failed', server=server)
+            if winner:
+                self.current_server = paths[winner]
+                self._emit('connected', server=self.current_server,
+                           time_to_connected=time.monotonic() - race_started)
+                return True
+        return False
+
+    def _healthy(self):
+        if not self.manager.process or self.manager.state == STATE_EXITED:
+            return False
+        if self.manager.process.poll() is not None:
+            return False
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check())
+        except Exception as e:
+            print(f"Health check raised an error: {e}")
+            return False
+
+    def _recover(self):
+        """
+        Switches to a working server, backing off between passes until one connects or stop() is called.
+        """
+        failed_at = time.monotonic()
+        if self.manager.process:
+            self.manager.disconnect()
+        self.refresh_standby() # A history scorer may rank differently after the outcomes just recorded
+        backoff = self.backoff_initial
+        while not self._stop.is_set():
+            if self._connect_any():
+                self.last_recovery_seconds = time.monotonic() - failed_at
+                return True
+            self.refresh_standby()
+            delay = min(self.backoff_max, backoff) * random.uniform(0.5, 1.0)
+            self._emit('backoff', seconds=delay)
+            print(f"No standby server connected; retrying in {delay:.1f}s.")
+            self._stop.wait(delay)
+            backoff = min(self.backoff_max, backoff * 2)
+        return False
+
+    def run(self):
+        """
+        Supervises until stop() is called (blocking).
+        """
+        consecutive_failures = 0
+        if not self.manager.connected:
+            self._recover()
+        while not self._stop.is_set():
+            # Wake early if the process exits; otherwise check health every health_interval seconds.
+            if self.manager.log_pump:
+                self.manager.log_pump.wait_for_state([STATE_EXITED], self.health_interval)
+            else:
+                self._stop.wait(self.health_interval)
+            if self._stop.is_set():
+                break
+            if self._vanished.is_set():
+                self._vanished.clear()
+                print(f"Server {server_key(self.current_server)} is no longer listed; switching servers.")
+                self._emit('vanished', server=self.current_server)
+                self.current_server = None
+                consecutive_failures = 0
+                self.refresh_standby()
+                self._recover()
+                continue
+            if self._healthy():
+                consecutive_failures = 0
+                continue
+            consecutive_failures += 1
+            process_gone = not self.manager.process or self.manager.process.poll() is not None
+            if process_gone or consecutive_failures >= self.health_failures:
+                self._emit('unhealthy', server=self.current_server)
+                if self.current_server is not None:
+                    self._breaker(self.current_server).record_failure()
+                consecutive_failures = 0
+                self._recover()
+
+    def start(self):
+        """
+        Starts supervising in a daemon thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.catalog.subscribe(self._on_catalog_event)
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self, disconnect=True):
+        """
+        Stops supervising and, by default, disconnects the tunnel.
+        """
+        self._stop.set()
+        self.catalog.unsubscribe(self._on_catalog_event)
+        if self._thread:
+            self._thread.join(timeout=self.connect_timeout + 5)
+            self._thread = None
+        if disconnect and self.manager.process:
+            self.manager.disconnect()
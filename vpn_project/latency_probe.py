@@ -0,0 +1,158 @@
+import asyncio
+import os
+import struct
+import time
+
+DEFAULT_PORT = 1194
+DEFAULT_PROTO = 'udp'
+
+# OpenVPN P_CONTROL_HARD_RESET_CLIENT_V2 (opcode 7, key id 0). A server without tls-auth answers
+# with P_CONTROL_HARD_RESET_SERVER_V2, which makes a cheap UDP round-trip measurement.
+_HARD_RESET_CLIENT_V2 = 7 << 3
+
+
+def parse_remotes(ovpn_config):
+    """
+    Returns the (host, port, proto) endpoints from the 'remote' lines of an ovpn config,
+    in order. proto is 'tcp' or 'udp', taken from the remote line or the 'proto' directive.
+    """
+    if not ovpn_config:
+        return []
+    default_proto = DEFAULT_PROTO
+    remotes = []
+    for line in ovpn_config.splitlines():
+        parts = line.split()
+        if not parts or parts[0].startswith(('#', ';')):
+            continue
+        if parts[0] == 'proto' and len(parts) > 1:
+            default_proto = parts[1]
+        elif parts[0] == 'remote' and len(parts) > 1:
+            try:
+                port = int(parts[2]) if len(parts) > 2 else None
+            except ValueError:
+                continue
+            remotes.append((parts[1], port, parts[3] if len(parts) > 3 else None))
+    # 'proto' may appear after the remote lines, so apply the default once everything is read.
+    return [(host, port or DEFAULT_PORT, _normalize_proto(proto or default_proto))
+            for host, port, proto in remotes]
+
+
+def _normalize_proto(proto):
+    # tcp-client, tcp4, udp6, ... -> tcp / udp
+    return 'tcp' if proto.startswith('tcp') else 'udp'
+
+
+async def probe_tcp(host, port, timeout):
+    """
+    Returns the TCP connect time to host:port in seconds, or None if it fails or times out.
+    """
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    rtt = time.perf_counter() - start
+    writer.close()
+    return rtt
+
+
+class _FirstReply(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(time.perf_counter())
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+async def probe_udp(host, port, timeout):
+    """
+    Sends an OpenVPN client hard-reset packet to host:port and returns the time until the first
+    reply in seconds, or None if nothing comes back in time.
+    """
+    loop = asyncio.get_running_loop()
+    reply = loop.create_future()
+    try:
+        transport, _ = await asyncio.wait_for(
+            loop.create_datagram_endpoint(lambda: _FirstReply(reply), remote_addr=(host, port)), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        # opcode/key id, 8-byte session id, empty ack array, packet id 0
+        packet = struct.pack('!B8sBI', _HARD_RESET_CLIENT_V2, os.urandom(8), 0, 0)
+        start = time.perf_counter()
+        transport.sendto(packet)
+        replied_at = await asyncio.wait_for(reply, timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        transport.close()
+    return None if replied_at is None else replied_at - start
+
+
+async def probe_server(server, timeout=2.0):
+    """
+    Measures the RTT to the first remote in the server's ovpn config (falling back to its IP
+    on the default port). Returns seconds, or None if unreachable.
+    """
+    remotes = parse_remotes(server.get('ovpn_config'))
+    if remotes:
+        host, port, proto = remotes[0]
+    elif server.get('IP'):
+        host, port, proto = server.get('IP'), DEFAULT_PORT, DEFAULT_PROTO
+    else:
+        return None
+    if proto == 'tcp':
+        return await probe_tcp(host, port, timeout)
+    return await probe_udp(host, port, timeout)
+
+
+async def probe_servers(servers, concurrency=8, timeout=2.0, deadline=5.0):
+    """
+    Probes servers concurrently (at most `concurrency` at a time, each bounded by `timeout`) and
+    stops everything still running once `deadline` seconds have passed.
+    Returns a list of RTTs in seconds (None for unreachable or unfinished) matching servers.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(server):
+        async with semaphore:
+            return await probe_server(server, timeout)
+
+    tasks = [asyncio.ensure_future(bounded(server)) for server in servers]
+    if not tasks:
+        return []
+    await asyncio.wait(tasks, timeout=deadline)
+    results = []
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception() is None:
+            results.append(task.result())
+        else:
+            task.cancel()
+            results.append(None)
+    return results
+
+
+async def rank_by_latency_async(servers, concurrency=8, timeout=2.0, deadline=5.0, drop_unreachable=False):
+    """
+    Coroutine version of rank_by_latency, for callers already running an event loop.
+    """
+    servers = list(servers)
+    rtts = await probe_servers(servers, concurrency, timeout, deadline)
+    measured = sorted(((rtt, i) for i, rtt in enumerate(rtts) if rtt is not None))
+    ranked = [(servers[i], rtt) for rtt, i in measured]
+    if not drop_unreachable:
+        ranked.extend((server, None) for server, rtt in zip(servers, rtts) if rtt is None)
+    return ranked
+
+
+def rank_by_latency(servers, concurrency=8, timeout=2.0, deadline=5.0, drop_unreachable=False):
+    """
+    Probes the candidate servers and returns (server, rtt_seconds) pairs ordered by measured RTT.
+    Unreachable servers (rtt None) follow in their original order unless drop_unreachable is set.
+    """
+    return asyncio.run(rank_by_latency_async(servers, concurrency, timeout, deadline, drop_unreachable))
@@ -0,0 +1,223 @@
+import threading
+
+# Default histogram buckets in seconds: sub-millisecond parse/select steps up to minute-long connects.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def report_timing(hook, stage, seconds, **details):
+    """
+    Calls an on_timing hook as hook(stage, seconds, details). A failing hook is reported and
+    otherwise ignored, so instrumentation can never break the code being measured.
+    """
+    if hook is None:
+        return
+    try:
+        hook(stage, seconds, details)
+    except Exception as e:
+        print(f"Timing hook failed for stage '{stage}': {e}")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += self._render_samples(items)
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def replace(self, samples):
+        """
+        Replaces every sample at once with samples, a list of (labels dict, value).
+        """
+        with self._lock:
+            self._values = {self._key(labels): value for labels, value in samples}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        """
+        The client's metrics in Prometheus text format. Pass timing_hook as the on_timing argument
+        of VPNGateScraper, select_server_from_list and OpenVPNManager, and track_manager() for tunnel
+        gauges; render() (or serve()) exposes everything.
+        """
+        self.fetch_seconds = Histogram('vpn_fetch_duration_seconds', "Server list download time.", ['result'])
+        self.parse_seconds = Histogram('vpn_parse_duration_seconds', "Server list parse time (streamed parses include download time).")
+        self.rows_parsed = Counter('vpn_rows_parsed_total', "Server list rows turned into records.")
+        self.rows_skipped = Counter('vpn_rows_skipped_total', "Server list rows skipped.", ['reason'])
+        self.select_seconds = Histogram('vpn_select_duration_seconds', "Server selection time.")
+        self.connect_seconds = Histogram('vpn_time_to_connected_seconds', "Time from starting OpenVPN to a connected tunnel.")
+        self.connect_attempts = Counter('vpn_connect_attempts_total', "OpenVPN connection attempts by outcome.", ['result'])
+        self.reconnects = Counter('vpn_reconnects_total', "Completed tunnel reconnects (OpenVPN restarts and soft reconnects).")
+        self.tunnel_state = Gauge('vpn_tunnel_state', "1 for the current state of each tracked tunnel.", ['tunnel', 'state'])
+        self.tunnel_bytes = Gauge('vpn_tunnel_bytes', "Bytes through each tracked tunnel (management interface).", ['tunnel', 'direction'])
+        self.tunnel_rate = Gauge('vpn_tunnel_rate_bytes_per_second', "Current throughput of each tracked tunnel.", ['tunnel', 'direction'])
+        self._metrics = [self.fetch_seconds, self.parse_seconds, self.rows_parsed, self.rows_skipped,
+                         self.select_seconds, self.connect_seconds, self.connect_attempts, self.reconnects,
+                         self.tunnel_state, self.tunnel_bytes, self.tunnel_rate]
+        self._managers = {} # tunnel name -> manager, read on every render
+        self._lock = threading.Lock()
+
+    def timing_hook(self, stage, seconds, details):
+        """
+        on_timing hook: records one stage report into the matching metrics.
+        """
+        if stage == 'fetch':
+            self.fetch_seconds.observe(seconds, result=details.get('result', 'ok'))
+        elif stage == 'parse':
+            self.parse_seconds.observe(seconds)
+            self.rows_parsed.inc(details.get('rows', 0))
+            for reason in ('no_config', 'filtered', 'error', 'duplicate'):
+                if details.get(reason):
+                    self.rows_skipped.inc(details[reason], reason=reason)
+        elif stage == 'select':
+            self.select_seconds.observe(seconds)
+        elif stage == 'connect':
+            self.connect_seconds.observe(seconds)
+            self.connect_attempts.inc(result='connected')
+        elif stage == 'connect_failed':
+            self.connect_attempts.inc(result='failed')
+        elif stage == 'reconnect':
+            self.reconnects.inc()
+
+    def track_manager(self, manager, name='default'):
+        """
+        Exposes the state and traffic of an OpenVPNManager (or AsyncOpenVPNManager) as gauges.
+        """
+        with self._lock:
+            self._managers[name] = manager
+
+    def untrack_manager(self, name):
+        with self._lock:
+            self._managers.pop(name, None)
+
+    def _collect_managers(self):
+        with self._lock:
+            managers = list(self._managers.items())
+        states, totals, rates = [], [], []
+        for name, manager in managers:
+            states.append(({'tunnel': name, 'state': manager.state or 'DISCONNECTED'}, 1))
+            stats = manager.traffic_stats()
+            if stats:
+                for direction in ('in', 'out'):
+                    totals.append(({'tunnel': name, 'direction': direction}, stats[f'bytes_{direction}']))
+                    rates.append(({'tunnel': name, 'direction': direction}, stats[f'rate_{direction}']))
+        self.tunnel_state.replace(states)
+        self.tunnel_bytes.replace(totals)
+        self.tunnel_rate.replace(rates)
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        self._collect_managers()
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=9464):
+        """
+        Serves GET /metrics on host:port from a daemon thread. Returns the HTTP server (call shutdown() to stop).
+        """
+        import http.server # Imported here: most users of timing hooks never serve metrics
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
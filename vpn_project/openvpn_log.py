@@ -0,0 +1,132 @@
+import collections
+import threading
+import time
+
+# Connection states, in the order a successful connection goes through them.
+STATE_CONNECTING = "CONNECTING"
+STATE_AUTH = "AUTH"
+STATE_ASSIGN_IP = "ASSIGN_IP"
+STATE_CONNECTED = "CONNECTED"
+STATE_RECONNECTING = "RECONNECTING"
+STATE_EXITED = "EXITED"
+
+# OpenVPN log fragments that mark a state transition, checked in order.
+_STATE_MARKERS = (
+    ("Initialization Sequence Completed", STATE_CONNECTED),
+    ("SIGUSR1[", STATE_RECONNECTING),
+    ("SIGHUP[", STATE_RECONNECTING),
+    ("Restart pause", STATE_RECONNECTING),
+    ("Connection reset, restarting", STATE_RECONNECTING),
+    ("Inactivity timeout", STATE_RECONNECTING),
+    ("PUSH: Received control message", STATE_ASSIGN_IP),
+    ("TUN/TAP device", STATE_ASSIGN_IP),
+    ("net_addr_v4_add", STATE_ASSIGN_IP),
+    ("/sbin/ip addr add", STATE_ASSIGN_IP),
+    ("TLS: Initial packet from", STATE_AUTH),
+    ("VERIFY OK", STATE_AUTH),
+    ("Peer Connection Initiated", STATE_AUTH),
+    ("Attempting to establish TCP connection", STATE_CONNECTING),
+    ("UDP link remote", STATE_CONNECTING),
+    ("TCP connection established", STATE_CONNECTING),
+)
+
+
+def state_for_line(line):
+    """
+    Returns the connection state an OpenVPN log line moves to, or None if it is not a state line.
+    """
+    for marker, state in _STATE_MARKERS:
+        if marker in line:
+            return state
+    return None
+
+
+def next_state(current, state):
+    """
+    Returns the state to move to from current when state is reported, or None to stay.
+    EXITED is final, and reconnect attempts stay RECONNECTING until authentication resumes.
+    A connected tunnel only goes back through the handshake states after RECONNECTING: TLS
+    renegotiation (hourly by default) logs the same handshake lines while the tunnel stays up.
+    """
+    if state == current or current == STATE_EXITED:
+        return None
+    if state == STATE_CONNECTING and current == STATE_RECONNECTING:
+        return None
+    if current == STATE_CONNECTED and state in (STATE_CONNECTING, STATE_AUTH, STATE_ASSIGN_IP):
+        return None
+    return state
+
+
+class OpenVPNLogPump:
+    def __init__(self, process, max_lines=500, on_state=None):
+        """
+        Drains an OpenVPN process's stdout and stderr (text mode) in background threads so the
+        pipes never fill, keeps the last max_lines lines in a ring buffer, and tracks the
+        connection state from them. on_state(state) is called from a reader thread on every
+        state change. The state becomes EXITED once the process has exited.
+        """
+        self.process = process
+        self.lines = collections.deque(maxlen=max_lines)
+        self.state = STATE_CONNECTING
+        self.state_changed_at = time.monotonic()
+        self.on_state = on_state
+        self._condition = threading.Condition()
+        streams = [s for s in (process.stdout, process.stderr) if s is not None]
+        self._open_streams = len(streams)
+        self._threads = [threading.Thread(target=self._read, args=(stream,), daemon=True) for stream in streams]
+        for thread in self._threads:
+            thread.start()
+        if not streams:
+            threading.Thread(target=self._wait_for_exit, daemon=True).start()
+
+    def _read(self, stream):
+        try:
+            for line in stream:
+                line = line.rstrip('\r\n')
+                with self._condition:
+                    self.lines.append(line)
+                state = state_for_line(line)
+                if state is not None:
+                    self.set_state(state)
+        except (OSError, ValueError):
+            pass # Stream closed underneath us
+        with self._condition:
+            self._open_streams -= 1
+            last_stream = self._open_streams == 0
+        if last_stream:
+            self._wait_for_exit()
+
+    def _wait_for_exit(self):
+        self.process.wait()
+        self.set_state(STATE_EXITED)
+
+    def set_state(self, state):
+        """
+        Moves to state (e.g. from a management-interface event) as next_state() allows.
+        """
+        with self._condition:
+            state = next_state(self.state, state)
+            if state is None:
+                return
+            self.state = state
+            self.state_changed_at = time.monotonic()
+            self._condition.notify_all()
+        if self.on_state:
+            self.on_state(state)
+
+    def wait_for_state(self, states, timeout=None):
+        """
+        Blocks until the state is one of states (or EXITED), or timeout seconds pass.
+        Returns the state at that moment.
+        """
+        states = set(states) | {STATE_EXITED}
+        with self._condition:
+            self._condition.wait_for(lambda: self.state in states, timeout)
+            return self.state
+
+    def tail(self, n=20):
+        """
+        Returns the last n log lines.
+        """
+        with self._condition:
+            return list(self.lines)[-n:]
@@ -0,0 +1,230 @@
+import asyncio
+import collections
+import os
+import tempfile
+import threading
+import time
+
+from .openvpn_log import STATE_ASSIGN_IP, STATE_AUTH, STATE_CONNECTED, STATE_CONNECTING, STATE_RECONNECTING
+
+# Management-interface state names -> connection states tracked by OpenVPNLogPump.
+# EXITING is left out: the process exit itself marks a tunnel EXITED.
+MANAGEMENT_STATES = {
+    'CONNECTING': STATE_CONNECTING,
+    'RESOLVE': STATE_CONNECTING,
+    'TCP_CONNECT': STATE_CONNECTING,
+    'WAIT': STATE_CONNECTING,
+    'AUTH': STATE_AUTH,
+    'GET_CONFIG': STATE_AUTH,
+    'ASSIGN_IP': STATE_ASSIGN_IP,
+    'ADD_ROUTES': STATE_ASSIGN_IP,
+    'CONNECTED': STATE_CONNECTED,
+    'RECONNECTING': STATE_RECONNECTING,
+}
+
+
+class ManagementError(Exception):
+    """Raised when OpenVPN answers a management command with ERROR."""
+
+
+def private_socket_path():
+    """
+    Returns a path for a management socket (openvpn --management <path> unix) inside a new
+    directory only the current user can enter (0700), so no other local user can reach it.
+    OpenVPN creates the socket itself; remove_socket_path() deletes it and the directory.
+    """
+    return os.path.join(tempfile.mkdtemp(prefix='vpn_project-management-'), 'management.sock')
+
+
+def remove_socket_path(path):
+    if not path:
+        return
+    for remove, target in ((os.unlink, path), (os.rmdir, os.path.dirname(path))):
+        try:
+            remove(target)
+        except OSError:
+            pass
+
+
+class ManagementClient:
+    def __init__(self, path, on_state=None, on_bytecount=None):
+        """
+        Asyncio client for the OpenVPN management interface on the Unix socket at path
+        (openvpn --management path unix).
+        on_state(state_name, fields) is called for every >STATE: event and
+        on_bytecount(bytes_in, bytes_out) for every >BYTECOUNT: event.
+        Only commands with a single-line SUCCESS/ERROR reply are supported.
+        """
+        self.path = path
+        self.on_state = on_state
+        self.on_bytecount = on_bytecount
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.rate_in = 0.0 # Bytes per second between the last two BYTECOUNT samples
+        self.rate_out = 0.0
+        self.last_state = None
+        self._last_sample = None
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._pending = collections.deque() # Futures awaiting a command reply, in send order
+        self._command_lock = None
+
+    async def connect(self, timeout=10.0):
+        """
+        Connects to the management socket, retrying until it accepts or timeout seconds pass
+        (OpenVPN opens it shortly after starting).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                await asyncio.sleep(0.1)
+        self._command_lock = asyncio.Lock()
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            while True:
+                raw = await self._reader.readline()
+                if not raw:
+                    break
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                if line.startswith('>'):
+                    self._handle_notification(line)
+                elif self._pending:
+                    future = self._pending.popleft()
+                    if future.done():
+                        continue
+                    if line.startswith('SUCCESS:'):
+                        future.set_result(line[len('SUCCESS:'):].strip())
+                    elif line.startswith('ERROR:'):
+                        future.set_exception(ManagementError(line[len('ERROR:'):].strip()))
+                    else:
+                        future.set_result(line)
+        finally:
+            while self._pending:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("Management connection closed"))
+
+    def _handle_notification(self, line):
+        kind, _, payload = line[1:].partition(':')
+        if kind == 'STATE':
+            fields = payload.split(',')
+            if len(fields) > 1:
+                self.last_state = fields[1]
+                if self.on_state:
+                    self.on_state(fields[1], fields)
+        elif kind == 'BYTECOUNT':
+            try:
+                bytes_in, bytes_out = (int(v) for v in payload.split(',')[:2])
+            except ValueError:
+                return
+            now = time.monotonic()
+            if self._last_sample:
+                then, prev_in, prev_out = self._last_sample
+                elapsed = now - then
+                if elapsed > 0:
+                    self.rate_in = max(0, bytes_in - prev_in) / elapsed
+                    self.rate_out = max(0, bytes_out - prev_out) / elapsed
+            self._last_sample = (now, bytes_in, bytes_out)
+            self.bytes_in, self.bytes_out = bytes_in, bytes_out
+            if self.on_bytecount:
+                self.on_bytecount(bytes_in, bytes_out)
+
+    async def command(self, command, timeout=5.0):
+        """
+        Sends one management command and returns the text after SUCCESS:.
+        Raises ManagementError on ERROR: and ConnectionError if the connection drops.
+        """
+        if self._writer is None:
+            raise ConnectionError("Management interface not connected")
+        async with self._command_lock:
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append(future)
+            self._writer.write((command + '\n').encode('utf-8'))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+
+    async def subscribe(self, bytecount_interval=1):
+        """
+        Turns on real-time >STATE: events and >BYTECOUNT: events every bytecount_interval seconds.
+        """
+        await self.command('state on')
+        await self.command(f'bytecount {int(bytecount_interval)}')
+
+    async def soft_restart(self):
+        """
+        Asks OpenVPN to reconnect without restarting the process (SIGUSR1).
+        """
+        return await self.command('signal SIGUSR1')
+
+    async def hold_release(self):
+        """
+        Releases a --management-hold so OpenVPN starts (or resumes) connecting.
+        """
+        return await self.command('hold release')
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._read_task is not None:
+            try:
+                await asyncio.wait_for(self._read_task, 1.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError, OSError):
+                self._read_task.cancel()
+            self._read_task = None
+
+
+class ManagementSession:
+    def __init__(self, path, on_state=None):
+        """
+        Runs a ManagementClient on a private event loop thread, for use from blocking code
+        such as OpenVPNManager. on_state(state_name, fields) is called on that thread.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.client = ManagementClient(path, on_state=on_state)
+
+    def _run(self, coroutine, timeout):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def start(self, timeout=10.0, bytecount_interval=1):
+        """
+        Connects and subscribes to state and byte-count events.
+        """
+        self._run(self.client.connect(timeout), timeout + 1)
+        self._run(self.client.subscribe(bytecount_interval), 10)
+
+    def command(self, command, timeout=5.0):
+        return self._run(self.client.command(command, timeout), timeout + 1)
+
+    def soft_restart(self):
+        return self._run(self.client.soft_restart(), 6)
+
+    def hold_release(self):
+        return self._run(self.client.hold_release(), 6)
+
+    def stats(self):
+        """
+        Returns the latest traffic counters: total bytes and bytes/second in each direction.
+        """
+        client = self.client
+        return {'bytes_in': client.bytes_in, 'bytes_out': client.bytes_out,
+                'rate_in': client.rate_in, 'rate_out': client.rate_out, 'state': client.last_state}
+
+    def close(self):
+        try:
+            self._run(self.client.close(), 3)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=3)
+        self._loop.close()
@@ -1,17 +1,228 @@
 import subprocess
 import os
 import signal
+import queue
+import threading
+import time
+from .openvpn_log import OpenVPNLogPump, STATE_CONNECTED, STATE_EXITED, STATE_RECONNECTING
+from .metrics import report_timing
+from .openvpn_management import MANAGEMENT_STATES, ManagementSession, private_socket_path, remove_socket_path
+
+
+def openvpn_command(openvpn_path, ovpn_file_path, management_path=None, extra_args=(), netns=None, use_sudo=True):
+    """
+    Builds the OpenVPN command line shared by OpenVPNManager and AsyncOpenVPNManager.
+    """
+    # Note: Using sudo typically requires the script to be run with sudo privileges
+    # or for sudo to be configured for passwordless execution of openvpn for the user.
+    command = [openvpn_path, "--config", ovpn_file_path]
+    if management_path:
+        command += ["--management", management_path, "unix"]
+    command += list(extra_args)
+    if netns:
+        command = ["ip", "netns", "exec", netns] + command
+    return ["sudo"] + command if use_sudo else command
+
 
 class OpenVPNManager:
-    def __init__(self):
-        self.process = None
-        self.connected = False
+    def __init__(self, openvpn_path="openvpn", use_sudo=True, use_management=False, extra_args=None, netns=None,
+                 on_timing=None, spawner=None):
+        """
+        openvpn_path is the OpenVPN executable; use_sudo prefixes the command with sudo.
+        With use_management, OpenVPN is started with --management on a Unix socket in a private
+        directory (see openvpn_management.private_socket_path()), which enables traffic_stats() and reconnects without restarting the process.
+        extra_args are appended to the openvpn command line (e.g. ["--dev", "tun3"]), and
+        netns runs OpenVPN inside that (existing) network namespace via "ip netns exec".
+        on_timing(stage, seconds, details), if given, receives 'connect' (time to connected),
+        'connect_failed' and 'reconnect' (time from RECONNECTING back to connected) reports.
+        With spawner (an openvpn_spawner.SpawnerClient), OpenVPN is started, signalled and stopped by
+        that long-lived helper instead of through sudo (use_sudo is then ignored). The helper only
+        starts configs from its ConfigStore directory, and only --dev, --dev-type and --route-nopull
+        may be in extra_args.
+        """
+        self.openvpn_path = openvpn_path
+        self.use_sudo = use_sudo
+        self.use_management = use_management
+        self.extra_args = list(extra_args or [])
+        self.netns = netns
+        self.on_timing = on_timing
+        self.spawner = spawner
+        self.process = None # subprocess.Popen, or a SpawnedProcess when started through the spawner
+        self.log_pump = None # Drains and parses the output of self.process
+        self.config_path = None # .ovpn file of the current connection
+        self.management_path = None # Management socket of the current process
+        self.management = None # ManagementSession, once attached
+
+    @property
+    def state(self):
+        """
+        Connection state of the current OpenVPN process (see openvpn_log), or None without one.
+        """
+        return self.log_pump.state if self.log_pump else None
+
+    @property
+    def connected(self):
+        """
+        True once OpenVPN has reported "Initialization Sequence Completed" and is still up.
+        """
+        return self.state == STATE_CONNECTED
+
+    def wait_until_connected(self, timeout=None):
+        """
+        Blocks until the tunnel is up, OpenVPN exits, or timeout seconds pass.
+        Returns True if connected.
+        """
+        if not self.log_pump:
+            return False
+        return self.log_pump.wait_for_state([STATE_CONNECTED], timeout) == STATE_CONNECTED
+
+    def log_tail(self, n=20):
+        """
+        Returns the last n lines OpenVPN wrote to stdout/stderr.
+        """
+        return self.log_pump.tail(n) if self.log_pump else []
+
+    def _timing_observer(self, started, connected=False):
+        """
+        Returns an on_state callback feeding on_timing for a process started at `started`, or None.
+        """
+        if self.on_timing is None:
+            return None
+        status = {'connected': connected, 'reconnecting_since': None}
+
+        def on_state(state):
+            now = time.monotonic()
+            if state == STATE_CONNECTED:
+                if not status['connected']:
+                    status['connected'] = True
+                    report_timing(self.on_timing, 'connect', now - started)
+                elif status['reconnecting_since'] is not None:
+                    report_timing(self.on_timing, 'reconnect', now - status['reconnecting_since'])
+                status['reconnecting_since'] = None
+            elif state == STATE_RECONNECTING:
+                status['reconnecting_since'] = now
+            elif state == STATE_EXITED and not status['connected']:
+                report_timing(self.on_timing, 'connect_failed', now - started)
+        return on_state
+
+    def _start(self, ovpn_file_path, on_state=None):
+        """
+        Starts OpenVPN for ovpn_file_path. Returns (process, log pump, management socket path or None).
+        """
+        if self.spawner:
+            # The helper creates the management socket itself and tells us where it is.
+            process = self.spawner.spawn(ovpn_file_path, self.use_management, self.extra_args, self.netns)
+            return process, OpenVPNLogPump(process, on_state=on_state), process.management_path
+        management_path = private_socket_path() if self.use_management else None
+        try:
+            # Output is read continuously by the log pump, so the pipes can never fill and stall OpenVPN.
+            process = subprocess.Popen(self._command(ovpn_file_path, management_path), stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, universal_newlines=True, preexec_fn=os.setsid)
+        except BaseException:
+            remove_socket_path(management_path)
+            raise
+        return process, OpenVPNLogPump(process, on_state=on_state), management_path
+
+    def _command(self, ovpn_file_path, management_path=None):
+        return openvpn_command(self.openvpn_path, ovpn_file_path, management_path, self.extra_args,
+                               self.netns, self.use_sudo)
+
+    def _attach_management(self, management_path):
+        """
+        Connects to the management interface of the current process in a background thread.
+        Management >STATE: events then drive the log pump's state as well.
+        """
+        if not management_path:
+            return
+        self.management_path = management_path
+        process, log_pump = self.process, self.log_pump
+
+        def on_state(name, fields):
+            state = MANAGEMENT_STATES.get(name)
+            if state:
+                log_pump.set_state(state)
+
+        def attach():
+            session = ManagementSession(management_path, on_state=on_state)
+            try:
+                session.start()
+            except Exception as e:
+                print(f"Could not attach to the OpenVPN management interface at {management_path}: {e}")
+                session.close()
+                return
+            if self.process is not process: # Disconnected while we were attaching
+                session.close()
+                return
+            self.management = session
+
+        threading.Thread(target=attach, daemon=True).start()
+
+    def _detach_management(self):
+        if self.management:
+            self.management.close()
+        self.management = None
+        remove_socket_path(self.management_path)
+        self.management_path = None
+
+    def traffic_stats(self):
+        """
+        Returns byte counters and throughput from the management interface
+        ({'bytes_in', 'bytes_out', 'rate_in', 'rate_out', 'state'}), or None if not attached.
+        """
+        return self.management.stats() if self.management else None
+
+    def soft_reconnect(self):
+        """
+        Reconnects the tunnel. With the management interface this sends SIGUSR1, so OpenVPN
+        renegotiates in place; otherwise the process is stopped and started again.
+        Returns True if a reconnect was started.
+        """
+        if not self.process:
+            print("Not connected to any OpenVPN server.")
+            return False
+        if self.management:
+            try:
+                self.management.soft_restart()
+                self.log_pump.set_state(STATE_RECONNECTING)
+                print("Soft reconnect requested via the management interface.")
+                return True
+            except Exception as e:
+                print(f"Management soft reconnect failed ({e}); restarting OpenVPN instead.")
+        elif not isinstance(self.process, subprocess.Popen):
+            try:
+                self.process.send_signal('USR1') # The spawner may signal the process; we may not
+                self.log_pump.set_state(STATE_RECONNECTING)
+                print("Soft reconnect requested via the spawner.")
+                return True
+            except Exception as e:
+                print(f"Spawner soft reconnect failed ({e}); restarting OpenVPN instead.")
+        config_path = self.config_path
+        self.disconnect()
+        self.connect(config_path)
+        return self.process is not None
+
+    @staticmethod
+    def _kill_process_group(process, timeout=5):
+        """
+        Terminates the process group of process: SIGTERM, then SIGKILL if it does not exit
+        within timeout seconds. Raises ProcessLookupError if the process is already gone.
+        """
+        if not isinstance(process, subprocess.Popen):
+            process.stop(timeout) # Started through the spawner, which signals and reaps it
+            return
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGTERM) # Send SIGTERM to the process group
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(os.getpgid(process.pid), signal.SIGKILL) # Force kill
+            process.wait(timeout=5)
 
     def connect(self, ovpn_file_path):
         """
         Connects to an OpenVPN server using the provided .ovpn configuration file.
+        Returns once the process has started; use wait_until_connected() to wait for the tunnel.
         """
-        if self.connected:
+        if self.process:
             print("Already connected. Please disconnect first.")
             return
 
@@ -19,46 +230,123 @@ class OpenVPNManager:
             print(f"Error: OVPN configuration file not found at {ovpn_file_path}")
             return
 
-        # Construct the command.
-        # Note: Using sudo typically requires the script to be run with sudo privileges
-        # or for sudo to be configured for passwordless execution of openvpn for the user.
-        command = ["sudo", "openvpn", "--config", ovpn_file_path]
-
         try:
             print(f"Attempting to connect to OpenVPN using config: {ovpn_file_path}...")
             # Start the OpenVPN process
-            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=os.setsid)
-            self.connected = True
+            self.process, self.log_pump, management_path = self._start(
+                ovpn_file_path, on_state=self._timing_observer(time.monotonic()))
+            self.config_path = ovpn_file_path
             print(f"OpenVPN process started (PID: {self.process.pid}). Monitoring connection...")
-            # Note: Actual connection establishment is asynchronous.
-            # A more robust implementation would monitor self.process.stdout or self.process.stderr
-            # for specific messages indicating successful connection or failure.
+            self._attach_management(management_path)
+            # Actual connection establishment is asynchronous; the log pump tracks its progress.
         except FileNotFoundError:
             print("Error: 'openvpn' command not found. Please ensure OpenVPN is installed and in your PATH.")
-            self.connected = False
             self.process = None
+            self.log_pump = None
         except Exception as e:
             print(f"An error occurred while trying to start OpenVPN: {e}")
-            self.connected = False
+            self.log_pump = None
             if self.process: # If process started but an error occurred later
                 try:
-                    os.killpg(os.getpgid(self.process.pid), signal.SIGTERM) # Send SIGTERM to the process group
-                    self.process.wait(timeout=5)
+                    self._kill_process_group(self.process)
                 except ProcessLookupError:
                     pass # Process already dead
-                except subprocess.TimeoutExpired:
-                    os.killpg(os.getpgid(self.process.pid), signal.SIGKILL) # Force kill
-                    self.process.wait(timeout=5)
                 except Exception as kill_e:
                     print(f"Error trying to clean up process after failed start: {kill_e}")
             self.process = None
 
+    def connect_race(self, ovpn_file_paths, stagger=3.0, timeout=60):
+        """
+        "Happy eyeballs" connect: starts OpenVPN for each config in ovpn_file_paths (best first),
+        launching the next one every `stagger` seconds, or at once when an attempt exits.
+        The first attempt to log "Initialization Sequence Completed" becomes the connection;
+        all others are torn down with a process-group kill.
+        Returns the winning config path, or None if nothing connected within timeout seconds.
+        """
+        if self.process:
+            print("Already connected. Please disconnect first.")
+            return None
+
+        pending = [path for path in ovpn_file_paths if os.path.exists(path)]
+        for path in ovpn_file_paths:
+            if path not in pending:
+                print(f"Skipping missing OVPN configuration file: {path}")
+        if not pending:
+            return None
+
+        events = queue.Queue() # (attempt index, connected or exited state)
+        attempts = [] # (path, process, log pump, management socket path)
+        winner = None
+        race_started = time.monotonic()
+        deadline = race_started + timeout
+        next_launch = race_started
+
+        def reporter(index):
+            def on_state(state):
+                if state in (STATE_CONNECTED, STATE_EXITED):
+                    events.put((index, state))
+            return on_state
+
+        try:
+            while winner is None and time.monotonic() < deadline:
+                now = time.monotonic()
+                if pending and now >= next_launch:
+                    path = pending.pop(0)
+                    try:
+                        process, log_pump, management_path = self._start(path, on_state=reporter(len(attempts)))
+                    except (OSError, ValueError) as e:
+                        print(f"Could not start OpenVPN for {path}: {e}")
+                        next_launch = now
+                        continue
+                    print(f"Race attempt {len(attempts) + 1}: started OpenVPN (PID: {process.pid}) with {path}")
+                    attempts.append((path, process, log_pump, management_path))
+                    next_launch = now + stagger
+
+                live = [attempt[1] for attempt in attempts if attempt[1].poll() is None]
+                if not pending and not live and events.empty():
+                    break # Every attempt has failed
+
+                wait_until = min(deadline, next_launch) if pending else deadline
+                try:
+                    index, event = events.get(timeout=max(0.0, wait_until - time.monotonic()))
+                except queue.Empty:
+                    continue
+                if event == STATE_CONNECTED:
+                    winner = index
+                elif event == STATE_EXITED:
+                    print(f"Race attempt {index + 1} exited before connecting ({attempts[index][0]}).")
+                    report_timing(self.on_timing, 'connect_failed', time.monotonic() - race_started)
+                    next_launch = time.monotonic() # A dead attempt frees its slot right away
+        finally:
+            for index, (path, process, _, management_path) in enumerate(attempts):
+                if index == winner:
+                    continue
+                try:
+                    self._kill_process_group(process)
+                except ProcessLookupError:
+                    pass # Already exited
+                except Exception as e:
+                    print(f"Error stopping race attempt {index + 1} (PID: {process.pid}): {e}")
+                remove_socket_path(management_path)
+
+        if winner is None:
+            print("No OpenVPN attempt connected.")
+            return None
+
+        path, self.process, self.log_pump, management_path = attempts[winner]
+        report_timing(self.on_timing, 'connect', time.monotonic() - race_started)
+        self.log_pump.on_state = self._timing_observer(race_started, connected=True)
+        self.config_path = path
+        self._attach_management(management_path)
+        print(f"Connected via {path} (PID: {self.process.pid}).")
+        return path
+
 
     def disconnect(self):
         """
         Disconnects from the OpenVPN server by terminating the OpenVPN process.
         """
-        if not self.process or not self.connected:
+        if not self.process:
             print("Not connected to any OpenVPN server or process not found.")
             return
 
@@ -72,10 +360,15 @@ class OpenVPNManager:
             # For now, we assume this script (or its user) has rights to kill the process it started,
             # or that OpenVPN handles the signal gracefully.
 
-            # Try to terminate the process group first
-            os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-            self.process.wait(timeout=10) # Wait for graceful termination
-            print("OpenVPN process group terminated (SIGTERM).")
+            if not isinstance(self.process, subprocess.Popen):
+                # Started through the spawner: it owns the process, so no killpg (or sudo) is needed here.
+                returncode = self.process.stop(timeout=10)
+                print(f"OpenVPN stopped by the spawner (exit code {returncode}).")
+            else:
+                # Try to terminate the process group first
+                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+                self.process.wait(timeout=10) # Wait for graceful termination
+                print("OpenVPN process group terminated (SIGTERM).")
         except subprocess.TimeoutExpired:
             print("OpenVPN process group did not terminate gracefully with SIGTERM. Forcing SIGKILL...")
             try:
@@ -90,8 +383,10 @@ class OpenVPNManager:
             print(f"An error occurred while trying to disconnect: {e}")
             print(f"You might need to manually kill the OpenVPN process group (e.g., sudo kill -TERM -- -{self.process.pid}).")
         finally:
+            self._detach_management()
             self.process = None
-            self.connected = False
+            self.log_pump = None
+            self.config_path = None
 
 if __name__ == '__main__':
     # Example Usage (for testing purposes, run this script directly)
@@ -115,7 +410,7 @@ if __name__ == '__main__':
     print("--- Test Connect ---")
     manager.connect(dummy_ovpn_file)
 
-    if manager.connected and manager.process:
+    if manager.process:
         print(f"OpenVPN process launched with PID: {manager.process.pid} (Process Group ID: {os.getpgid(manager.process.pid)})")
         print("Simulating some work...")
         try:
@@ -124,10 +419,9 @@ if __name__ == '__main__':
                 print(f"Working... {i+1}/5")
                 if manager.process.poll() is not None: # Check if process died
                     print("OpenVPN process died unexpectedly.")
-                    manager.connected = False # Update status
                     break
                 subprocess.run(["sleep", "1"]) # Use subprocess.run for sleep
-            if manager.connected: # If still "connected" after sleep
+            if manager.process.poll() is None: # If still running after sleep
                 input("OpenVPN is 'running' (likely waiting for connection). Press Enter to disconnect...")
         except KeyboardInterrupt:
             print("Interrupted by user.")
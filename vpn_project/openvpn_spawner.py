@@ -0,0 +1,780 @@
+import argparse
+import json
+import os
+import pwd
+import queue
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .openvpn_management import private_socket_path, remove_socket_path
+from .openvpn_manager import openvpn_command
+from .ovpn_config import default_store_dir
+from .server_list_cache import default_cache_dir
+
+# Signals a client may send to an instance (by name, without the SIG prefix).
+SIGNALS = {'TERM': signal.SIGTERM, 'INT': signal.SIGINT, 'HUP': signal.SIGHUP, 'USR1': signal.SIGUSR1,
+           'USR2': signal.SIGUSR2, 'KILL': signal.SIGKILL}
+
+# The only command-line options a client may add: --dev NAME, --dev-type tun|tap and --route-nopull.
+DEVICE_NAME = re.compile(r'[A-Za-z0-9_]{1,15}')
+DEVICE_TYPES = ('tun', 'tap')
+NETNS_NAME = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}')
+
+# Config directives the helper refuses: they run programs or load plugins or modules, or make OpenVPN
+# read, write or open files of its choosing, with the helper's privileges.
+UNSAFE_DIRECTIVES = {'script-security', 'up', 'down', 'route-up', 'route-pre-down', 'ipchange', 'tls-verify',
+                     'auth-user-pass-verify', 'client-connect', 'client-disconnect', 'client-crresponse',
+                     'learn-address', 'tls-crypt-v2-verify', 'dns-updown', 'plugin', 'engine', 'providers',
+                     'pkcs11-providers', 'config', 'cd', 'chroot', 'daemon', 'inetd', 'writepid', 'log', 'log-append',
+                     'status', 'tmp-dir', 'iproute', 'replay-persist', 'ifconfig-pool-persist', 'tls-export-cert',
+                     'dev-node', 'setenv'}
+# Directives whose credentials would be read from a file and sent to the remote (or a proxy):
+# name -> (position of the file argument, the values allowed there instead of a file).
+FILE_ARGUMENTS = {'auth-user-pass': (0, {'[inline]'}), 'askpass': (0, {'[inline]'}),
+                  'http-proxy-user-pass': (0, {'[inline]'}), 'http-proxy': (2, {'[inline]', 'auto', 'auto-nct'}),
+                  'socks-proxy': (2, {'[inline]'})}
+MAX_CONFIG_SIZE = 1 << 20
+MAX_CONFIG_LINE = 255 # OpenVPN reads config lines in pieces of this many bytes
+
+
+def default_spawner_socket_path():
+    """
+    Returns the spawner socket path ($XDG_RUNTIME_DIR/vpn_project-spawner.sock, or in the cache directory).
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'vpn_project-spawner.sock')
+    return os.path.join(default_cache_dir(), 'spawner.sock')
+
+
+class SpawnerError(OSError):
+    """Raised by SpawnerClient when the helper cannot be reached or refuses a request."""
+
+
+def allowed_extra_args(extra_args):
+    """
+    Checks the options a client asks for against the ones the helper allows (--dev NAME,
+    --dev-type tun|tap and --route-nopull). Returns them as a list; raises ValueError for anything else.
+    """
+    args = [str(arg) for arg in extra_args]
+    allowed = []
+    i = 0
+    while i < len(args):
+        option = args[i]
+        value = args[i + 1] if i + 1 < len(args) else None
+        if option == '--route-nopull':
+            allowed.append(option)
+            i += 1
+        elif (option == '--dev' and value and DEVICE_NAME.fullmatch(value)) or \
+                (option == '--dev-type' and value in DEVICE_TYPES):
+            allowed += [option, value]
+            i += 2
+        else:
+            raise ValueError(f"Option not allowed: {' '.join(args[i:i + 2])}")
+    return allowed
+
+
+def _config_tokens(line):
+    # Splits a config line as OpenVPN's parser does: quotes open only at the start of a token and
+    # close it, a backslash escapes the next character (except in single quotes), and # or ; where
+    # a token would start begins a comment.
+    tokens = []
+    token = None
+    quote = None
+    escaped = False
+    for c in line:
+        if escaped:
+            token.append(c)
+            escaped = False
+        elif quote:
+            if c == '\\' and quote == '"':
+                escaped = True
+            elif c == quote:
+                tokens.append(''.join(token))
+                token = quote = None
+            else:
+                token.append(c)
+        elif token is None:
+            if c.isspace():
+                continue
+            if c in '#;':
+                break
+            token = []
+            if c in '"\'':
+                quote = c
+            elif c == '\\':
+                escaped = True
+            else:
+                token.append(c)
+        elif c.isspace():
+            tokens.append(''.join(token))
+            token = None
+        elif c == '\\':
+            escaped = True
+        else:
+            token.append(c)
+    if token is not None:
+        tokens.append(''.join(token))
+    return tokens
+
+
+def config_options(text):
+    """
+    Yields the options of an ovpn config as OpenVPN reads them, as token lists with the option name
+    first (a leading -- removed), including the options inside <connection> blocks. Other inline
+    blocks (<ca>...</ca>, ...) are skipped, ending where OpenVPN ends them.
+    """
+    lines = iter(text.split('\n'))
+    for line in lines:
+        tokens = _config_tokens(line)
+        if not tokens:
+            continue
+        if tokens[0].startswith('--'):
+            tokens[0] = tokens[0][2:]
+        name = tokens[0]
+        if len(name) > 2 and name.startswith('<') and name.endswith('>'):
+            close = f"</{name[1:-1]}>"
+            block = []
+            for line in lines:
+                if line.lstrip().startswith(close):
+                    break
+                block.append(line)
+            if name == '<connection>':
+                yield from config_options('\n'.join(block))
+            continue
+        yield tokens
+
+
+def check_config(text):
+    """
+    Raises ValueError if an ovpn config has a directive from UNSAFE_DIRECTIVES (or a management option),
+    reads a FILE_ARGUMENTS file, or has lines OpenVPN would read differently from config_options().
+    """
+    for line in text.split('\n'):
+        if '\0' in line or len(line.encode('utf-8')) > MAX_CONFIG_LINE:
+            raise ValueError("Config lines must be shorter than 256 bytes and free of NUL characters")
+    for option in config_options(text):
+        name = option[0].lower() # OpenVPN's names are case-sensitive; refusing every case is stricter
+        if name in UNSAFE_DIRECTIVES or name.startswith('management'):
+            raise ValueError(f"Config directive not allowed: {option[0]}")
+        if name in FILE_ARGUMENTS:
+            position, allowed = FILE_ARGUMENTS[name]
+            if len(option) > position + 1 and option[position + 1] not in allowed:
+                raise ValueError(f"Config directive not allowed with a file: {option[0]}")
+
+
+def _owner_store_dir(uid):
+    # The helper runs as root, so the owner's config store is found through the owner's home.
+    return os.path.join(pwd.getpwuid(uid).pw_dir, '.cache', 'vpn_project', 'configs')
+
+
+def _peer_uid(sock):
+    """
+    Returns the uid of the process at the other end of a Unix socket, or None where SO_PEERCRED is unsupported.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    _, uid, _ = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    return uid
+
+
+class _Instance:
+    def __init__(self, instance_id, process, dev, config_path, config_copy, management_path):
+        self.id = instance_id
+        self.process = process
+        self.dev = dev # Pre-created tun device handed to this instance, or None
+        self.config_path = config_path # As requested by the client
+        self.config_copy = config_copy # The checked copy OpenVPN reads
+        self.management_path = management_path
+        self.started_at = time.monotonic()
+
+
+class OpenVPNSpawner:
+    def __init__(self, socket_path=None, openvpn_path="openvpn", devices=(), owner_uid=None, config_dir=None):
+        """
+        Long-lived helper that starts, signals and reaps OpenVPN on behalf of OpenVPNManager.
+        Run it once with the privileges OpenVPN needs (e.g. sudo python -m vpn_project.openvpn_spawner);
+        connects and reconnects then go over its Unix socket instead of through sudo each time.
+
+        devices are tun device names (e.g. tun10, tun11) created up front with "openvpn --mktun";
+        an instance started without its own --dev gets a free one, and they are removed on shutdown.
+        Only owner_uid (plus root and the helper's own user) may use the socket. A client's
+        instance is stopped when its connection closes, so a crashed client never leaves OpenVPN running.
+        Requests are JSON lines such as {"command": "spawn", "config": "/path/x.ovpn"}; commands are
+        spawn, signal, stop, status and shutdown.
+
+        Clients are not trusted with the helper's privileges: configs must be files directly in
+        config_dir (the owner's ConfigStore directory by default) and free of UNSAFE_DIRECTIVES,
+        only the options allowed_extra_args() accepts may be added, and the management socket is
+        created by the helper itself.
+        """
+        self.socket_path = socket_path or default_spawner_socket_path()
+        self.openvpn_path = shutil.which(openvpn_path) or openvpn_path # Resolved once, not on every exec
+        self.owner_uid = owner_uid
+        if config_dir is None:
+            config_dir = _owner_store_dir(owner_uid) if owner_uid is not None else default_store_dir()
+        self.config_dir = os.path.realpath(config_dir)
+        self._config_dir_fd = None
+        self.devices = list(devices)
+        self._created_devices = []
+        self._free_devices = []
+        self._instances = {} # id -> _Instance
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._server = None
+
+    # --- Instances ---
+
+    def prepare(self):
+        """
+        Warms up the OpenVPN binary and creates the tun devices. Failures are reported and skipped.
+        """
+        try:
+            # Loads the binary and its libraries into the page cache before the first real connect.
+            subprocess.run([self.openvpn_path, '--version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=10)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"Could not run {self.openvpn_path}: {e}")
+        for dev in self.devices:
+            try:
+                result = subprocess.run([self.openvpn_path, '--mktun', '--dev', dev, '--dev-type', 'tun'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"Could not create tun device {dev}: {e}")
+                continue
+            if result.returncode != 0:
+                print(f"Could not create tun device {dev} (openvpn --mktun exited with {result.returncode}).")
+                continue
+            self._created_devices.append(dev)
+            self._free_devices.append(dev)
+
+    def _remove_devices(self):
+        for dev in self._created_devices:
+            try:
+                subprocess.run([self.openvpn_path, '--rmtun', '--dev', dev, '--dev-type', 'tun'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"Could not remove tun device {dev}: {e}")
+        self._created_devices = []
+        self._free_devices = []
+
+    def _read_config(self, config_path):
+        """
+        Reads a config from config_dir and checks it. Returns the text; raises ValueError if it is
+        elsewhere, not a regular file, too large or unsafe.
+        """
+        if os.path.dirname(os.path.realpath(config_path)) != self.config_dir:
+            raise ValueError(f"Configs must be in {self.config_dir}: {config_path}")
+        with self._lock:
+            if self._config_dir_fd is None:
+                self._config_dir_fd = os.open(self.config_dir, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+        # The file is opened by name in the directory opened once above, without following links,
+        # so swapping paths after the check cannot point OpenVPN at another file.
+        try:
+            fd = os.open(os.path.basename(config_path), os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK,
+                         dir_fd=self._config_dir_fd)
+        except OSError as e:
+            raise ValueError(f"Cannot open the OVPN configuration file {config_path}: {e}")
+        with os.fdopen(fd, 'rb') as f:
+            if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+                raise ValueError(f"Not a regular file: {config_path}")
+            data = f.read(MAX_CONFIG_SIZE + 1)
+        if len(data) > MAX_CONFIG_SIZE:
+            raise ValueError(f"OVPN configuration file is too large: {config_path}")
+        text = data.decode('utf-8', errors='replace')
+        check_config(text)
+        return text
+
+    def _private_management_path(self):
+        # The directory belongs to the client, so only it (and root) can reach the socket inside.
+        path = private_socket_path()
+        if self.owner_uid is not None and self.owner_uid != os.getuid():
+            os.chown(os.path.dirname(path), self.owner_uid, -1)
+        return path
+
+    def spawn(self, config_path, management=False, extra_args=(), netns=None):
+        """
+        Starts OpenVPN for config_path (a file in config_dir) in its own process group, on a checked
+        copy of the config. With management, it gets a management socket in a new private directory
+        (the instance's management_path). Returns the _Instance; raises ValueError for a refused request.
+        """
+        extra_args = allowed_extra_args(extra_args)
+        if netns is not None and not NETNS_NAME.fullmatch(str(netns)):
+            raise ValueError(f"Network namespace name not allowed: {netns}")
+        text = self._read_config(config_path)
+        fd, config_copy = tempfile.mkstemp(prefix='vpn_project-spawner-', suffix='.ovpn')
+        management_path = dev = None
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            if management:
+                management_path = self._private_management_path()
+            with self._lock:
+                if '--dev' in extra_args:
+                    dev = extra_args[extra_args.index('--dev') + 1]
+                    dev = dev if dev in self._free_devices else None
+                    if dev:
+                        self._free_devices.remove(dev)
+                else:
+                    dev = self._free_devices.pop(0) if self._free_devices else None
+                    if dev:
+                        extra_args += ['--dev', dev, '--dev-type', 'tun']
+                command = openvpn_command(self.openvpn_path, config_copy, management_path, extra_args, netns,
+                                          use_sudo=False)
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           universal_newlines=True, preexec_fn=_child_setup)
+                instance = _Instance(self._next_id, process, dev, config_path, config_copy, management_path)
+                self._instances[instance.id] = instance
+                self._next_id += 1
+        except BaseException:
+            with self._lock:
+                if dev:
+                    self._free_devices.append(dev)
+            os.unlink(config_copy)
+            remove_socket_path(management_path)
+            raise
+        print(f"Started OpenVPN #{instance.id} (PID: {process.pid}) with {config_path}"
+              + (f" on {dev}." if dev else "."))
+        return instance
+
+    def _reap(self, instance):
+        """
+        Waits for an instance to exit, then forgets it and frees its device. Returns the exit code.
+        """
+        returncode = instance.process.wait()
+        with self._lock:
+            if self._instances.pop(instance.id, None) is not instance:
+                return returncode
+            if instance.dev in self._created_devices:
+                self._free_devices.append(instance.dev)
+        try:
+            os.unlink(instance.config_copy)
+        except OSError:
+            pass
+        remove_socket_path(instance.management_path)
+        return returncode
+
+    def _instance(self, instance_id):
+        with self._lock:
+            instance = self._instances.get(instance_id)
+        if instance is None:
+            raise ValueError(f"No OpenVPN instance #{instance_id}")
+        return instance
+
+    def signal(self, instance_id, name):
+        """
+        Sends a signal from SIGNALS to an instance's process group.
+        """
+        if name not in SIGNALS:
+            raise ValueError(f"Signal not allowed: {name}")
+        instance = self._instance(instance_id)
+        os.killpg(instance.process.pid, SIGNALS[name]) # The group id is the pid (started with setsid)
+
+    def stop(self, instance_id, timeout=5):
+        """
+        Stops an instance: SIGTERM to its process group, then SIGKILL after timeout seconds.
+        Returns the exit code, or None if there was no such instance (it had already exited).
+        """
+        with self._lock:
+            instance = self._instances.get(instance_id)
+        if instance is None:
+            return None
+        try:
+            os.killpg(instance.process.pid, signal.SIGTERM)
+            instance.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"OpenVPN #{instance.id} did not exit on SIGTERM; sending SIGKILL.")
+            try:
+                os.killpg(instance.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        except ProcessLookupError:
+            pass # Exited meanwhile; reaped below
+        return self._reap(instance)
+
+    def status(self):
+        with self._lock:
+            instances = list(self._instances.values())
+            free_devices = list(self._free_devices)
+        now = time.monotonic()
+        return {'pid': os.getpid(), 'openvpn': self.openvpn_path, 'free_devices': free_devices,
+                'instances': [{'id': i.id, 'pid': i.process.pid, 'dev': i.dev, 'config': i.config_path,
+                               'running': i.process.poll() is None, 'uptime': now - i.started_at}
+                              for i in instances]}
+
+    # --- Control socket ---
+
+    def _allowed(self, sock):
+        # Without the peer's credentials the caller cannot be told apart from any other user.
+        uid = _peer_uid(sock)
+        return uid is not None and uid in (0, os.getuid(), self.owner_uid)
+
+    def handle(self, request):
+        """
+        Handles one request other than spawn (which keeps its connection). Returns the reply dictionary.
+        """
+        command = request.get('command')
+        try:
+            if command == 'signal':
+                self.signal(request.get('id'), request.get('signal'))
+                return {'ok': True}
+            if command == 'stop':
+                return {'ok': True, 'returncode': self.stop(request.get('id'), float(request.get('timeout', 5)))}
+            if command == 'status':
+                return {'ok': True, **self.status()}
+            if command == 'shutdown':
+                self.shutdown()
+                return {'ok': True}
+            return {'ok': False, 'error': f"Unknown command: {command}"}
+        except (OSError, ValueError, TypeError) as e:
+            return {'ok': False, 'error': str(e)}
+
+    def _serve_spawn(self, request, rfile, wfile):
+        """
+        Runs a spawn request: replies with the instance, streams its output as {"line": ...}
+        messages and finishes with {"exit": code}. Stops the instance if the client goes away.
+        """
+        try:
+            instance = self.spawn(request.get('config') or '', bool(request.get('management')),
+                                  request.get('extra_args') or (), request.get('netns'))
+        except (OSError, ValueError, TypeError) as e:
+            wfile.write((json.dumps({'ok': False, 'error': str(e)}) + '\n').encode('utf-8'))
+            return
+
+        def watch_client():
+            # The client never sends anything after the request, so EOF means it closed or died.
+            try:
+                while rfile.readline():
+                    pass
+            except (OSError, ValueError):
+                pass
+            if instance.process.poll() is None:
+                print(f"Client of OpenVPN #{instance.id} went away; stopping it.")
+                self.stop(instance.id)
+
+        threading.Thread(target=watch_client, daemon=True).start()
+        # Output is drained even after the client has gone, so the pipe never stalls OpenVPN while
+        # watch_client() stops it.
+        client_gone = not self._send(wfile, {'ok': True, 'id': instance.id, 'pid': instance.process.pid,
+                                             'dev': instance.dev, 'management': instance.management_path})
+        for line in instance.process.stdout:
+            if not client_gone:
+                client_gone = not self._send(wfile, {'line': line.rstrip('\r\n')})
+        returncode = self._reap(instance)
+        print(f"OpenVPN #{instance.id} exited with {returncode}.")
+        if not client_gone:
+            self._send(wfile, {'exit': returncode})
+
+    @staticmethod
+    def _send(wfile, message):
+        try:
+            wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            wfile.flush()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def serve_forever(self):
+        """
+        Prepares the devices and serves the socket until shutdown() (or KeyboardInterrupt).
+        """
+        spawner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if not spawner._allowed(self.request):
+                    self.wfile.write(b'{"ok": false, "error": "Permission denied"}\n')
+                    return
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if not isinstance(request, dict):
+                            raise ValueError("request must be a JSON object")
+                    except ValueError as e:
+                        reply = {'ok': False, 'error': f"Bad request: {e}"}
+                    else:
+                        if request.get('command') == 'spawn':
+                            spawner._serve_spawn(request, self.rfile, self.wfile)
+                            return
+                        if request.get('command') == 'shutdown':
+                            # Replied to first: the helper may exit before this thread gets to write.
+                            spawner._send(self.wfile, {'ok': True})
+                            spawner.shutdown()
+                            return
+                        reply = spawner.handle(request)
+                    if not spawner._send(self.wfile, reply):
+                        return
+
+        self.prepare()
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path) # Left behind by a helper that did not shut down cleanly
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600) # Only the owner may start OpenVPN through us
+        if self.owner_uid is not None and self.owner_uid != os.getuid():
+            os.chown(self.socket_path, self.owner_uid, -1)
+        print(f"OpenVPN spawner listening on {self.socket_path} ({len(self._free_devices)} tun devices ready).")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._shutdown()
+
+    def shutdown(self):
+        if self._server:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _shutdown(self):
+        with self._lock:
+            instance_ids = list(self._instances)
+        for instance_id in instance_ids:
+            self.stop(instance_id)
+        self._server.server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        if self._config_dir_fd is not None:
+            os.close(self._config_dir_fd)
+            self._config_dir_fd = None
+        self._remove_devices()
+
+
+def _child_setup():
+    # OpenVPN runs in its own process group. Its management socket is created without a umask: the
+    # socket is only reachable through its private directory, which belongs to the client.
+    os.setsid()
+    os.umask(0)
+
+
+class SpawnedProcess:
+    def __init__(self, client, sock, rfile, reply, args):
+        """
+        An OpenVPN instance started through the spawner, standing in for the subprocess.Popen that
+        OpenVPNManager would otherwise hold: pid, args, returncode, poll(), wait() and an iterable
+        stdout (the helper merges stderr into it, so stderr is None). send_signal() and stop()
+        go through the helper. management_path is the management socket the helper set up, or None.
+        """
+        self.client = client
+        self.id = reply['id']
+        self.pid = reply['pid']
+        self.dev = reply.get('dev')
+        self.management_path = reply.get('management')
+        self.args = args
+        self.returncode = None
+        self.stderr = None
+        self._sock = sock
+        self._lines = queue.Queue()
+        self._exited = threading.Event()
+        self.stdout = iter(self._lines.get, None)
+        threading.Thread(target=self._read, args=(rfile,), daemon=True).start()
+
+    def _read(self, rfile):
+        returncode = None
+        try:
+            for line in rfile:
+                message = json.loads(line)
+                if 'line' in message:
+                    self._lines.put(message['line'])
+                elif 'exit' in message:
+                    returncode = message['exit']
+                    break
+        except (OSError, ValueError) as e:
+            print(f"Lost the output of OpenVPN #{self.id}: {e}")
+        if returncode is None:
+            print(f"The spawner closed the connection of OpenVPN #{self.id} without reporting its exit.")
+            returncode = -1
+        self.returncode = returncode
+        self._exited.set()
+        self._lines.put(None)
+        rfile.close()
+        self._sock.close()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def send_signal(self, signal_name):
+        """
+        Signals the process group, e.g. send_signal('USR1') for an in-place restart.
+        """
+        if self.returncode is not None:
+            raise ProcessLookupError(f"OpenVPN #{self.id} has exited")
+        self.client.call('signal', id=self.id, signal=signal_name)
+
+    def terminate(self):
+        self.send_signal('TERM')
+
+    def kill(self):
+        self.send_signal('KILL')
+
+    def stop(self, timeout=5):
+        """
+        Has the helper stop the process group (SIGTERM, SIGKILL after timeout seconds) and reap it.
+        Returns the exit code.
+        """
+        if self.returncode is None:
+            self.client.call('stop', id=self.id, timeout=timeout)
+        self._exited.wait(5) # The exit message follows the reap
+        return self.returncode
+
+
+class SpawnerClient:
+    def __init__(self, socket_path=None, timeout=30.0):
+        """
+        Client for an OpenVPNSpawner. Pass it as OpenVPNManager(spawner=...) to start OpenVPN through the helper.
+        """
+        self.socket_path = socket_path or default_spawner_socket_path()
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise SpawnerError(f"Cannot reach the OpenVPN spawner at {self.socket_path}: {e}")
+        return sock
+
+    @staticmethod
+    def _exchange(sock, rfile, request):
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        line = rfile.readline()
+        if not line:
+            raise SpawnerError("The OpenVPN spawner closed the connection")
+        reply = json.loads(line)
+        if not reply.pop('ok', False):
+            raise SpawnerError(reply.get('error'))
+        return reply
+
+    def call(self, command, **arguments):
+        """
+        Sends one request on a new connection and returns the reply fields. Raises SpawnerError on errors.
+        """
+        sock = self._connect()
+        try:
+            with sock.makefile('rb') as rfile:
+                return self._exchange(sock, rfile, {'command': command, **arguments})
+        finally:
+            sock.close()
+
+    def spawn(self, ovpn_file_path, management=False, extra_args=(), netns=None):
+        """
+        Starts OpenVPN through the helper and returns a SpawnedProcess. The connection stays open
+        for its output; closing it (or this process exiting) stops the instance.
+        ovpn_file_path must be in the helper's config directory (a ConfigStore's), and extra_args
+        may only hold --dev, --dev-type and --route-nopull. With management, the helper gives the
+        instance a management socket (see SpawnedProcess.management_path).
+        """
+        sock = self._connect()
+        rfile = sock.makefile('rb')
+        try:
+            reply = self._exchange(sock, rfile, {'command': 'spawn', 'config': os.path.abspath(ovpn_file_path),
+                                                 'management': bool(management),
+                                                 'extra_args': list(extra_args), 'netns': netns})
+        except BaseException:
+            rfile.close()
+            sock.close()
+            raise
+        sock.settimeout(None) # Output may be quiet for hours
+        return SpawnedProcess(self, sock, rfile, reply, [self.socket_path, ovpn_file_path])
+
+    def status(self):
+        return self.call('status')
+
+    def shutdown(self):
+        """
+        Stops every instance, removes the helper's tun devices and exits the helper.
+        """
+        self.call('shutdown')
+
+
+def start_spawner(socket_path=None, openvpn_path="openvpn", devices=(), use_sudo=True, timeout=60.0,
+                  config_dir=None):
+    """
+    Starts an OpenVPNSpawner in the background (through sudo, so it asks for a password at most
+    once) unless one already answers on socket_path, and returns a SpawnerClient for it.
+    The helper only accepts configs in config_dir (default: the default ConfigStore directory).
+    Raises SpawnerError if the helper does not come up within timeout seconds.
+    """
+    client = SpawnerClient(socket_path)
+    try:
+        client.status()
+        return client
+    except SpawnerError:
+        pass
+
+    command = [sys.executable, '-m', 'vpn_project.openvpn_spawner', '--socket', client.socket_path,
+               '--openvpn', openvpn_path, '--owner', str(os.getuid()),
+               '--config-dir', os.path.abspath(config_dir or default_store_dir())]
+    for dev in devices:
+        command += ['--device', dev]
+    if use_sudo:
+        command = ['sudo'] + command
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # sudo needs the terminal to ask for a password; an unprivileged helper gets its own session,
+    # so a Ctrl-C meant for this program does not reach it.
+    process = subprocess.Popen(command, cwd=package_parent, start_new_session=not use_sudo)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SpawnerError(f"The OpenVPN spawner exited with {process.returncode}")
+        try:
+            client.status()
+            return client
+        except SpawnerError:
+            time.sleep(0.1)
+    raise SpawnerError(f"The OpenVPN spawner did not start within {timeout} seconds")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the privileged OpenVPN spawner, or send it a command.")
+    parser.add_argument('--socket', help="Spawner socket path.")
+    parser.add_argument('--openvpn', default='openvpn', help="OpenVPN executable.")
+    parser.add_argument('--owner', type=int, help="uid allowed to use the socket (default: the sudo user).")
+    parser.add_argument('--config-dir', help="Directory configs must be in (default: the owner's ConfigStore directory).")
+    parser.add_argument('--device', action='append', default=[], help="tun device to create up front (repeatable).")
+    parser.add_argument('--tun-devices', type=int, default=0, metavar='N',
+                        help="Create N tun devices tun<first>...; see --first-dev-index.")
+    parser.add_argument('--first-dev-index', type=int, default=10, help="First index for --tun-devices.")
+    parser.add_argument('command', nargs='?', choices=['serve', 'status', 'shutdown'], default='serve')
+    args = parser.parse_args(argv)
+
+    if args.command != 'serve':
+        try:
+            reply = SpawnerClient(args.socket).call(args.command)
+        except SpawnerError as e:
+            raise SystemExit(f"Error: {e}")
+        print(json.dumps(reply, indent=2))
+        return
+
+    owner = args.owner
+    if owner is None and os.environ.get('SUDO_UID'):
+        owner = int(os.environ['SUDO_UID'])
+    devices = args.device + [f"tun{args.first_dev_index + i}" for i in range(args.tun_devices)]
+    spawner = OpenVPNSpawner(args.socket, args.openvpn, devices, owner_uid=owner, config_dir=args.config_dir)
+    # sudo sends SIGHUP/SIGTERM along; shut down cleanly so instances and devices are not left behind.
+    signal.signal(signal.SIGTERM, lambda signum, frame: spawner.shutdown())
+    try:
+        spawner.serve_forever()
+    except KeyboardInterrupt:
+        print("\nSpawner interrupted. Shutting down...")
+
+
+if __name__ == '__main__':
+    main()
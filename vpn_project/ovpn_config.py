@@ -0,0 +1,267 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from .server_list_cache import default_cache_dir
+from .server_record import CONFIG_FIELD
+
+PREFERRED_CIPHERS = ('AES-256-GCM', 'AES-128-GCM', 'CHACHA20-POLY1305')
+
+
+class OvpnConfig:
+    def __init__(self, text):
+        """
+        An ovpn config parsed into directives. Each entry is either a directive [name, args...],
+        or a raw string kept verbatim: comments, blank lines and inline blocks such as <ca>...</ca>.
+        to_text() reproduces the original text for everything that was not changed.
+        """
+        self.entries = []
+        block = None
+        for line in text.splitlines():
+            stripped = line.strip()
+            if block is not None:
+                block.append(line)
+                if stripped.lower() == f"</{block_name}>":
+                    self.entries.append('\n'.join(block))
+                    block = None
+                continue
+            if stripped.startswith('<') and stripped.endswith('>') and not stripped.startswith('</'):
+                block_name = stripped[1:-1].lower()
+                block = [line]
+                continue
+            if not stripped or stripped.startswith(('#', ';')):
+                self.entries.append(line)
+                continue
+            parts = stripped.split()
+            self.entries.append([parts[0].lower()] + parts[1:])
+        if block is not None: # Unterminated block: keep it rather than lose it
+            self.entries.append('\n'.join(block))
+
+    def _directives(self, name):
+        return [entry for entry in self.entries if isinstance(entry, list) and entry[0] == name]
+
+    def get(self, name):
+        """
+        Returns the arguments of the first `name` directive, or None if it is absent.
+        """
+        found = self._directives(name)
+        return found[0][1:] if found else None
+
+    def get_all(self, name):
+        return [entry[1:] for entry in self._directives(name)]
+
+    def set(self, name, *args):
+        """
+        Sets a single-valued directive: replaces the first occurrence (dropping any others),
+        or adds it before the inline blocks.
+        """
+        found = self._directives(name)
+        if found:
+            found[0][1:] = [str(arg) for arg in args]
+            for extra in found[1:]:
+                self.entries.remove(extra)
+            return
+        position = next((i for i, entry in enumerate(self.entries)
+                         if isinstance(entry, str) and entry.lstrip().startswith('<')), len(self.entries))
+        self.entries.insert(position, [name] + [str(arg) for arg in args])
+
+    def remove(self, name):
+        self.entries = [entry for entry in self.entries if not (isinstance(entry, list) and entry[0] == name)]
+
+    def remotes(self):
+        """
+        Returns (host, port, proto) for each remote line; port and proto are None when omitted.
+        """
+        return [(args[0], args[1] if len(args) > 1 else None, args[2] if len(args) > 2 else None)
+                for args in self.get_all('remote') if args]
+
+    def proto(self):
+        """
+        The transport the first remote will use: 'udp' or 'tcp'.
+        """
+        remotes = self.remotes()
+        proto = (remotes[0][2] if remotes and remotes[0][2] else None) or (self.get('proto') or ['udp'])[0]
+        return 'tcp' if proto.lower().startswith('tcp') else 'udp'
+
+    def to_text(self):
+        return '\n'.join(entry if isinstance(entry, str) else ' '.join(entry) for entry in self.entries) + '\n'
+
+
+class ConfigOverrides:
+    def __init__(self, sndbuf=None, rcvbuf=None, fast_io=False, ciphers=None, connect_timeout=None,
+                 connect_retry=None, prefer_udp=False):
+        """
+        Performance settings applied to server configs.
+        sndbuf/rcvbuf are socket buffer sizes in bytes. fast_io is only applied to UDP tunnels (OpenVPN
+        ignores it otherwise). ciphers is a preference list for data-ciphers; the server's own cipher
+        is kept at the end (and as data-ciphers-fallback) so older servers still connect.
+        connect_timeout and connect_retry (seconds, or a (delay, max_delay) tuple) bound connection attempts.
+        prefer_udp keeps only the UDP remotes, but only if the config has at least one.
+        """
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.fast_io = fast_io
+        self.ciphers = tuple(ciphers or ())
+        self.connect_timeout = connect_timeout
+        self.connect_retry = connect_retry
+        self.prefer_udp = prefer_udp
+
+    def key(self):
+        """
+        A stable string identifying these settings (part of the config store's lookup key).
+        """
+        return repr((self.sndbuf, self.rcvbuf, self.fast_io, self.ciphers, self.connect_timeout,
+                     self.connect_retry, self.prefer_udp))
+
+    def apply(self, config):
+        """
+        Rewrites an OvpnConfig in place and returns it.
+        """
+        if self.prefer_udp:
+            remotes = config._directives('remote')
+            default_proto = (config.get('proto') or ['udp'])[0].lower()
+            udp = [r for r in remotes if (r[3] if len(r) > 3 else default_proto).lower().startswith('udp')]
+            if udp and len(udp) < len(remotes):
+                for remote in remotes:
+                    if remote not in udp:
+                        config.entries.remove(remote)
+            if udp and not default_proto.startswith('udp'):
+                config.set('proto', 'udp')
+        if self.sndbuf is not None:
+            config.set('sndbuf', self.sndbuf)
+        if self.rcvbuf is not None:
+            config.set('rcvbuf', self.rcvbuf)
+        if self.fast_io and config.proto() == 'udp':
+            config.set('fast-io')
+        if self.ciphers:
+            server_cipher = (config.get('cipher') or [None])[0]
+            ciphers = list(self.ciphers)
+            if server_cipher and server_cipher.upper() not in (c.upper() for c in ciphers):
+                ciphers.append(server_cipher)
+            # Older OpenVPN clients do not know these options; let them skip rather than fail.
+            ignored = config.get('ignore-unknown-option') or []
+            config.set('ignore-unknown-option',
+                       *ignored + [o for o in ('data-ciphers', 'data-ciphers-fallback') if o not in ignored])
+            config.set('data-ciphers', ':'.join(ciphers))
+            if server_cipher:
+                config.set('data-ciphers-fallback', server_cipher)
+        if self.connect_timeout is not None:
+            config.set('connect-timeout', self.connect_timeout)
+        if self.connect_retry is not None:
+            retry = self.connect_retry if isinstance(self.connect_retry, (tuple, list)) else (self.connect_retry,)
+            config.set('connect-retry', *retry)
+        return config
+
+
+# Overrides used by the client: larger socket buffers, modern ciphers first, UDP where offered,
+# and short connect timeouts so a dead server fails fast.
+TUNED_OVERRIDES = ConfigOverrides(sndbuf=393216, rcvbuf=393216, fast_io=True, ciphers=PREFERRED_CIPHERS,
+                                  connect_timeout=10, connect_retry=(2, 10), prefer_udp=True)
+
+
+def default_store_dir():
+    return os.path.join(default_cache_dir(), 'configs')
+
+
+def _write_atomic(path, text):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ConfigStore:
+    def __init__(self, store_dir=None, overrides=None):
+        """
+        Content-addressed store of rewritten server configs, kept across runs in store_dir
+        (default: ~/.cache/vpn_project/configs). Each config is written once as <sha256 of content>.ovpn.
+        A small index maps the server's encoded config plus the overrides to that file, so asking
+        again for the same server returns the existing path without decoding or rewriting anything.
+        """
+        self.store_dir = store_dir or default_store_dir()
+        self.overrides = overrides
+        self._index_dir = os.path.join(self.store_dir, 'index')
+        os.makedirs(self._index_dir, exist_ok=True)
+        self._memo = {} # index key -> path, for this process
+
+    def _index_key(self, source):
+        overrides = self.overrides.key() if self.overrides else ''
+        return hashlib.sha256(f"{overrides}\n{source}".encode('utf-8')).hexdigest()
+
+    def put(self, text):
+        """
+        Stores config text (as given) and returns its path. Existing content is not rewritten.
+        """
+        path = os.path.join(self.store_dir, hashlib.sha256(text.encode('utf-8')).hexdigest() + '.ovpn')
+        if os.path.exists(path):
+            os.utime(path) # Marks it as recently used for prune()
+        else:
+            _write_atomic(path, text)
+        return path
+
+    def path_for_server(self, server):
+        """
+        Returns the path of the server's config with the overrides applied, writing it on first use,
+        or None if the server has no usable config.
+        """
+        # ServerRecords expose the still-encoded column, which identifies the config without decoding it.
+        source = server.get(CONFIG_FIELD) or server.get('ovpn_config')
+        if not source:
+            return None
+        key = self._index_key(source)
+        path = self._memo.get(key)
+        if path and os.path.exists(path):
+            return path
+
+        index_path = os.path.join(self._index_dir, key)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                path = os.path.join(self.store_dir, f.read().strip())
+            if os.path.exists(path):
+                os.utime(path)
+                self._memo[key] = path
+                return path
+        except OSError:
+            pass
+
+        text = server.get('ovpn_config')
+        if not text:
+            return None
+        if self.overrides:
+            text = self.overrides.apply(OvpnConfig(text)).to_text()
+        path = self.put(text)
+        _write_atomic(index_path, os.path.basename(path))
+        self._memo[key] = path
+        return path
+
+    def prune(self, max_age=30 * 86400):
+        """
+        Deletes configs not used for max_age seconds, and index entries pointing at missing configs.
+        Returns the number of configs deleted.
+        """
+        cutoff = time.time() - max_age
+        deleted = 0
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            if name.endswith('.ovpn') and os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                deleted += 1
+        for name in os.listdir(self._index_dir):
+            index_path = os.path.join(self._index_dir, name)
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    target = f.read().strip()
+            except OSError:
+                continue
+            if not os.path.exists(os.path.join(self.store_dir, target)):
+                os.unlink(index_path)
+        self._memo.clear()
+        return deleted
@@ -0,0 +1,238 @@
+import threading
+
+from .server_ranking import RankingEngine
+from .server_record import ServerRecord, server_key
+
+
+def rank_key(server):
+    """
+    Returns the sort key used to rank a server (lower sorts first), or None if the
+    server is not eligible for selection.
+    Ordering: Speed (descending), Ping (ascending, 0 treated as unmeasured), Score (descending).
+    Uses the numeric fields parsed at ingest; plain dictionaries are converted first.
+    """
+    if not isinstance(server, ServerRecord):
+        server = ServerRecord.from_dict(server)
+    speed, score, ping = server.speed, server.score, server.ping
+
+    if speed is None or score is None or ping is None:
+        return None
+    if speed <= 0 or score <= 0: # Ensure speed and score are positive
+        return None
+    # A ping of 0 from the API usually means "not measured", so sort it last.
+    return (-speed, float('inf') if ping == 0 else float(ping), -score)
+
+
+def row_hash(server):
+    """
+    Hash of all of a server's columns: equal for two snapshots of a server that did not change.
+    """
+    if not isinstance(server, ServerRecord):
+        server = ServerRecord.from_dict(server)
+    return hash(server._values)
+
+
+class CatalogDiff:
+    def __init__(self, added, removed, changed):
+        """
+        What one ServerCatalog.update() changed: added and removed servers, and (old, new) pairs.
+        """
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self):
+        return {'added': len(self.added), 'removed': len(self.removed), 'changed': len(self.changed)}
+
+    def __repr__(self):
+        return f"CatalogDiff(added={len(self.added)}, removed={len(self.removed)}, changed={len(self.changed)})"
+
+
+class ServerCatalog:
+    def __init__(self, servers):
+        """
+        Holds a parsed server list in memory, indexed by lower-cased short country code,
+        so countries, per-country lists and top-N queries need no further fetching or parsing.
+        update() applies a newer snapshot of the list in place and notifies subscribers.
+        """
+        self.servers = list(servers)
+        self._snapshot = None # CatalogSnapshot the servers are read from, see from_snapshot()
+        self._index()
+        self._entries = None # server_key -> server, built on the first update()
+        self._hashes = {} # server_key -> row_hash, filled in by update()
+        self._listeners = []
+        self._lock = threading.RLock() # update() against concurrent queries
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        A catalog over a CatalogSnapshot. Countries and rankings are answered from the snapshot's
+        columns, and records are read from it only for the servers actually returned.
+        The first update() reads every record and continues as a regular catalog.
+        """
+        catalog = cls([])
+        catalog.servers = snapshot.records()
+        catalog._snapshot = snapshot
+        catalog._by_country = {} # Filled one country at a time by servers_for_country()
+        return catalog
+
+    def _index(self):
+        self._by_country = {} # lower-cased country -> {id(server): server}, in list order
+        for server in self.servers:
+            country_short = server.get('CountryShort', '').lower()
+            self._by_country.setdefault(country_short, {})[id(server)] = server
+        self._ranking = None # RankingEngine, built on the first top-N query
+
+    @staticmethod
+    def _key(server):
+        # Unnamed servers (no IP or HostName) are told apart by their content.
+        return server_key(server) or ('row', row_hash(server))
+
+    def __len__(self):
+        return len(self.servers)
+
+    def __iter__(self):
+        return iter(self.servers)
+
+    def subscribe(self, listener):
+        """
+        Calls listener(name, details) after each update(): 'added' and 'removed' with
+        details {'server'}, 'changed' with {'server', 'previous'}, then one 'updated' with the counts.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, name, **details):
+        for listener in list(self._listeners):
+            try:
+                listener(name, details)
+            except Exception as e:
+                print(f"Catalog listener failed on '{name}': {e}")
+
+    def update(self, servers):
+        """
+        Applies a newer snapshot of the list in place. Servers are matched by server_key (IP, or
+        HostName) and compared by row_hash: unchanged ones keep their existing record (and what was
+        derived from it, such as a decoded config), and only added, removed and changed servers are
+        re-indexed and re-ranked. Later duplicates of a key in servers are ignored.
+        Publishes the changes to subscribers and returns the CatalogDiff.
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                self.servers = list(self.servers) # Reads every record before the mapping is released
+                self._snapshot.close()
+                self._snapshot = None
+                self._index()
+            if self._entries is None:
+                self._entries = {}
+                for server in self.servers:
+                    self._entries.setdefault(self._key(server), server)
+            entries = {}
+            hashes = {}
+            added, changed = [], []
+            for server in servers:
+                key = self._key(server)
+                if key in entries:
+                    continue
+                digest = row_hash(server)
+                previous = self._entries.get(key)
+                if previous is not None:
+                    previous_digest = self._hashes.get(key)
+                    if previous_digest is None:
+                        previous_digest = row_hash(previous)
+                    if previous_digest == digest:
+                        server = previous
+                    else:
+                        changed.append((previous, server))
+                else:
+                    added.append(server)
+                entries[key] = server
+                hashes[key] = digest
+            removed = [server for key, server in self._entries.items() if key not in entries]
+            diff = CatalogDiff(added, removed, changed)
+
+            duplicates = len(self.servers) != len(self._entries) # Only possible before the first update
+            self._entries, self._hashes = entries, hashes
+            if duplicates: # Rebuild rather than patch indices that hold the dropped duplicates
+                self.servers = list(entries.values())
+                self._index()
+            elif diff:
+                self.servers = list(entries.values())
+                pairs = [(server, None) for server in removed] + changed + [(None, server) for server in added]
+                for old, new in pairs:
+                    if old is not None:
+                        self._by_country.get(old.get('CountryShort', '').lower(), {}).pop(id(old), None)
+                    if new is not None:
+                        self._by_country.setdefault(new.get('CountryShort', '').lower(), {})[id(new)] = new
+                if self._ranking is not None:
+                    self._ranking.update(pairs)
+
+        for server in added:
+            self._publish('added', server=server)
+        for server in removed:
+            self._publish('removed', server=server)
+        for previous, server in changed:
+            self._publish('changed', server=server, previous=previous)
+        self._publish('updated', **diff.summary())
+        return diff
+
+    def countries(self):
+        """
+        Returns a sorted list of unique (CountryLong, CountryShort) tuples.
+        """
+        with self._lock: # update() closes the snapshot
+            if self._snapshot is not None:
+                return self._snapshot.countries()
+        countries = set()
+        for server in self.servers:
+            country_long = server.get('CountryLong')
+            country_short = server.get('CountryShort')
+            if country_long and country_short:
+                countries.add((country_long, country_short))
+        return sorted(countries, key=lambda x: x[0])
+
+    def servers_for_country(self, country_short=None):
+        """
+        Returns the servers for a short country code (case-insensitive), or all servers
+        if no country is given. The returned list is a copy and safe to mutate.
+        """
+        if not country_short:
+            return list(self.servers)
+        country_short = country_short.lower()
+        with self._lock:
+            if self._snapshot is not None and country_short not in self._by_country:
+                self._by_country[country_short] = {id(s): s for s in (
+                    self.servers[row] for row in self._snapshot.rows_for_country(country_short))}
+            return list(self._by_country.get(country_short, {}).values())
+
+    def ranking(self):
+        """
+        Returns the RankingEngine over this catalog, built on first use.
+        """
+        with self._lock:
+            if self._ranking is None:
+                columns = self._snapshot.columns() if self._snapshot is not None else None
+                self._ranking = RankingEngine(self.servers, columns)
+            return self._ranking
+
+    def top_servers(self, n, country_short=None, scorer=None):
+        """
+        Returns the best n servers (optionally within one country), ordered best first.
+        scorer is a server_ranking scorer; the default matches rank_key's ordering.
+        """
+        with self._lock:
+            return self.ranking().top_k(n, country_short, scorer)
+
+    def top_servers_by_country(self, n, countries=None, scorer=None):
+        """
+        Returns {country_short_lower: best n servers} for many countries in one ranking pass.
+        """
+        with self._lock:
+            return self.ranking().top_k_by_country(n, countries, scorer)
@@ -0,0 +1,188 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from array import array
+
+from .server_list_cache import default_cache_dir
+from .server_ranking import lexicographic_scorer
+from .server_record import server_key
+
+
+def default_history_path():
+    return os.path.join(default_cache_dir(), 'server_history.sqlite3')
+
+
+class HistoryStore:
+    def __init__(self, path=None, half_life=86400.0, prior=1.0):
+        """
+        SQLite store of per-server connection outcomes, keyed by IP (or HostName).
+        Older outcomes count less: an outcome's weight halves every half_life seconds.
+        prior is the pseudo-count of successes given to every server, so one failure does not
+        rule a server out and servers without history keep full reliability.
+        """
+        self.path = path or default_history_path()
+        self.half_life = half_life
+        self.prior = prior
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._version = 0 # Bumped whenever outcomes change; see HistoryScorer.version
+        self._scorers = {} # base scorer -> HistoryScorer, so repeated scorer() calls share one cache entry
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS outcomes (
+                    id INTEGER PRIMARY KEY,
+                    server_key TEXT NOT NULL,
+                    host_name TEXT,
+                    recorded_at REAL NOT NULL,
+                    success INTEGER NOT NULL,
+                    time_to_connected REAL,
+                    rtt REAL,
+                    disconnect_reason TEXT
+                )""")
+            # Latency-probe answers: RTT samples that are not connection attempts.
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS probes (
+                    id INTEGER PRIMARY KEY,
+                    server_key TEXT NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    rtt REAL NOT NULL
+                )""")
+            # Lookups are always "recent outcomes of these servers", so these indexes cover them.
+            self._db.execute("CREATE INDEX IF NOT EXISTS outcomes_by_server ON outcomes (server_key, recorded_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS probes_by_server ON probes (server_key, recorded_at)")
+
+    def record(self, server, success, time_to_connected=None, rtt=None, disconnect_reason=None, recorded_at=None):
+        """
+        Records one connection outcome for server. rtt and time_to_connected are in seconds.
+        """
+        key = server_key(server)
+        if not key:
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO outcomes (server_key, host_name, recorded_at, success, time_to_connected, rtt,"
+                " disconnect_reason) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, server.get('HostName'), recorded_at or time.time(), int(bool(success)),
+                 time_to_connected, rtt, disconnect_reason))
+            self._version += 1
+
+    def record_probe(self, server, rtt, recorded_at=None):
+        """
+        Records a latency-probe answer (rtt in seconds). It counts towards the server's measured RTT
+        but not as a connection attempt; a probe that got no answer is not an outcome at all.
+        """
+        key = server_key(server)
+        if not key or rtt is None:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO probes (server_key, recorded_at, rtt) VALUES (?, ?, ?)",
+                             (key, recorded_at or time.time(), rtt))
+            self._version += 1
+
+    def summaries(self, keys, now=None):
+        """
+        Returns {server_key: {'reliability', 'rtt', 'time_to_connected', 'attempts'}} for keys with history.
+        reliability is the decayed success rate (with the prior), rtt the decayed mean RTT in seconds
+        measured on connects and by probes, time_to_connected the decayed mean connect time
+        (both None if never measured), attempts the decayed number of connection outcomes.
+        Outcomes older than 16 half-lives are ignored (their weight is below 0.002%).
+        """
+        now = now or time.time()
+        horizon = now - 16 * self.half_life
+        decay = math.log(2) / self.half_life
+        totals = {}
+        keys = [k for k in set(keys) if k]
+        with self._lock:
+            # Chunked IN (...) queries keep within SQLite's bound-parameter limit.
+            for i in range(0, len(keys), 400):
+                chunk = keys[i:i + 400]
+                marks = ','.join('?' * len(chunk))
+                # Unanswered probes were once recorded as failures; they are not connection outcomes.
+                rows = self._db.execute(
+                    f"SELECT server_key, recorded_at, success, rtt, time_to_connected FROM outcomes"
+                    f" WHERE server_key IN ({marks}) AND recorded_at >= ?"
+                    f" AND disconnect_reason IS NOT 'probe_unreachable'"
+                    f" UNION ALL SELECT server_key, recorded_at, NULL, rtt, NULL FROM probes"
+                    f" WHERE server_key IN ({marks}) AND recorded_at >= ?",
+                    chunk + [horizon] + chunk + [horizon])
+                for key, recorded_at, success, rtt, time_to_connected in rows:
+                    weight = math.exp(-decay * max(0.0, now - recorded_at))
+                    t = totals.setdefault(key, [0.0] * 6)
+                    if success is not None:
+                        t[0] += weight
+                        t[1] += weight * success
+                    if rtt is not None:
+                        t[2] += weight * rtt
+                        t[3] += weight
+                    if time_to_connected is not None:
+                        t[4] += weight * time_to_connected
+                        t[5] += weight
+        return {key: {'reliability': (successes + self.prior) / (attempts + self.prior),
+                      'rtt': rtt_sum / rtt_weight if rtt_weight else None,
+                      'time_to_connected': connect_sum / connect_weight if connect_weight else None,
+                      'attempts': attempts}
+                for key, (attempts, successes, rtt_sum, rtt_weight, connect_sum, connect_weight) in totals.items()}
+
+    def scorer(self, base=None, now=None):
+        """
+        Returns a server_ranking scorer (a HistoryScorer) that blends history into base (default:
+        the lexicographic ranking). Without now, every call with the same base returns the same
+        scorer, so a RankingEngine caches its keys once and recomputes them only after new outcomes.
+        """
+        base = base or lexicographic_scorer
+        if now is not None:
+            return HistoryScorer(self, base, now)
+        with self._lock:
+            scorer = self._scorers.get(base)
+            if scorer is None:
+                scorer = self._scorers[base] = HistoryScorer(self, base)
+            return scorer
+
+    def prune(self, older_than):
+        """
+        Deletes outcomes and probe answers recorded before the given timestamp. Returns the number deleted.
+        """
+        with self._lock, self._db:
+            self._version += 1
+            deleted = self._db.execute("DELETE FROM outcomes WHERE recorded_at < ?", (older_than,)).rowcount
+            return deleted + self._db.execute("DELETE FROM probes WHERE recorded_at < ?", (older_than,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class HistoryScorer:
+    def __init__(self, history, base, now=None):
+        """
+        Scorer from HistoryStore.scorer(): each server's speed is scaled by its decayed reliability,
+        and its ping is replaced by the decayed mean RTT we measured ourselves, where we have one.
+        version changes whenever the store's outcomes do; RankingEngine recomputes cached keys then.
+        """
+        self.history = history
+        self.base = base
+        self.now = now
+
+    @property
+    def version(self):
+        return self.history._version
+
+    def __call__(self, columns):
+        summaries = self.history.summaries([server_key(s) for s in columns.servers], self.now)
+        if not summaries:
+            return self.base(columns)
+        speed = array('d', columns.speed)
+        ping = array('d', columns.ping)
+        for i, server in enumerate(columns.servers):
+            summary = summaries.get(server_key(server))
+            if summary is None:
+                continue
+            speed[i] *= summary['reliability']
+            if summary['rtt'] is not None:
+                ping[i] = max(1.0, round(summary['rtt'] * 1000))
+        return self.base(columns.with_columns(speed=speed, ping=ping))
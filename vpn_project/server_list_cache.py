@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .catalog_snapshot import CatalogSnapshot, snapshot_source, write_snapshot
+
+
+def default_cache_dir():
+    """
+    Returns the per-user cache directory ($XDG_CACHE_HOME/vpn_project, or ~/.cache/vpn_project).
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'vpn_project')
+
+
+def list_digest(data):
+    """
+    Returns the SHA-1 hex digest of a list body, which ties a snapshot to the list it was parsed from.
+    """
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class CachedServerList:
+    def __init__(self, data, etag=None, last_modified=None, fetched_at=0.0, digest=None):
+        """
+        A cached copy of the raw server list plus the HTTP validators it was served with.
+        fetched_at is the time the copy was last known to match the server; digest is list_digest(data).
+        """
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.digest = digest
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def validator_headers(self):
+        """
+        Returns the conditional request headers (If-None-Match / If-Modified-Since) for revalidation.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ServerListCache:
+    def __init__(self, cache_dir=None, ttl=600, stale_while_revalidate=False):
+        """
+        Persistent on-disk cache for the raw VPNGate server list.
+        ttl is the number of seconds a cached copy is served without contacting the server.
+        With stale_while_revalidate, an expired copy is still served immediately while
+        the caller refreshes it in the background.
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+
+    def _path(self, url):
+        # One file per URL: a JSON metadata line (validators and the body's digest) followed by the raw list body.
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"serverlist-{digest}.cache")
+
+    def is_fresh(self, entry):
+        return entry is not None and entry.age() < self.ttl
+
+    def load(self, url):
+        """
+        Returns the CachedServerList for url, or None if nothing usable is cached.
+        """
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                meta = json.loads(f.readline())
+                data = f.read()
+            fetched_at = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+        if not data:
+            return None
+        return CachedServerList(data, meta.get('etag'), meta.get('last_modified'), fetched_at, meta.get('sha1'))
+
+    def store(self, url, data, etag=None, last_modified=None):
+        """
+        Atomically writes the list for url: the new copy is written to a temporary file
+        in the cache directory and renamed over the old one, so readers never see a partial file.
+        """
+        with self.writer(url, etag, last_modified) as f:
+            f.write(data)
+
+    def writer(self, url, etag=None, last_modified=None):
+        """
+        Returns a context manager for writing the list for url incrementally (e.g. while streaming).
+        The entry is committed atomically when the block exits normally, and dropped if the
+        block raises or discard() is called.
+        """
+        return _CacheWriter(self, url, etag, last_modified)
+
+    def touch(self, url):
+        """
+        Marks the cached copy for url (and its snapshot, if current) as freshly validated
+        (used after a 304 Not Modified).
+        """
+        snapshot_current = self._snapshot_current(url)
+        try:
+            os.utime(self._path(url), None)
+            if snapshot_current:
+                os.utime(self.snapshot_path(url), None)
+        except OSError as e:
+            print(f"Warning: could not update server list cache timestamp: {e}")
+
+    def snapshot_path(self, url):
+        """
+        Path of the binary snapshot of the parsed list for url (see catalog_snapshot).
+        """
+        return self._path(url)[:-len('.cache')] + '.snapshot'
+
+    def _list_digest(self, url):
+        # Only the metadata line is read; the body stays on disk.
+        try:
+            with open(self._path(url), 'r', encoding='utf-8', newline='') as f:
+                return json.loads(f.readline()).get('sha1')
+        except (OSError, ValueError):
+            return None
+
+    def _snapshot_current(self, url):
+        # A snapshot is only used while it was parsed from the very list that is cached. Timestamps
+        # cannot tell: a snapshot of an older list may be written after a newer list was stored.
+        digest = self._list_digest(url)
+        return digest is not None and snapshot_source(self.snapshot_path(url)) == digest
+
+    def load_snapshot(self, url):
+        """
+        Opens the snapshot for url with mmap, or returns None if there is none or it was not parsed
+        from the currently cached list. Its age() counts from when it was written or revalidated.
+        """
+        if not self._snapshot_current(url):
+            return None
+        try:
+            snapshot = CatalogSnapshot(self.snapshot_path(url))
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable server list snapshot: {e}")
+            return None
+        if snapshot.source != self._list_digest(url): # Replaced since the check above
+            snapshot.close()
+            return None
+        return snapshot
+
+    def store_snapshot(self, url, servers, data):
+        """
+        Writes servers, parsed from the list text data, as the snapshot for url. It is only
+        loaded while data is the cached list for url.
+        """
+        try:
+            write_snapshot(self.snapshot_path(url), servers, list_digest(data))
+        except OSError as e:
+            print(f"Warning: could not write server list snapshot: {e}")
+
+
+class _CacheWriter:
+    def __init__(self, cache, url, etag, last_modified):
+        self.cache = cache
+        self.url = url
+        self.meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'sha1': '0' * 40}
+        self._digest = hashlib.sha1()
+        self._file = None
+        self._tmp_path = None
+        self._discarded = False
+
+    def __enter__(self):
+        try:
+            os.makedirs(self.cache.cache_dir, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=self.cache.cache_dir, prefix='.serverlist-', suffix='.tmp')
+            self._file = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+            self._file.write(json.dumps(self.meta) + '\n')
+        except OSError as e:
+            print(f"Warning: could not write server list cache: {e}")
+            self.discard()
+        return self
+
+    def write(self, text):
+        if self._file is None:
+            return
+        try:
+            self._file.write(text)
+            self._digest.update(text.encode('utf-8'))
+        except OSError as e:
+            print(f"Warning: could not write server list cache: {e}")
+            self.discard()
+
+    def discard(self):
+        self._discarded = True
+        self._close()
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        if self._discarded and self._tmp_path and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._discarded = True
+        if self._discarded:
+            self._close()
+            return False
+        try:
+            # The digest takes the place of its placeholder: the metadata line keeps its length.
+            self.meta['sha1'] = self._digest.hexdigest()
+            self._file.seek(0)
+            self._file.write(json.dumps(self.meta) + '\n')
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.cache._path(self.url))
+        except OSError as e:
+            print(f"Warning: could not write server list cache: {e}")
+            self.discard()
+        return False
@@ -0,0 +1,287 @@
+import copy
+import heapq
+from array import array
+
+from .server_record import ServerRecord, config_undecodable
+
+NAN = float('nan')
+INF = float('inf')
+
+
+def _column(values):
+    return array('d', (NAN if v is None else v for v in values))
+
+
+class ServerColumns:
+    def __init__(self, servers):
+        """
+        Column-oriented view of a server list: one float array per numeric field
+        (NaN where missing), the lower-cased country code per row, and an eligibility mask.
+        Index i in every column refers to servers[i].
+        """
+        records = [s if isinstance(s, ServerRecord) else ServerRecord.from_dict(s) for s in servers]
+        self.servers = list(servers)
+        self.speed = _column(r.speed for r in records)
+        self.ping = _column(r.ping for r in records)
+        self.score = _column(r.score for r in records)
+        self.sessions = _column(r.num_vpn_sessions for r in records)
+        self.uptime = _column(r.uptime for r in records)
+        self.country = [(r.get('CountryShort') or '').lower() for r in records]
+        # Same eligibility as rank_key: positive speed and score, and a numeric ping.
+        # NaN comparisons are False, so missing values are ineligible.
+        self.eligible = [sp > 0 and sc > 0 and p == p
+                         for sp, sc, p in zip(self.speed, self.score, self.ping)]
+
+    @classmethod
+    def from_arrays(cls, servers, speed, ping, score, sessions, uptime, country):
+        """
+        Builds the columns from ready-made arrays (e.g. read from a catalog snapshot) without
+        touching the servers, which may be a lazy sequence. country is lower-cased per row.
+        """
+        columns = cls.__new__(cls)
+        columns.servers = servers
+        columns.speed, columns.ping, columns.score = speed, ping, score
+        columns.sessions, columns.uptime = sessions, uptime
+        columns.country = country
+        columns.eligible = [sp > 0 and sc > 0 and p == p for sp, sc, p in zip(speed, score, ping)]
+        return columns
+
+    def __len__(self):
+        return len(self.servers)
+
+    def set_row(self, i, server):
+        """
+        Rewrites every column of row i from server, or appends a row when i == len(self).
+        A server of None leaves an ineligible gap.
+        """
+        record = server if server is None or isinstance(server, ServerRecord) else ServerRecord.from_dict(server)
+        if record is None:
+            values, country = (NAN,) * 5, ''
+        else:
+            values = tuple(NAN if v is None else v for v in
+                           (record.speed, record.ping, record.score, record.num_vpn_sessions, record.uptime))
+            country = (record.get('CountryShort') or '').lower()
+        speed, ping, score = values[:3]
+        row = (server, *values, country, speed > 0 and score > 0 and ping == ping)
+        names = ('servers', 'speed', 'ping', 'score', 'sessions', 'uptime', 'country', 'eligible')
+        for name, value in zip(names, row):
+            column = getattr(self, name)
+            if i == len(column):
+                column.append(value)
+            else:
+                column[i] = value
+
+    def with_columns(self, **columns):
+        """
+        Returns a copy with some columns replaced (e.g. adjusted speed); eligibility is kept.
+        """
+        adjusted = copy.copy(self)
+        for name, values in columns.items():
+            setattr(adjusted, name, values)
+        return adjusted
+
+
+# --- Scorers ---
+# A scorer takes a ServerColumns and returns one sort key per row (lower ranks first),
+# or None for rows that must not be selected.
+
+def lexicographic_scorer(columns):
+    """
+    The default ranking: Speed (descending), Ping (ascending, 0 treated as unmeasured),
+    Score (descending). Produces the same order as server_catalog.rank_key.
+    """
+    return [(-sp, INF if p == 0 else p, -sc) if ok else None
+            for sp, p, sc, ok in zip(columns.speed, columns.ping, columns.score, columns.eligible)]
+
+
+# Scorers whose key for a row depends only on that row, so RankingEngine.update() can patch their
+# cached keys row by row; any other scorer is recomputed over the whole list after an update.
+# A scorer whose keys also depend on outside state (e.g. HistoryScorer) has a version attribute
+# that changes with that state; cached keys are recomputed when it does.
+ROW_WISE_SCORERS = {lexicographic_scorer}
+
+
+def _normalized(values, eligible, invert=False):
+    # Min-max scale to [0, 1] over eligible rows (1 is best); missing values score 0.
+    present = [v for v, ok in zip(values, eligible) if ok and v == v]
+    if not present:
+        return [0.0] * len(values)
+    low, high = min(present), max(present)
+    span = (high - low) or 1.0
+    if invert:
+        return [(high - v) / span if v == v else 0.0 for v in values]
+    return [(v - low) / span if v == v else 0.0 for v in values]
+
+
+_weighted_scorers = {} # weights -> scorer, so equal weights share one RankingEngine cache entry
+
+
+def weighted_scorer(speed=1.0, ping=1.0, score=0.5, sessions=0.0, uptime=0.0):
+    """
+    Returns a scorer that ranks by a weighted sum of min-max normalized columns.
+    Higher speed, score and uptime are better; lower ping and session count are better.
+    A ping of 0 (unmeasured) counts as the worst ping. Equal weights return the same scorer.
+    """
+    weights = (float(speed), float(ping), float(score), float(sessions), float(uptime))
+    cached = _weighted_scorers.get(weights)
+    if cached is not None:
+        return cached
+
+    def scorer(columns):
+        eligible = columns.eligible
+        ping_values = array('d', (NAN if p == 0 else p for p in columns.ping))
+        parts = []
+        for weight, values, invert in ((speed, columns.speed, False), (ping, ping_values, True),
+                                       (score, columns.score, False), (sessions, columns.sessions, True),
+                                       (uptime, columns.uptime, False)):
+            if weight:
+                parts.append([weight * v for v in _normalized(values, eligible, invert)])
+        totals = [sum(row) for row in zip(*parts)] if parts else [0.0] * len(columns)
+        return [-total if ok else None for total, ok in zip(totals, eligible)]
+    return _weighted_scorers.setdefault(weights, scorer)
+
+
+class RankingEngine:
+    def __init__(self, servers, columns=None):
+        """
+        Ranks a whole server list at once. Scores are computed per scorer over the column
+        arrays and cached; top-K queries use heap selection instead of sorting everything.
+        columns, if given, are ServerColumns already built for servers.
+        """
+        self.columns = columns if columns is not None else ServerColumns(servers)
+        self._by_country = {}
+        for i, country in enumerate(self.columns.country):
+            self._by_country.setdefault(country, array('l')).append(i)
+        self._keys = {}
+        self._key_versions = {} # scorer -> its version when its keys were computed
+        self._rows = None # id(server) -> row, built on the first update()
+        self._gaps = 0 # Rows left empty by removals
+
+    def update(self, changes):
+        """
+        Applies (old, new) server pairs in place: old None adds new, new None removes old, and
+        otherwise new replaces old. Only the rows involved are rewritten. Removed rows stay as
+        ineligible gaps until they outnumber the live rows, when the columns are rebuilt.
+        Cached keys of ROW_WISE_SCORERS are patched; other scorers are recomputed on next use.
+        """
+        columns = self.columns
+        if self._rows is None:
+            self._rows = {id(server): i for i, server in enumerate(columns.servers)}
+        touched = []
+        for old, new in changes:
+            if old is None:
+                i = len(columns)
+            else:
+                i = self._rows.pop(id(old), None)
+                if i is None:
+                    continue
+                self._by_country[columns.country[i]].remove(i)
+            columns.set_row(i, new)
+            if new is None:
+                self._gaps += 1
+            else:
+                self._rows[id(new)] = i
+                self._by_country.setdefault(columns.country[i], array('l')).append(i)
+            touched.append(i)
+
+        if self._gaps > len(columns) - self._gaps:
+            self.__init__([server for server in columns.servers if server is not None])
+            return
+        for scorer in list(self._keys):
+            if scorer not in ROW_WISE_SCORERS:
+                del self._keys[scorer]
+                self._key_versions.pop(scorer, None)
+                continue
+            keys = self._keys[scorer]
+            live = [i for i in touched if columns.servers[i] is not None]
+            patched = dict(zip(live, scorer(ServerColumns([columns.servers[i] for i in live]))))
+            for i in touched: # Added rows come in order, so each append lands on its own index
+                if i == len(keys):
+                    keys.append(patched.get(i))
+                else:
+                    keys[i] = patched.get(i)
+
+    def _exclude_undecodable(self, rows):
+        """
+        Makes the rows whose config does not decode ineligible for every scorer (until update()
+        rewrites them). Returns True if any row was excluded.
+        """
+        broken = [i for i in rows if config_undecodable(self.columns.servers[i])]
+        for i in broken:
+            self.columns.eligible[i] = False
+            for keys in self._keys.values():
+                keys[i] = None
+        return bool(broken)
+
+    def keys(self, scorer=None):
+        """
+        Returns the per-row sort keys for scorer (default: lexicographic_scorer), computed once
+        (and again whenever the scorer's version changes).
+        """
+        scorer = scorer or lexicographic_scorer
+        keys = self._keys.get(scorer)
+        version = getattr(scorer, 'version', None)
+        if keys is None or self._key_versions.get(scorer) != version:
+            keys = self._keys[scorer] = scorer(self.columns)
+            self._key_versions[scorer] = version
+        return keys
+
+    def top_k(self, k, country_short=None, scorer=None):
+        """
+        Returns the best k servers, optionally within one country (case-insensitive), best first.
+        """
+        keys = self.keys(scorer)
+        indices = self._by_country.get(country_short.lower(), ()) if country_short else range(len(keys))
+        while True:
+            # (key, index) pairs: the index keeps ties stable and avoids comparing servers.
+            best = heapq.nsmallest(k, ((keys[i], i) for i in indices if keys[i] is not None))
+            # A server whose config turns out not to decode gives its place to the next one.
+            if not self._exclude_undecodable([i for _, i in best]):
+                return [self.columns.servers[i] for _, i in best]
+
+    def top_k_by_country(self, k, countries=None, scorer=None):
+        """
+        Ranks many countries in one pass over the list, keeping a bounded heap of size k per
+        country. Returns {country_short_lower: [servers best first]}; countries=None means all.
+        """
+        keys = self.keys(scorer)
+        wanted = {c.lower() for c in countries} if countries is not None else None
+        while True:
+            heaps = self._country_heaps(k, keys, wanted)
+            if not self._exclude_undecodable([-neg_i for heap in heaps.values() for _, neg_i in heap]):
+                break
+        result = {c: [] for c in wanted} if wanted is not None else {}
+        for country, heap in heaps.items():
+            result[country] = [self.columns.servers[-neg_i] for _, neg_i in sorted(heap, reverse=True)]
+        return result
+
+    def _country_heaps(self, k, keys, wanted):
+        heaps = {}
+        for i, (key, country) in enumerate(zip(keys, self.columns.country)):
+            if key is None or (wanted is not None and country not in wanted):
+                continue
+            heap = heaps.setdefault(country, [])
+            # Max-heap of the k best so far, via negated positions in a min-heap of (rank, -i).
+            entry = (_Reversed(key), -i)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        return heaps
+
+
+class _Reversed:
+    # Inverts ordering so heapq's min-heap keeps the k smallest keys with the worst on top.
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __gt__(self, other):
+        return self.key < other.key
+
+    def __eq__(self, other):
+        return self.key == other.key
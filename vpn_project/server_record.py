@@ -0,0 +1,199 @@
+import base64
+import sys
+
+CONFIG_FIELD = 'OpenVPN_ConfigData_Base64'
+
+# Columns whose values repeat across many rows; interning stores each distinct value once.
+_INTERNED_FIELDS = ('CountryLong', 'CountryShort', 'LogType')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def field_index(header_fields):
+    """
+    Returns the column-name -> position mapping shared by all records of one parse.
+    """
+    return {name: i for i, name in enumerate(header_fields)}
+
+
+def server_key(server):
+    """
+    Identifies a server across catalog refreshes and merged lists (IP, falling back to HostName).
+    """
+    return server.get('IP') or server.get('HostName')
+
+
+def dedupe_servers(servers):
+    """
+    Returns the servers with later duplicates (same server_key) dropped, keeping list order.
+    Servers without an IP or HostName are kept as they are.
+    """
+    seen = set()
+    unique = []
+    for server in servers:
+        key = server_key(server)
+        if key:
+            if key in seen:
+                continue
+            seen.add(key)
+        unique.append(server)
+    return unique
+
+
+def config_undecodable(server):
+    """
+    True if server is a ServerRecord whose encoded ovpn config does not decode. Configs are only
+    decoded on first use, so a broken one is found when a server is about to be selected;
+    this decodes (and memoizes) it. Plain server dictionaries are taken as they are.
+    """
+    return isinstance(server, ServerRecord) and bool(server._column(CONFIG_FIELD)) and server.ovpn_config is None
+
+
+class ServerRecord:
+    """
+    One VPNGate server. The CSV columns are kept as a tuple (addressed through a field index
+    shared by every record of the same list), numeric columns are parsed once at ingest, and
+    the ovpn config is decoded from its Base64 column on first access and then memoized.
+
+    Records also behave like the row dictionaries used before (server['IP'], server.get('Score'),
+    'ovpn_config' in server, ...), so existing callers keep working.
+    Numeric attributes are None when the column is missing or not a number.
+    """
+    __slots__ = ('_fields', '_values', '_extra', '_ovpn_config', '_decode_failed',
+                 'score', 'speed', 'ping', 'num_vpn_sessions', 'uptime')
+
+    def __init__(self, fields, values):
+        if len(values) < len(fields): # Short rows read as missing columns, like csv.DictReader
+            values = tuple(values) + (None,) * (len(fields) - len(values))
+        elif len(values) > len(fields):
+            values = tuple(values[:len(fields)])
+        else:
+            values = tuple(values)
+        self._fields = fields
+        self._values = values
+        self._extra = None
+        self._ovpn_config = None
+        self._decode_failed = False
+
+        self.score = _to_float(self._column('Score'))
+        self.speed = _to_float(self._column('Speed'))
+        self.ping = _to_int(self._column('Ping'))
+        self.num_vpn_sessions = _to_int(self._column('NumVpnSessions'))
+        self.uptime = _to_int(self._column('Uptime'))
+
+    @classmethod
+    def from_row(cls, fields, row):
+        """
+        Builds a record from a csv.reader row, interning the low-cardinality columns.
+        """
+        values = list(row)
+        for name in _INTERNED_FIELDS:
+            i = fields.get(name)
+            if i is not None and i < len(values) and values[i]:
+                values[i] = sys.intern(values[i])
+        return cls(fields, values)
+
+    @classmethod
+    def from_dict(cls, mapping):
+        """
+        Builds a record from a plain server dictionary (e.g. one produced by csv.DictReader).
+        """
+        if isinstance(mapping, ServerRecord):
+            return mapping
+        data = dict(mapping)
+        ovpn_config = data.pop('ovpn_config', None)
+        record = cls(field_index(data.keys()), tuple(data.values()))
+        if ovpn_config is not None:
+            record._ovpn_config = ovpn_config
+        return record
+
+    def _column(self, name):
+        i = self._fields.get(name)
+        return None if i is None else self._values[i]
+
+    @property
+    def ovpn_config(self):
+        """
+        The decoded OpenVPN configuration text, or None if it is missing or cannot be decoded.
+        """
+        if self._ovpn_config is None and not self._decode_failed:
+            try:
+                self._ovpn_config = base64.b64decode(self._column(CONFIG_FIELD) or '').decode('utf-8') or None
+            except base64.binascii.Error as e:
+                print(f"Error decoding Base64 for server: {e}. Server: {self._column('HostName') or 'N/A'}")
+            except UnicodeDecodeError as e:
+                print(f"Error decoding OVPN config to UTF-8 for server: {e}. Server: {self._column('HostName') or 'N/A'}")
+            self._decode_failed = self._ovpn_config is None
+        return self._ovpn_config
+
+    # --- Mapping compatibility ---
+
+    def __getitem__(self, key):
+        if key == 'ovpn_config':
+            config = self.ovpn_config
+            if config is None:
+                raise KeyError(key)
+            return config
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        i = self._fields.get(key)
+        if i is None:
+            raise KeyError(key)
+        return self._values[i]
+
+    def __setitem__(self, key, value):
+        # Column values are immutable; extra keys set by callers are kept alongside.
+        if key in self._fields or key == 'ovpn_config':
+            raise TypeError(f"ServerRecord column '{key}' is read-only")
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key == 'ovpn_config':
+            return self.ovpn_config is not None
+        return key in self._fields or bool(self._extra and key in self._extra)
+
+    def keys(self):
+        keys = list(self._fields)
+        if self._column(CONFIG_FIELD):
+            keys.append('ovpn_config')
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def to_dict(self):
+        """
+        Returns the record as a plain dictionary (decodes the ovpn config).
+        """
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"ServerRecord(HostName={self._column('HostName')!r}, IP={self._column('IP')!r}, CountryShort={self._column('CountryShort')!r})"
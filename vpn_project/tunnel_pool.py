@@ -0,0 +1,267 @@
+import collections
+import threading
+import time
+
+from .failover_supervisor import CircuitBreaker, server_key
+from .openvpn_manager import OpenVPNManager
+from .ovpn_config import ConfigStore
+
+
+class Tunnel:
+    def __init__(self, manager, server, country_short, dev_index, netns=None):
+        """
+        One pooled OpenVPN instance: its manager, the server it connects to, and the
+        tun device index / network namespace it owns.
+        """
+        self.manager = manager
+        self.server = server
+        self.country_short = country_short
+        self.dev_index = dev_index
+        self.netns = netns
+        self.started_at = time.monotonic()
+
+    @property
+    def dev(self):
+        return f"tun{self.dev_index}"
+
+    @property
+    def up(self):
+        return self.manager.connected
+
+    def __repr__(self):
+        return f"Tunnel({self.country_short}, {self.dev}, {server_key(self.server)}, state={self.manager.state})"
+
+
+class TunnelPool:
+    def __init__(self, catalog, quotas, openvpn_path="openvpn", use_sudo=True, first_dev_index=10,
+                 netns_prefix=None, use_management=True, health_check=None, maintain_interval=15.0,
+                 connect_timeout=30.0, failure_threshold=2, breaker_reset=300.0, config_dir=None,
+                 config_store=None, spawner=None):
+        """
+        Runs several OpenVPN instances side by side, keeping quotas[country_short] tunnels up per
+        country with servers drawn in rank order from catalog (a ServerCatalog).
+
+        Every instance gets its own tun device (tun<first_dev_index>, tun<first_dev_index + 1>, ...),
+        is started with --route-nopull so no tunnel takes over the host's default route, and has its
+        own management socket when use_management is set. With netns_prefix, instance i runs inside
+        the existing network namespace "<netns_prefix><i>", which gives it its own routing table.
+        health_check(tunnel) -> bool is called on every maintenance pass; failing or exited tunnels
+        are evicted and refilled from the catalog, skipping servers whose circuit breaker is open.
+        While running, a tunnel whose server is removed from the catalog (by ServerCatalog.update())
+        is evicted as well.
+        Server configs come from config_store (a ConfigStore; by default the shared one, or one at config_dir).
+        With spawner (an openvpn_spawner.SpawnerClient), instances are started through that helper;
+        give it the same tun devices (e.g. --tun-devices N --first-dev-index 10) so they exist up front.
+        """
+        self.catalog = catalog
+        self.quotas = {country.upper(): count for country, count in quotas.items()}
+        self.openvpn_path = openvpn_path
+        self.use_sudo = use_sudo
+        self.spawner = spawner
+        self.netns_prefix = netns_prefix
+        self.use_management = use_management
+        self.health_check = health_check
+        self.maintain_interval = maintain_interval
+        self.connect_timeout = connect_timeout
+        self.failure_threshold = failure_threshold
+        self.breaker_reset = breaker_reset
+        self.config_store = config_store or ConfigStore(config_dir)
+        self._free_dev_indexes = list(range(first_dev_index, first_dev_index + sum(self.quotas.values())))
+        self._tunnels = collections.defaultdict(list) # country -> [Tunnel], up or coming up
+        self._next = collections.defaultdict(int) # country -> round-robin position for acquire()
+        self.breakers = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _breaker(self, server):
+        key = server_key(server)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(self.failure_threshold, self.breaker_reset)
+        return breaker
+
+    def _in_use(self):
+        return {server_key(t.server) for tunnels in self._tunnels.values() for t in tunnels}
+
+    def _spawn(self, country, server):
+        # Called with the lock held; returns the started Tunnel, or None.
+        path = self.config_store.path_for_server(server)
+        if not path or not self._free_dev_indexes:
+            return None
+        dev_index = self._free_dev_indexes.pop(0)
+        netns = f"{self.netns_prefix}{dev_index}" if self.netns_prefix else None
+        manager = OpenVPNManager(self.openvpn_path, self.use_sudo, use_management=self.use_management,
+                                 extra_args=["--dev", f"tun{dev_index}", "--dev-type", "tun", "--route-nopull"],
+                                 netns=netns, spawner=self.spawner)
+        manager.connect(path)
+        if not manager.process:
+            self._free_dev_indexes.append(dev_index)
+            self._breaker(server).record_failure()
+            return None
+        tunnel = Tunnel(manager, server, country, dev_index, netns)
+        self._tunnels[country].append(tunnel)
+        return tunnel
+
+    def _remove(self, tunnel, failed):
+        # Called with the lock held. A tunnel can be evicted twice (e.g. a catalog removal racing
+        # maintain() or release()); only the first eviction stops it and frees its tun device.
+        if tunnel not in self._tunnels[tunnel.country_short]:
+            return
+        self._tunnels[tunnel.country_short].remove(tunnel)
+        if tunnel.manager.process:
+            tunnel.manager.disconnect()
+        self._free_dev_indexes.append(tunnel.dev_index)
+        if failed:
+            self._breaker(tunnel.server).record_failure()
+
+    def fill(self):
+        """
+        Starts tunnels until every country meets its quota (as far as healthy servers allow),
+        then waits up to connect_timeout for the new ones. Returns the tunnels that came up.
+        """
+        started = []
+        with self._lock:
+            in_use = self._in_use()
+            now = time.monotonic()
+            for country, quota in self.quotas.items():
+                missing = quota - len(self._tunnels[country])
+                if missing <= 0:
+                    continue
+                # Over-fetch so servers that are in use or tripped can be skipped.
+                for server in self.catalog.top_servers(quota * 3 + len(in_use), country):
+                    if missing <= 0:
+                        break
+                    key = server_key(server)
+                    if key in in_use or not self._breaker(server).allow(now):
+                        continue
+                    tunnel = self._spawn(country, server)
+                    if tunnel:
+                        started.append(tunnel)
+                        in_use.add(key)
+                        missing -= 1
+
+        # All new instances connect in parallel; wait for them against one shared deadline.
+        deadline = time.monotonic() + self.connect_timeout
+        up = []
+        for tunnel in started:
+            if tunnel.manager.wait_until_connected(max(0.0, deadline - time.monotonic())):
+                self._breaker(tunnel.server).record_success()
+                up.append(tunnel)
+            else:
+                print(f"Pooled tunnel {tunnel} did not come up; evicting.")
+                with self._lock:
+                    self._remove(tunnel, failed=True)
+        return up
+
+    def _healthy(self, tunnel):
+        if not tunnel.up:
+            return False
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(tunnel))
+        except Exception as e:
+            print(f"Health check for {tunnel} raised an error: {e}")
+            return False
+
+    def maintain(self):
+        """
+        Evicts tunnels that are down or fail the health check, then refills from the catalog.
+        Tunnels still coming up (younger than connect_timeout) are left alone.
+        """
+        with self._lock:
+            tunnels = [t for country_tunnels in self._tunnels.values() for t in country_tunnels]
+        now = time.monotonic()
+        for tunnel in tunnels:
+            settling = now - tunnel.started_at < self.connect_timeout and tunnel.manager.process \
+                and tunnel.manager.process.poll() is None
+            if not tunnel.up and settling:
+                continue
+            if not self._healthy(tunnel):
+                print(f"Evicting unhealthy pooled tunnel {tunnel}.")
+                with self._lock:
+                    self._remove(tunnel, failed=True)
+        self.fill()
+
+    def acquire(self, country_short):
+        """
+        Returns an already-up tunnel for the country (round-robin across its tunnels), or None.
+        Never blocks on connecting.
+        """
+        country = country_short.upper()
+        with self._lock:
+            tunnels = [t for t in self._tunnels.get(country, ()) if t.up]
+            if not tunnels:
+                return None
+            position = self._next[country] % len(tunnels)
+            self._next[country] = position + 1
+            return tunnels[position]
+
+    def release(self, tunnel, failed=False):
+        """
+        Reports that a caller is done with a tunnel. With failed=True the tunnel is evicted
+        (and its server penalized); the next maintenance pass refills the slot.
+        """
+        if failed:
+            with self._lock:
+                self._remove(tunnel, failed=True)
+
+    def set_catalog(self, catalog):
+        """
+        Uses a newer catalog for future refills; running tunnels are kept.
+        """
+        with self._lock:
+            if self._thread and catalog is not self.catalog:
+                self.catalog.unsubscribe(self._on_catalog_event)
+                catalog.subscribe(self._on_catalog_event)
+            self.catalog = catalog
+
+    def _on_catalog_event(self, name, details):
+        if name != 'removed':
+            return
+        key = server_key(details['server'])
+        with self._lock:
+            for tunnel in [t for tunnels in self._tunnels.values() for t in tunnels if server_key(t.server) == key]:
+                print(f"Evicting pooled tunnel {tunnel}: its server is no longer listed.")
+                self._remove(tunnel, failed=False)
+
+    def status(self):
+        """
+        Returns {country: [(dev, server key, state), ...]} for every pooled tunnel.
+        """
+        with self._lock:
+            return {country: [(t.dev, server_key(t.server), t.manager.state) for t in tunnels]
+                    for country, tunnels in self._tunnels.items() if tunnels}
+
+    def _run(self):
+        while not self._stop.wait(self.maintain_interval):
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"Tunnel pool maintenance failed: {e}")
+
+    def start(self):
+        """
+        Fills the pool, then keeps maintaining it in a daemon thread.
+        """
+        self.fill()
+        if not (self._thread and self._thread.is_alive()):
+            self._stop.clear()
+            self.catalog.subscribe(self._on_catalog_event)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops maintenance and disconnects every tunnel.
+        """
+        self._stop.set()
+        self.catalog.unsubscribe(self._on_catalog_event)
+        if self._thread:
+            self._thread.join(timeout=self.connect_timeout + 5)
+            self._thread = None
+        with self._lock:
+            for tunnels in list(self._tunnels.values()):
+                for tunnel in list(tunnels):
+                    self._remove(tunnel, failed=False)
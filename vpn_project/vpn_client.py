@@ -1,69 +1,120 @@
 import os
-import tempfile
-import shutil
 import time # For potential delays or retries if needed, not explicitly in steps
 from .vpngate_scraper import VPNGateScraper
 from .openvpn_manager import OpenVPNManager
-
-def select_server_from_list(servers):
+from .ovpn_config import TUNED_OVERRIDES, ConfigStore
+from .latency_probe import rank_by_latency, rank_by_latency_async
+from .metrics import report_timing
+from .server_catalog import ServerCatalog, rank_key
+from .server_history import HistoryStore
+from .server_list_cache import ServerListCache
+from .server_ranking import RankingEngine
+from .server_record import config_undecodable
+
+PROBE_CANDIDATES = 5 # How many top-ranked servers to latency-probe before connecting
+CONNECT_TIMEOUT = 60 # Seconds to wait for OpenVPN to bring the tunnel up
+
+def select_server_from_list(servers, history=None, on_timing=None):
     """
     Filters, sorts, and selects the best server from a list.
+    With a HistoryStore, our own past outcomes for each server are blended into the ranking.
+    on_timing(stage, seconds, details), if given, receives a 'select' report.
     Returns the selected server dictionary or None.
     """
     if not servers:
         return None
 
-    valid_servers = []
+    started = time.perf_counter()
+    if history is not None:
+        best = RankingEngine(servers).top_k(1, scorer=history.scorer())
+        best_server = best[0] if best else None
+    else:
+        # Single pass keeping the best-ranked server; ties keep the earlier server.
+        # Ranking: Speed (descending), Ping (ascending, non-zero preferred), Score (descending).
+        # A winner whose config does not decode is skipped and the pass repeated without it.
+        skipped = set()
+        while True:
+            best_server = None
+            best_key = None
+            for server in servers:
+                key = rank_key(server)
+                if key is not None and (best_key is None or key < best_key) and id(server) not in skipped:
+                    best_server = server
+                    best_key = key
+            if best_server is None or not config_undecodable(best_server):
+                break
+            skipped.add(id(best_server))
+
+    report_timing(on_timing, 'select', time.perf_counter() - started, candidates=len(servers))
+    return best_server
+
+
+def select_first_good_server(servers, candidates=1):
+    """
+    Selects from a (possibly streaming) iterable of servers, such as VPNGateScraper.iter_servers(),
+    without consuming more of it than needed: returns the best-ranked of the first `candidates`
+    eligible servers, or None if the iterable runs out first without any.
+    """
+    eligible = []
     for server in servers:
-        try:
-            score = float(server.get('Score', 0))
-            speed = float(server.get('Speed', 0))
-            # Ping can be 'N/A' or empty, treat as high ping (or filter out)
-            ping_str = server.get('Ping', '0')
-            if not ping_str or not ping_str.isdigit() or int(ping_str) == 0:
-                 # Treat 0 or non-numeric ping as less desirable or filter out
-                 # For now, we'll assign a high ping value for sorting if it's 0,
-                 # but ideally, we'd ensure it's a valid measurement.
-                 # If it's truly 0ms, it's great, but often 0 means not measured or N/A.
-                 # Let's assume lower is better, and 0 from API might mean "not measured"
-                 # or it's an error. We will prefer non-zero pings.
-                 # A simple way for now: if ping is 0, make it very high for sorting.
-                ping = float('inf') if int(ping_str) == 0 else float(ping_str)
-            else:
-                ping = float(ping_str)
-
-            if speed > 0 and score > 0: # Ensure speed and score are positive
-                server['_sort_score'] = score
-                server['_sort_speed'] = speed
-                server['_sort_ping'] = ping if ping > 0 else float('inf') # Use infinity for 0 ping to sort it last for ascending
-                valid_servers.append(server)
-        except ValueError:
-            # print(f"Skipping server due to invalid numeric value: {server.get('HostName')}")
-            continue
-
-    if not valid_servers:
-        return None
+        if rank_key(server) is not None:
+            eligible.append(server)
+            if len(eligible) >= candidates:
+                break
+    return select_server_from_list(eligible)
+
+
+def select_server_by_latency(servers, candidates=PROBE_CANDIDATES, history=None):
+    """
+    Takes the top `candidates` servers by the API ranking (blended with history, if given),
+    measures the real RTT to each one from this host, and returns (server, rtt_seconds) for the
+    fastest reachable server. Falls back to the top-ranked server (rtt None) if none answer.
+    """
+    top_servers = _probe_candidates(servers, candidates, history)
+    if not top_servers:
+        return None, None
+    return _pick_probed(top_servers, rank_by_latency(top_servers), history)
+
+
+async def select_server_by_latency_async(servers, candidates=PROBE_CANDIDATES, history=None):
+    """
+    Coroutine version of select_server_by_latency, for use inside a running event loop.
+    """
+    top_servers = _probe_candidates(servers, candidates, history)
+    if not top_servers:
+        return None, None
+    return _pick_probed(top_servers, await rank_by_latency_async(top_servers), history)
+
 
-    # Sort servers:
-    # 1. Speed (descending)
-    # 2. Ping (ascending, non-zero preferred)
-    # 3. Score (descending)
-    valid_servers.sort(key=lambda s: (s['_sort_speed'], -s['_sort_ping'], s['_sort_score']), reverse=True)
-    # Note: because ping is negated for reverse sort on speed/score, a lower ping (better) will come first.
+def _probe_candidates(servers, candidates, history):
+    scorer = history.scorer() if history is not None else None
+    top_servers = ServerCatalog(servers).top_servers(candidates, scorer=scorer)
+    if top_servers:
+        print(f"Probing latency to the top {len(top_servers)} server(s)...")
+    return top_servers
 
-    # Corrected sort:
-    # Primary: Speed (descending) -> -s['_sort_speed']
-    # Secondary: Ping (ascending) -> s['_sort_ping'] (lower is better)
-    # Tertiary: Score (descending) -> -s['_sort_score']
-    valid_servers.sort(key=lambda s: (-s['_sort_speed'], s['_sort_ping'], -s['_sort_score']))
 
-    return valid_servers[0]
+def _pick_probed(top_servers, ranked, history):
+    for server, rtt in ranked:
+        rtt_text = f"{rtt * 1000:.0f} ms" if rtt is not None else "no response"
+        print(f"  {server.get('HostName')} ({server.get('IP')}): {rtt_text}")
+        if history is not None:
+            # Only answers are kept: a silent probe port says nothing about whether OpenVPN would connect.
+            history.record_probe(server, rtt)
+
+    best_server, best_rtt = ranked[0]
+    if best_rtt is None:
+        print("No candidate answered the latency probe; using the API ranking.")
+        return top_servers[0], None
+    return best_server, best_rtt
 
 
 def main():
-    scraper = VPNGateScraper()
+    # Serve a recent list from disk; an expired one is used right away and refreshed in the background.
+    scraper = VPNGateScraper(cache=ServerListCache(stale_while_revalidate=True))
     manager = OpenVPNManager()
-    temp_dir_path = None
+    history = HistoryStore() # Past outcomes per server, blended into selection
+    config_store = ConfigStore(overrides=TUNED_OVERRIDES)
     connection_active_flag = False # To track if connect() was successfully called
 
     try:
@@ -122,7 +173,7 @@ def main():
                 continue
 
             print(f"Found {len(servers_in_country)} server(s) for {selected_country_name}.")
-            selected_server = select_server_from_list(servers_in_country)
+            selected_server, selected_rtt = select_server_by_latency(servers_in_country, history=history)
 
             if not selected_server:
                 print("No suitable servers found after filtering/sorting. Please try another country.")
@@ -136,60 +187,61 @@ def main():
             print(f"Ping: {selected_server.get('Ping')} ms")
             print(f"Score: {selected_server.get('Score')}")
 
-            ovpn_config = selected_server.get('ovpn_config')
-            if not ovpn_config:
+            # Tuned, rewritten configs are kept in a store across runs; repeat servers reuse their file.
+            ovpn_file_path = config_store.path_for_server(selected_server)
+            if not ovpn_file_path:
                 print("Error: Selected server has no OpenVPN configuration data. Try another.")
                 continue
 
-            try:
-                temp_dir_path = tempfile.mkdtemp()
-                temp_ovpn_file_path = os.path.join(temp_dir_path, "vpn_config.ovpn")
-                with open(temp_ovpn_file_path, "w") as f:
-                    f.write(ovpn_config)
-
-                print(f"\nConfiguration saved to: {temp_ovpn_file_path}")
-
-                # Attempt connection
-                manager.connect(temp_ovpn_file_path)
-                if manager.connected: # Check if Popen was successful
-                    connection_active_flag = True
-                    print("\nCONNECTING... You may need to enter your sudo password for OpenVPN.")
-                    print("Check your system's network status (e.g., 'ip addr' or network manager icon) to confirm connection.")
-                    print("The OpenVPN process has been started in the background.")
-                    print("---")
-
-                    # --- Automated disconnect for non-interactive environment ---
-                    print("Simulating connection for 5 seconds...")
-                    time.sleep(5)
-                    print("Automated disconnect initiated.")
-                    manager.disconnect()
-                    connection_active_flag = False
-                    # In a real CLI, you might loop back to country selection or quit.
-                    # For this automated test, we'll just proceed to the end of the 'while True' loop,
-                    # which will then hit the 'quit_after_disconnect' logic.
-                    # --- End Automated disconnect ---
-
-                    # Original interactive disconnect (commented out)
-                    # while True:
-                    #     disconnect_choice = input("Type 'd' or 'disconnect' to disconnect and choose another server, or 'q' to quit: ").lower()
-                    #     if disconnect_choice in ['d', 'disconnect']:
-                    #         manager.disconnect()
-                    #         connection_active_flag = False # Mark as disconnected
-                    #         break # Go back to country selection
-                    #     elif disconnect_choice == 'q':
-                    #         manager.disconnect() # Also disconnect if quitting
-                    #         connection_active_flag = False
-                    #         print("Exiting application.")
-                    #         return # Exit main function
-                    #     else:
-                    #         print("Invalid command.")
+            print(f"\nUsing configuration: {ovpn_file_path}")
+
+            # Attempt connection
+            connect_started = time.monotonic()
+            manager.connect(ovpn_file_path)
+            if manager.process: # Check if Popen was successful
+                connection_active_flag = True
+                print("\nCONNECTING... You may need to enter your sudo password for OpenVPN.")
+                print("The OpenVPN process has been started in the background.")
+                print("---")
+
+                # Block until OpenVPN reports the tunnel is up (or gives up) instead of guessing.
+                if manager.wait_until_connected(timeout=CONNECT_TIMEOUT):
+                    print(f"CONNECTED to {selected_server.get('HostName')}.")
+                    history.record(selected_server, success=True, rtt=selected_rtt,
+                                   time_to_connected=time.monotonic() - connect_started,
+                                   disconnect_reason="user")
                 else:
-                    print("Failed to start OpenVPN process. Please check logs or OpenVPN setup.")
-            finally: # Inner finally for temp file cleanup
-                if temp_dir_path and os.path.exists(temp_dir_path):
-                    print(f"Cleaning up temporary directory: {temp_dir_path}")
-                    shutil.rmtree(temp_dir_path, ignore_errors=True)
-                    temp_dir_path = None
+                    print(f"OpenVPN did not connect (state: {manager.state}). Last log lines:")
+                    for line in manager.log_tail(10):
+                        print(f"    {line}")
+                    history.record(selected_server, success=False, rtt=selected_rtt,
+                                   disconnect_reason="timeout" if manager.process.poll() is None else "exited")
+
+                # --- Automated disconnect for non-interactive environment ---
+                print("Automated disconnect initiated.")
+                manager.disconnect()
+                connection_active_flag = False
+                # In a real CLI, you might loop back to country selection or quit.
+                # For this automated test, we'll just proceed to the end of the 'while True' loop,
+                # which will then hit the 'quit_after_disconnect' logic.
+                # --- End Automated disconnect ---
+
+                # Original interactive disconnect (commented out)
+                # while True:
+                #     disconnect_choice = input("Type 'd' or 'disconnect' to disconnect and choose another server, or 'q' to quit: ").lower()
+                #     if disconnect_choice in ['d', 'disconnect']:
+                #         manager.disconnect()
+                #         connection_active_flag = False # Mark as disconnected
+                #         break # Go back to country selection
+                #     elif disconnect_choice == 'q':
+                #         manager.disconnect() # Also disconnect if quitting
+                #         connection_active_flag = False
+                #         print("Exiting application.")
+                #         return # Exit main function
+                #     else:
+                #         print("Invalid command.")
+            else:
+                print("Failed to start OpenVPN process. Please check logs or OpenVPN setup.")
 
             # Logic after disconnect or failed connection attempt
             if not connection_active_flag:
@@ -214,9 +266,7 @@ def main():
         if connection_active_flag and manager: # Only if connection was attempted and manager exists
             print("Ensuring OpenVPN is disconnected due to script exit...")
             manager.disconnect()
-        if temp_dir_path and os.path.exists(temp_dir_path): # Final check for temp dir
-            # print(f"Final cleanup of temporary directory: {temp_dir_path}")
-            shutil.rmtree(temp_dir_path, ignore_errors=True)
+        history.close()
         print("Cleanup complete. Goodbye!")
 
 
@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from .failover_supervisor import FailoverSupervisor, tcp_health_check
+from .metrics import Metrics
+from .openvpn_manager import OpenVPNManager
+from .openvpn_spawner import SpawnerClient
+from .ovpn_config import TUNED_OVERRIDES, ConfigStore
+from .server_catalog import ServerCatalog
+from .server_history import HistoryStore
+from .server_list_cache import ServerListCache, default_cache_dir
+from .vpngate_scraper import VPNGateScraper
+
+SUMMARY_FIELDS = ('HostName', 'IP', 'CountryShort', 'CountryLong', 'Speed', 'Ping', 'Score')
+
+
+def default_socket_path():
+    """
+    Returns the control socket path ($XDG_RUNTIME_DIR/vpn_project.sock, or in the cache directory).
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'vpn_project.sock')
+    return os.path.join(default_cache_dir(), 'control.sock')
+
+
+def server_summary(server):
+    return {field: server.get(field) for field in SUMMARY_FIELDS} if server else None
+
+
+class DaemonError(Exception):
+    """Raised by DaemonClient when the daemon answers a request with an error."""
+
+
+class VPNDaemon:
+    def __init__(self, scraper=None, manager=None, socket_path=None, refresh_interval=600.0,
+                 config_store=None, history=None, health_check=None, connect_timeout=60.0, metrics=None):
+        """
+        Long-running service: keeps the server catalog warm in memory (refreshed every
+        refresh_interval seconds in the background and updated in place, so only changed servers
+        are re-indexed), keeps the requested tunnel up with a
+        FailoverSupervisor, and serves a JSON-lines control API on a Unix socket.
+        Requests are objects such as {"command": "connect", "country": "JP"}; every reply has
+        "ok" and either the result fields or "error". Commands: connect, disconnect, status,
+        top, countries, refresh, metrics.
+        With metrics (a metrics.Metrics), the scraper's and manager's timings and the tunnel's
+        state and traffic are recorded there.
+        """
+        self.scraper = scraper or VPNGateScraper(cache=ServerListCache(stale_while_revalidate=True))
+        self.manager = manager or OpenVPNManager(use_management=True)
+        self.metrics = metrics
+        if metrics:
+            for instrumented in (self.scraper, self.manager):
+                if instrumented.on_timing is None:
+                    instrumented.on_timing = metrics.timing_hook
+            metrics.track_manager(self.manager, 'daemon')
+        self.socket_path = socket_path or default_socket_path()
+        self.refresh_interval = refresh_interval
+        self.config_store = config_store or ConfigStore(overrides=TUNED_OVERRIDES)
+        self.history = history or HistoryStore()
+        self.health_check = health_check
+        self.connect_timeout = connect_timeout
+        self.catalog = ServerCatalog([])
+        self.catalog_loaded_at = None
+        self.catalog_changes = None # Counts from the last catalog update
+        self.supervisor = None
+        self.country_short = None
+        self.started_at = time.monotonic()
+        self._lock = threading.RLock() # Serializes connect/disconnect and catalog swaps
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._server = None
+        self._refresh_thread = None
+
+    # --- Catalog ---
+
+    def refresh_catalog(self):
+        """
+        Fetches and parses the list once and swaps it in. A failed refresh keeps the current catalog.
+        Returns True if a new catalog was installed.
+        """
+        catalog = self.scraper.get_catalog(refresh=True)
+        if not len(catalog):
+            print("Catalog refresh failed; keeping the current server list.")
+            return False
+        with self._lock:
+            if catalog is not self.catalog:
+                # Later refreshes update this catalog in place; a running supervisor follows its events.
+                self.catalog.unsubscribe(self._on_catalog_event)
+                catalog.subscribe(self._on_catalog_event)
+                self.catalog = catalog
+                if self.supervisor:
+                    self.supervisor.refresh_standby(catalog)
+            self.catalog_loaded_at = time.time()
+        return True
+
+    def _on_catalog_event(self, name, details):
+        if name == 'updated':
+            self.catalog_changes = details
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh_catalog()
+            except Exception as e:
+                print(f"Catalog refresh raised an error: {e}")
+
+    # --- Tunnel ---
+
+    def _on_event(self, name, details):
+        server = details.get('server')
+        if name == 'connected':
+            self._connected.set()
+            self.history.record(server, success=True, time_to_connected=details.get('time_to_connected'))
+        elif name == 'failed':
+            self.history.record(server, success=False, disconnect_reason="connect_failed")
+        elif name == 'vanished':
+            self._connected.clear()
+        elif name == 'unhealthy':
+            self._connected.clear()
+            if server is not None:
+                self.history.record(server, success=False, disconnect_reason="unhealthy")
+
+    def connect(self, country_short, timeout=None):
+        """
+        Starts keeping a tunnel up to country_short (replacing any current one) and waits up to
+        timeout seconds (default connect_timeout) for the first connection.
+        """
+        country_short = country_short.upper()
+        with self._lock:
+            if not self.catalog.servers_for_country(country_short):
+                raise ValueError(f"No servers for country {country_short}")
+            self._stop_supervisor()
+            self._connected.clear()
+            self.country_short = country_short
+            self.supervisor = FailoverSupervisor(
+                self.manager, self.catalog, country_short=country_short, health_check=self.health_check,
+                connect_timeout=min(30.0, self.connect_timeout), config_store=self.config_store,
+                on_event=self._on_event, scorer=self.history.scorer())
+            self.supervisor.start()
+        connected = self._connected.wait(self.connect_timeout if timeout is None else timeout)
+        return {'connected': connected, **self.status()}
+
+    def _stop_supervisor(self):
+        if self.supervisor:
+            self.supervisor.stop()
+            self.supervisor = None
+        elif self.manager.process:
+            self.manager.disconnect()
+
+    def disconnect(self):
+        with self._lock:
+            self._stop_supervisor()
+            self.country_short = None
+            self._connected.clear()
+        return self.status()
+
+    def status(self):
+        supervisor = self.supervisor
+        return {
+            'state': self.manager.state,
+            'connected': self.manager.connected,
+            'country': self.country_short,
+            'server': server_summary(supervisor.current_server) if supervisor and self.manager.process else None,
+            'traffic': self.manager.traffic_stats(),
+            'last_recovery_seconds': supervisor.last_recovery_seconds if supervisor else None,
+            'catalog_servers': len(self.catalog),
+            'catalog_age_seconds': time.time() - self.catalog_loaded_at if self.catalog_loaded_at else None,
+            'catalog_changes': self.catalog_changes,
+            'uptime_seconds': time.monotonic() - self.started_at,
+        }
+
+    def top(self, country_short=None, n=10):
+        servers = self.catalog.top_servers(int(n), country_short, scorer=self.history.scorer())
+        return {'servers': [server_summary(s) for s in servers]}
+
+    # --- Control API ---
+
+    def handle(self, request):
+        """
+        Runs one control request (a dict) and returns the reply dict.
+        """
+        command = request.get('command')
+        try:
+            if command == 'connect':
+                if not request.get('country'):
+                    raise ValueError("connect needs a country")
+                result = self.connect(request['country'], request.get('timeout'))
+            elif command == 'disconnect':
+                result = self.disconnect()
+            elif command == 'status':
+                result = self.status()
+            elif command == 'top':
+                result = self.top(request.get('country'), request.get('n', 10))
+            elif command == 'countries':
+                result = {'countries': self.catalog.countries()}
+            elif command == 'refresh':
+                result = {'refreshed': self.refresh_catalog(), 'catalog_servers': len(self.catalog)}
+            elif command == 'metrics':
+                if not self.metrics:
+                    raise ValueError("Metrics are not enabled")
+                result = {'metrics': self.metrics.render()}
+            else:
+                raise ValueError(f"Unknown command: {command!r}")
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+        return {'ok': True, **result}
+
+    def serve_forever(self):
+        """
+        Loads the catalog, then serves the control socket until stop() is called or the process is interrupted.
+        """
+        self.refresh_catalog()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path) # Left over from a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if not isinstance(request, dict):
+                            raise ValueError("request must be a JSON object")
+                    except ValueError as e:
+                        reply = {'ok': False, 'error': f"Bad request: {e}"}
+                    else:
+                        reply = daemon.handle(request)
+                    self.wfile.write((json.dumps(reply, default=str) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600) # Only the owning user may control the tunnel
+        print(f"VPN daemon listening on {self.socket_path} ({len(self.catalog)} servers loaded).")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        if self._server:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _shutdown(self):
+        self._stop.set()
+        with self._lock:
+            self._stop_supervisor()
+        self._server.server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        self.history.close()
+
+
+class DaemonClient:
+    def __init__(self, socket_path=None, timeout=120.0):
+        """
+        Client for the VPNDaemon control socket. Keeps one connection open across calls.
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def call(self, command, **arguments):
+        """
+        Sends one request and returns the reply fields. Raises DaemonError if the daemon reports an error.
+        """
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(self.socket_path)
+            self._file = self._sock.makefile('rwb')
+        self._file.write((json.dumps({'command': command, **arguments}) + '\n').encode('utf-8'))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Daemon closed the connection")
+        reply = json.loads(line)
+        if not reply.pop('ok', False):
+            raise DaemonError(reply.get('error'))
+        return reply
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        if self._sock:
+            self._sock.close()
+        self._sock = self._file = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the VPN daemon, or send it a command.")
+    parser.add_argument('--socket', help="Control socket path.")
+    subcommands = parser.add_subparsers(dest='command')
+    serve = subcommands.add_parser('serve', help="Run the daemon in the foreground.")
+    serve.add_argument('--refresh-interval', type=float, default=600.0, help="Seconds between catalog refreshes.")
+    serve.add_argument('--openvpn', default='openvpn', help="OpenVPN executable.")
+    serve.add_argument('--no-sudo', action='store_true', help="Run OpenVPN without sudo.")
+    serve.add_argument('--spawner', metavar='SOCKET', help="Start OpenVPN through the spawner helper on SOCKET instead of sudo.")
+    serve.add_argument('--health-check', metavar='HOST:PORT', help="TCP endpoint that must be reachable through the tunnel.")
+    serve.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics.")
+    connect = subcommands.add_parser('connect', help="Connect to a country and keep the tunnel up.")
+    connect.add_argument('country')
+    connect.add_argument('--timeout', type=float)
+    subcommands.add_parser('disconnect', help="Drop the tunnel.")
+    subcommands.add_parser('status', help="Show tunnel and catalog status.")
+    top = subcommands.add_parser('top', help="List the best servers.")
+    top.add_argument('country', nargs='?')
+    top.add_argument('-n', type=int, default=10)
+    subcommands.add_parser('countries', help="List available countries.")
+    subcommands.add_parser('refresh', help="Refresh the server list now.")
+    subcommands.add_parser('metrics', help="Print the daemon's metrics.")
+    args = parser.parse_args(argv)
+
+    if args.command in (None, 'serve'):
+        health_check = None
+        if getattr(args, 'health_check', None):
+            host, _, port = args.health_check.rpartition(':')
+            health_check = tcp_health_check(host, int(port))
+        metrics = Metrics()
+        if getattr(args, 'metrics_port', None):
+            metrics.serve(port=args.metrics_port)
+            print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        daemon = VPNDaemon(manager=OpenVPNManager(getattr(args, 'openvpn', 'openvpn'),
+                                                  use_sudo=not getattr(args, 'no_sudo', False),
+                                                  use_management=True,
+                                                  spawner=SpawnerClient(args.spawner) if getattr(args, 'spawner', None) else None),
+                           socket_path=args.socket, refresh_interval=getattr(args, 'refresh_interval', 600.0),
+                           health_check=health_check, metrics=metrics)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            print("\nDaemon interrupted. Shutting down...")
+        return
+
+    arguments = {key: value for key, value in vars(args).items()
+                 if key not in ('socket', 'command') and value is not None}
+    client = DaemonClient(args.socket)
+    try:
+        reply = client.call(args.command, **arguments)
+        print(reply['metrics'] if args.command == 'metrics' else json.dumps(reply, indent=2, default=str))
+    except (OSError, DaemonError) as e:
+        raise SystemExit(f"Error: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
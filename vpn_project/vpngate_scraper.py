@@ -1,140 +1,575 @@
-import requests
+import concurrent.futures
 import csv
-import base64
+import io
+import os
+import random
+import threading
+import time
+from array import array
+from .metrics import report_timing
+from .server_catalog import ServerCatalog
+from .server_record import CONFIG_FIELD, ServerRecord, dedupe_servers, field_index
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504) # Worth retrying on the same mirror
+
+# requests is imported by the methods that go to the network, not here: it is the slowest import
+# of the package, and a start served from the cache or a snapshot never needs it.
+
 
 class VPNGateScraper:
-    def __init__(self, vpngate_url="http://www.vpngate.net/api/iphone/"):
+    def __init__(self, vpngate_url="http://www.vpngate.net/api/iphone/", cache=None, mirrors=None,
+                 timeout=10, retries=2, backoff_initial=0.5, backoff_max=4.0, mirror_delay=2.0, on_timing=None):
         """
         Initializes the scraper with the VPNGate API URL.
+        cache is an optional ServerListCache used to avoid re-downloading a recent list.
+        mirrors is an optional list of further URLs serving the same list, in order of preference.
+        If a URL has not answered after mirror_delay seconds (or fails), the next one is tried
+        in parallel and the first good response wins. Each URL gets up to `retries` retries on
+        connection errors and 429/5xx replies, with jittered exponential backoff.
+        All requests share one pooled keep-alive session and accept gzip.
+        on_timing(stage, seconds, details), if given, receives a 'fetch' report per download
+        (details: result) and a 'parse' report per parsed list (details: rows, no_config,
+        filtered, error); see metrics.Metrics.timing_hook.
         """
         self.vpngate_url = vpngate_url
+        self.mirrors = list(mirrors or [])
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.mirror_delay = mirror_delay
+        self.on_timing = on_timing
+        self._refresh_thread = None
         self.headers = { # Set a common User-Agent to avoid potential blocking
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate', # requests decompresses transparently, also when streaming
         }
+        self._session = None # Created on the first request
+        self._catalog = None # Built on first use and shared by get_servers()/get_available_countries()
+
+    @property
+    def urls(self):
+        return [self.vpngate_url] + [url for url in self.mirrors if url != self.vpngate_url]
+
+    @property
+    def session(self):
+        """
+        The pooled requests.Session, created on first use.
+        """
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def close(self):
+        """
+        Closes the pooled HTTP connections.
+        """
+        if self._session is not None:
+            self._session.close()
+
+    def _request(self, url, headers, stream=False):
+        """
+        GETs one URL, retrying connection errors and 429/5xx replies with jittered backoff.
+        Returns the response (2xx or 304); raises requests.exceptions.RequestException otherwise.
+        """
+        import requests
+        delay = self.backoff_initial
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    if response.status_code != 304:
+                        try:
+                            response.raise_for_status()
+                        except requests.exceptions.RequestException:
+                            response.close()
+                            raise
+                    return response
+                response.close()
+            time.sleep(min(self.backoff_max, delay) * random.uniform(0.5, 1.0))
+            delay *= 2
+
+    def _get(self, headers, stream=False):
+        """
+        Requests the list from the configured URLs, falling over to (and racing) mirrors.
+        Returns (url, response) for the first good response; responses that lose the race are closed.
+        Raises the last error if every URL fails.
+        """
+        import requests
+        self.session # Created here, before the mirror threads share it
+        urls = self.urls
+        if len(urls) == 1:
+            return urls[0], self._request(urls[0], headers, stream)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(urls))
+        pending = {}
+        winner = None
+        last_error = None
+        try:
+            remaining = list(urls)
+            while remaining or pending:
+                if remaining:
+                    url = remaining.pop(0)
+                    pending[executor.submit(self._request, url, headers, stream)] = url
+                # Wait for a result, but start the next mirror if this one is slow to answer.
+                done, _ = concurrent.futures.wait(pending, timeout=self.mirror_delay if remaining else None,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except requests.exceptions.RequestException as e:
+                        print(f"Error fetching server data from {url}: {e}")
+                        last_error = e
+                        continue
+                    if winner is None:
+                        winner = (url, response)
+                    else:
+                        response.close()
+                if winner:
+                    return winner
+            raise last_error
+        finally:
+            # Late responses from the mirrors that lost are closed as they arrive.
+            for future in pending:
+                future.add_done_callback(_close_response)
+            executor.shutdown(wait=False)
 
     def fetch_server_data(self):
         """
         Fetches raw CSV data from the VPNGate API.
         Returns the raw CSV content as a string, or None if fetching fails.
+        With a cache configured, a fresh cached copy is returned without any request, and an
+        expired one is revalidated with If-None-Match/If-Modified-Since. In stale-while-revalidate
+        mode an expired copy is returned immediately and revalidated in a background thread.
+        """
+        if not self.cache:
+            return self._download()
+
+        cached = self.cache.load(self.vpngate_url)
+        if self.cache.is_fresh(cached):
+            return cached.data
+
+        if cached and self.cache.stale_while_revalidate:
+            self.refresh_in_background(cached)
+            return cached.data
+
+        data = self._download(cached)
+        if data is None and cached:
+            print("Using cached server list after failed refresh.")
+            return cached.data
+        return data
+
+    def refresh_in_background(self, cached=None):
+        """
+        Starts revalidating the cached server list in a daemon thread (at most one at a time).
+        Returns the thread, or None if no cache is configured.
         """
+        if not self.cache:
+            return None
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return self._refresh_thread
+        self._refresh_thread = threading.Thread(target=self._download, args=(cached,), daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def _download(self, cached=None):
+        """
+        Performs the HTTP request, conditionally if a cached copy is given, and stores
+        the result in the cache. Returns the list text, or None on failure.
+        """
+        import requests
+        headers = dict(self.headers)
+        if cached:
+            headers.update(cached.validator_headers())
+        started = time.perf_counter()
         try:
-            response = requests.get(self.vpngate_url, headers=self.headers, timeout=10)
-            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+            _, response = self._get(headers) # Raises for HTTP errors (4xx or 5xx) after retries
+            if cached and response.status_code == 304: # Not Modified: our copy is still current
+                report_timing(self.on_timing, 'fetch', time.perf_counter() - started, result='not_modified')
+                self.cache.touch(self.vpngate_url)
+                return cached.data
 
             # The content is expected to be text, but let's ensure it's decoded correctly.
             # VPNGate API usually sends UTF-8, but we can check encoding.
             # print(f"Detected encoding: {response.encoding}") # For debugging
             # response.encoding = 'utf-8' # Or set explicitly if known
-            return response.text
+            data = response.text
         except requests.exceptions.RequestException as e:
+            report_timing(self.on_timing, 'fetch', time.perf_counter() - started, result='error')
             print(f"Error fetching server data: {e}")
             return None
+        report_timing(self.on_timing, 'fetch', time.perf_counter() - started, result='ok')
+
+        if self.cache and data:
+            self.cache.store(self.vpngate_url, data,
+                             etag=response.headers.get('ETag'),
+                             last_modified=response.headers.get('Last-Modified'))
+        return data
 
     def parse_server_data(self, csv_data):
         """
-        Parses the raw CSV data string into a list of server dictionaries.
-        Decodes the Base64 OpenVPN configuration data.
+        Parses the raw CSV data string into a list of ServerRecord objects.
+        The Base64 OpenVPN configuration data is kept encoded; each record's 'ovpn_config'
+        is decoded lazily on first access.
         """
         if not csv_data:
             return []
+        return list(self.parse_server_lines(io.StringIO(csv_data)))
 
-        servers = []
-        # Split lines and handle potential initial comment lines
-        lines = csv_data.strip().split('\n')
-
-        if len(lines) < 2:
-            print("CSV data is too short or malformed.")
-            return []
-
-        # Find the header line (starts with #HostName)
-        header_line_index = -1
-        for i, line in enumerate(lines):
+    def _read_header(self, lines):
+        """
+        Consumes lines up to and including the header (starts with #HostName) and returns its
+        field index, or None (after printing why) if there is no usable header.
+        """
+        # Lines before the header are kept for diagnostics only.
+        leading_lines = []
+        header_fields = None
+        for line in lines:
+            line = line.rstrip('\r\n')
             if line.startswith("#HostName"):
-                header_line_index = i
+                # The header is the identified line, stripped of '#'
+                header_fields = [h.strip() for h in line.lstrip('#').split(',')]
                 break
+            if len(leading_lines) < 5:
+                leading_lines.append(line)
 
-        if header_line_index == -1:
+        if header_fields is None:
+            if not leading_lines:
+                print("CSV data is too short or malformed.")
+                return None
             print("CSV header line starting with '#HostName' not found.")
             print("First 5 lines of received data:")
-            for i in range(min(5, len(lines))):
-                print(lines[i])
-            return []
+            for line in leading_lines:
+                print(line)
+            return None
 
-        # The header is the identified line, stripped of '#'
-        header_str = lines[header_line_index].lstrip('#')
-        header_fields = [h.strip() for h in header_str.split(',')]
+        # One field index is shared by every record; each row is stored as a tuple of its columns.
+        fields = field_index(header_fields)
+        if CONFIG_FIELD not in fields:
+            print(f"CSV header has no {CONFIG_FIELD} column.")
+            return None
+        return fields
 
-        # Data lines start from the line immediately after the header line
-        # and should not start with '*' or '#' (which are comments/meta)
-        data_lines_for_csv = []
-        for i in range(header_line_index + 1, len(lines)):
-            line = lines[i]
-            if line and not line.startswith('*') and not line.startswith('#'):
-                data_lines_for_csv.append(line)
+    def parse_server_data_parallel(self, sources, workers=None, min_chunk_size=1 << 20, executor=None):
+        """
+        Parses one server list, or a list of them (e.g. the VPNGate list followed by private mirror
+        lists), across worker processes, and drops duplicate servers (same IP, or HostName).
+        Each list body is cut into chunks at line boundaries (rows must not span lines, as in VPNGate
+        lists); the workers split and validate the rows, and records are built here in list order.
+        Workers send back only the short columns: the Base64 config (nearly all of a row) comes back
+        as its position in the chunk and is sliced from the text this process already holds.
+        The result equals dedupe_servers() over parse_server_data() of each list in turn.
+        workers defaults to the CPUs this process may run on; input that makes fewer than two chunks of min_chunk_size
+        characters is parsed in this process. Pass a ProcessPoolExecutor as executor to reuse its
+        workers across calls (see parse_executor). The 'parse' timing report also counts the dropped duplicates.
+        """
+        if isinstance(sources, str):
+            sources = [sources]
+        workers = workers or usable_cpu_count()
+        started = time.perf_counter()
 
-        if not data_lines_for_csv:
-            print("No valid data lines found after the header for CSV processing.")
-            return []
+        # About four chunks per worker keeps the workers evenly loaded.
+        chunk_size = max(min_chunk_size, sum(len(data or '') for data in sources) // (workers * 4))
+        jobs = [] # (field index, chunk text) in list order
+        for csv_data in sources:
+            if not csv_data:
+                continue
+            body_start = 0
+            def header_lines():
+                nonlocal body_start
+                while body_start < len(csv_data):
+                    end = csv_data.find('\n', body_start)
+                    end = len(csv_data) if end < 0 else end + 1
+                    line, body_start = csv_data[body_start:end], end
+                    yield line
+            fields = self._read_header(header_lines())
+            if fields is None:
+                continue
+            position = body_start
+            while position < len(csv_data):
+                end = csv_data.find('\n', position + chunk_size)
+                end = len(csv_data) if end < 0 else end + 1
+                jobs.append((fields, csv_data[position:end]))
+                position = end
 
-        # Use csv.reader and then create dicts, or use DictReader directly with the data lines
-        # DictReader expects data lines to be passed to it, not the whole block including comments
+        args = ([chunk for _, chunk in jobs], [fields[CONFIG_FIELD] for fields, _ in jobs])
+        counts = {'rows': 0, 'no_config': 0, 'filtered': 0, 'error': 0, 'duplicate': 0}
 
-        # We need to provide the fieldnames to DictReader if the first line of data_lines_for_csv is not the header
-        reader = csv.DictReader(data_lines_for_csv, fieldnames=header_fields)
+        def build_records(results):
+            # Records are built here rather than in the workers: short rows pickle more cheaply than
+            # records, and every record of a list then shares one field index and one set of interned strings.
+            servers = []
+            counts['no_config'] = counts['error'] = 0
+            for (fields, chunk), (rows, spans, no_config) in zip(jobs, results): # Chunk results arrive in order
+                counts['no_config'] += no_config
+                config_index = fields[CONFIG_FIELD]
+                for row, start, end in zip(rows, spans[0::2], spans[1::2]):
+                    if start >= 0:
+                        row[config_index] = chunk[start:end]
+                    try:
+                        servers.append(ServerRecord.from_row(fields, row))
+                    except Exception as e:
+                        print(f"An unexpected error occurred parsing server: {e}. Server: {row[0] if row else 'N/A'}")
+                        counts['error'] += 1
+            return servers
 
-        for row_num, row in enumerate(reader):
+        if workers > 1 and len(jobs) > 1:
+            pool = executor or parse_executor(min(workers, len(jobs)))
             try:
-                # Ensure all expected keys are present, or skip row
-                if 'OpenVPN_ConfigData_Base64' not in row or not row['OpenVPN_ConfigData_Base64']:
-                    # print(f"Skipping server (row {row_num + 1}): Missing OpenVPN_ConfigData_Base64 or it's empty.")
+                servers = build_records(pool.map(_parse_chunk, *args))
+            except (OSError, concurrent.futures.BrokenExecutor) as e:
+                print(f"Parallel parse failed ({e}); parsing in this process instead.")
+                servers = build_records(map(_parse_chunk, *args))
+            finally:
+                if executor is None:
+                    pool.shutdown()
+        else:
+            servers = build_records(map(_parse_chunk, *args))
+        unique = dedupe_servers(servers)
+        counts['rows'] = len(unique)
+        counts['duplicate'] = len(servers) - len(unique)
+        report_timing(self.on_timing, 'parse', time.perf_counter() - started, **counts)
+        return unique
+
+    def parse_server_lines(self, lines, filter_country_short=None):
+        """
+        Incrementally parses an iterable of server list lines (with or without line endings),
+        yielding a ServerRecord per valid data row as soon as its line has been read.
+        Rows outside filter_country_short (case-insensitive), if given, are skipped before
+        a record is built. Only one line is held at a time.
+        """
+        lines = iter(lines) # Header search and row parsing share one pass over the input
+        fields = self._read_header(lines)
+        if fields is None:
+            return
+        config_index = fields[CONFIG_FIELD]
+        country_index = fields.get('CountryShort')
+        if filter_country_short:
+            filter_country_short = filter_country_short.lower()
+
+        # Data lines follow the header and should not start with '*' or '#' (which are comments/meta)
+        data_lines = (line for line in lines if line and line[0] not in '*#\r\n')
+        reader = csv.reader(data_lines)
+
+        started = time.perf_counter()
+        counts = {'rows': 0, 'no_config': 0, 'filtered': 0, 'error': 0}
+        data_line_count = 0
+        try:
+            for row_num, row in enumerate(reader):
+                data_line_count += 1
+                try:
+                    # Skip rows without OpenVPN config data
+                    if len(row) <= config_index or not row[config_index]:
+                        # print(f"Skipping server (row {row_num + 1}): Missing {CONFIG_FIELD} or it's empty.")
+                        counts['no_config'] += 1
+                        continue
+                    if filter_country_short and (country_index is None or len(row) <= country_index
+                                                 or row[country_index].lower() != filter_country_short):
+                        counts['filtered'] += 1
+                        continue
+
+                    # The OpenVPN config is decoded on first access of record['ovpn_config'].
+                    record = ServerRecord.from_row(fields, row)
+                except Exception as e:
+                    print(f"An unexpected error occurred parsing server (row {row_num + 1}): {e}. Server: {row[0] if row else 'N/A'}")
+                    counts['error'] += 1
                     continue
+                counts['rows'] += 1
+                yield record
+        finally:
+            # Also reported when the consumer stops early, with the counts so far.
+            report_timing(self.on_timing, 'parse', time.perf_counter() - started, **counts)
 
-                # Decode OpenVPN config
-                decoded_config = base64.b64decode(row['OpenVPN_ConfigData_Base64']).decode('utf-8')
-                row['ovpn_config'] = decoded_config
-                servers.append(row)
-            except base64.binascii.Error as e:
-                print(f"Error decoding Base64 for server (row {row_num + 1}): {e}. Server: {row.get('HostName', 'N/A')}")
-            except UnicodeDecodeError as e:
-                print(f"Error decoding OVPN config to UTF-8 for server (row {row_num + 1}): {e}. Server: {row.get('HostName', 'N/A')}")
-            except Exception as e:
-                print(f"An unexpected error occurred parsing server (row {row_num + 1}): {e}. Server: {row.get('HostName', 'N/A')}")
+        if not data_line_count:
+            print("No valid data lines found after the header for CSV processing.")
 
-        return servers
+    def iter_servers(self, filter_country_short=None):
+        """
+        Streams the server list, yielding ServerRecord objects while the download is in progress,
+        so callers can filter or pick a server before the whole list has arrived.
+        Peak memory is bounded by the size of a row rather than the whole payload.
+        A fresh cached copy is parsed instead of downloading; a downloaded list is written
+        to the cache as it streams. Closing the generator early aborts the download.
+        """
+        cached = self.cache.load(self.vpngate_url) if self.cache else None
+        if self.cache and self.cache.is_fresh(cached):
+            yield from self.parse_server_lines(io.StringIO(cached.data), filter_country_short)
+            return
 
-    def get_servers(self, filter_country_short=None):
+        import requests
+        headers = dict(self.headers)
+        if cached:
+            headers.update(cached.validator_headers())
+        try:
+            _, response = self._get(headers, stream=True)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching server data: {e}")
+            if cached:
+                print("Using cached server list after failed refresh.")
+                yield from self.parse_server_lines(io.StringIO(cached.data), filter_country_short)
+            return
+
+        with response:
+            if cached and response.status_code == 304: # Not Modified: our copy is still current
+                self.cache.touch(self.vpngate_url)
+                yield from self.parse_server_lines(io.StringIO(cached.data), filter_country_short)
+                return
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+
+            lines = response.iter_lines(decode_unicode=True)
+            if not self.cache:
+                yield from self.parse_server_lines(lines, filter_country_short)
+                return
+
+            # Tee the stream into the cache; the entry is only committed if the download completes.
+            with self.cache.writer(self.vpngate_url, etag=response.headers.get('ETag'),
+                                   last_modified=response.headers.get('Last-Modified')) as cache_file:
+                download_complete = False
+                def teed_lines():
+                    nonlocal download_complete
+                    for line in lines:
+                        cache_file.write(line + '\n')
+                        yield line
+                    download_complete = True
+                try:
+                    yield from self.parse_server_lines(teed_lines(), filter_country_short)
+                except requests.exceptions.RequestException as e:
+                    print(f"Error fetching server data: {e}")
+                if not download_complete:
+                    cache_file.discard()
+
+    def get_catalog(self, refresh=False):
         """
-        Fetches, parses, and optionally filters server data by short country code.
-        Returns a list of server dictionaries.
+        Returns the ServerCatalog built from a single fetch and parse of the server list.
+        The catalog is kept in memory and reused until refresh=True is passed, which fetches the
+        list again and applies it to the same catalog with ServerCatalog.update(), so only changed
+        servers are re-indexed and the catalog's subscribers hear about them.
+        A failed fetch returns an empty catalog that is not kept, so the next call retries.
+        With a cache, each parsed list is also written as a binary snapshot, and a later first
+        call opens that snapshot with mmap instead of reading and parsing the list (or importing
+        requests) while the cached list is fresh, or stale in stale-while-revalidate mode.
         """
-        csv_data = self.fetch_server_data()
-        if not csv_data:
-            return []
+        if self._catalog is not None and not refresh:
+            return self._catalog
 
-        servers = self.parse_server_data(csv_data)
+        if self._catalog is None and not refresh and self.cache:
+            snapshot = self.cache.load_snapshot(self.vpngate_url)
+            if snapshot and (self.cache.is_fresh(snapshot) or self.cache.stale_while_revalidate):
+                if not self.cache.is_fresh(snapshot):
+                    self.refresh_in_background(self.cache.load(self.vpngate_url))
+                self._catalog = ServerCatalog.from_snapshot(snapshot)
+                return self._catalog
+            if snapshot:
+                snapshot.close()
 
-        if filter_country_short:
-            filter_country_short = filter_country_short.lower()
-            servers = [s for s in servers if s.get('CountryShort', '').lower() == filter_country_short]
+        csv_data = self.fetch_server_data()
+        servers = self.parse_server_data(csv_data) if csv_data else []
+        if not servers:
+            return ServerCatalog([])
+
+        if self._catalog is None:
+            self._catalog = ServerCatalog(servers)
+        else:
+            self._catalog.update(servers)
+        if self.cache:
+            self.cache.store_snapshot(self.vpngate_url, self._catalog.servers, csv_data)
+        return self._catalog
 
-        return servers
+    def get_servers(self, filter_country_short=None):
+        """
+        Returns a list of server dictionaries, optionally filtered by short country code.
+        Served from the in-memory catalog; the list is only fetched on first use.
+        """
+        return self.get_catalog().servers_for_country(filter_country_short)
 
     def get_available_countries(self):
         """
-        Gets all servers and returns a sorted list of unique (CountryLong, CountryShort) tuples.
+        Returns a sorted list of unique (CountryLong, CountryShort) tuples.
         """
-        servers = self.get_servers() # Get all servers without filtering first
-        if not servers:
-            return []
+        return self.get_catalog().countries()
+
+
+def _parse_chunk(chunk, config_index):
+    """
+    Worker for parse_server_data_parallel: splits a chunk of list lines into CSV rows, skipping
+    meta lines and rows without config data exactly like parse_server_lines.
+    Returns (rows, spans, number of rows without config data). Each row's config column is
+    replaced by None and spans holds its start and end in chunk (2 entries per row); a row whose
+    config is not found verbatim in its line (e.g. quoted) keeps it, with a span of (-1, -1).
+    """
+    rows = []
+    spans = array('q')
+    no_config = 0
+    line = (0, 0)
+
+    def lines():
+        # Split on '\n' only, as io.StringIO does for the serial parse; csv copes with the '\r' left over.
+        # line is the (start, end) of the line csv.reader is working on (rows never span lines).
+        nonlocal line
+        position = 0
+        while position < len(chunk):
+            end = chunk.find('\n', position)
+            end = len(chunk) if end < 0 else end
+            if end > position and chunk[position] not in '*#\r':
+                line = (position, end)
+                yield chunk[position:end]
+            position = end + 1
+
+    for row in csv.reader(lines()):
+        if len(row) <= config_index or not row[config_index]:
+            no_config += 1
+            continue
+        config = row[config_index]
+        at = chunk.find(config, *line)
+        if at >= 0:
+            row[config_index] = None
+            spans.extend((at, at + len(config)))
+        else:
+            spans.extend((-1, -1))
+        rows.append(row)
+    return rows, spans, no_config
+
+
+def usable_cpu_count():
+    """
+    Returns the number of CPUs this process may run on (its affinity mask, where the OS has one).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def parse_executor(workers=None):
+    """
+    Returns a ProcessPoolExecutor for parse_server_data_parallel, to keep its workers across calls.
+    Workers are started by a fork server where available: forking this process directly would
+    copy its threads' locks (the cache refresh and daemon threads) in whatever state they are in.
+    """
+    import multiprocessing # Only needed for parallel parsing
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
 
-        countries = set()
-        for server in servers:
-            country_long = server.get('CountryLong')
-            country_short = server.get('CountryShort')
-            if country_long and country_short:
-                countries.add((country_long, country_short))
 
-        return sorted(list(countries), key=lambda x: x[0])
+def _close_response(future):
+    try:
+        future.result().close()
+    except Exception:
+        pass
 
 
 if __name__ == '__main__':